@@ -1,207 +1,929 @@
-def read_image(image_filename):
-    """
-    Reads an image from a file.
-
-    :param image_filename: String representing the name of the file.
-    :return: 2D list of integers representing an image.
-    """
-    with open(image_filename, "r") as image_file:
-        image = []
-        for line in image_file:
-            y = []
-            for x_i in line.strip():
-                y.append(int(x_i))
-            image.append(y)
-    return image
-
-
-def linear(x, w, b):
-    """
-    Input: A list of inputs (x), a list of weights (w) and a bias (b).
-    Output: A single number corresponding to the value of f(x) in Equation 1.
-
-    >>> x = [1.0, 3.5]
-    >>> w = [3.8, 1.5]
-    >>> b = -1.7
-    >>> round(linear(x, w, b),6) #linear(x, w, b)
-    7.35
-    """
-
-    return sum(w[j] * x[j] for j in range(len(w))) + b
-
-
-def linear_layer(x, w, b):
-    """
-    Input: A list of inputs (x), a table of weights (w) and a list of
-           biases (b).
-    Output: A list of numbers corresponding to the values of f(x) in
-            Equation 2.
-
-    >>> x = [1.0, 3.5]
-    >>> w = [[3.8, 1.5], [-1.2, 1.1]]
-    >>> b = [-1.7, 2.5]
-    >>> y = linear_layer(x, w, b)
-    >>> [round(y_i,6) for y_i in y] #linear_layer(x, w, b)
-    [7.35, 5.15]
-    """
-
-    return [linear(x, w[i], b[i]) for i in range(len(w))]
-
-
-def relu_layer(x, w, b):
-    """
-    Input: A list of inputs (x), a table of weights (w) and a
-           list of biases (b).
-    Output: A list of numbers corresponding to the values of f(x) in
-            Equation 4.
-
-    >>> x = [1, 0]
-    >>> w = [[2.1, -3.1], [-0.7, 4.1]]
-    >>> b = [-1.1, 4.2]
-    >>> y = relu_layer(x, w, b)
-    >>> [round(y_i,6) for y_i in y] #relu_layer(x, w, b)
-    [1.0, 3.5]
-    >>> x = [0, 1]
-    >>> y = relu_layer(x, w, b)
-    >>> [round(y_i,6) for y_i in y] #relu_layer(x, w, b)
-    [0.0, 8.3]
-    """
-
-    return [max(linear(x, w[i], b[i]), 0.0) for i in range(len(w))]
-
-
-def inference(x, w, b):
-    """
-    Input: A list of inputs (x), a list of tables of weights (w) and a table
-           of biases (b).
-    Output: A list of numbers corresponding to output of the ANN.
-
-    >>> x = [1, 0]
-    >>> w = [[[2.1, -3.1], [-0.7, 4.1]], [[3.8, 1.5], [-1.2, 1.1]]]
-    >>> b = [[-1.1, 4.2], [-1.7, 2.5]]
-    >>> y = inference(x, w, b)
-    >>> [round(y_i,6) for y_i in y] #inference(x, w, b)
-    [7.35, 5.15]
-    """
-
-    num_layers = len(w)
-
-    for l in range(num_layers - 1):
-        x = relu_layer(x, w[l], b[l])
-
-    return linear_layer(x, w[num_layers - 1], b[num_layers - 1])
-
-
-def read_weights(file_name):
-    """
-    Input: A string (file_name) that corresponds to the name of the file
-           that contains the weights of the ANN.
-    Output: A list of tables of numbers corresponding to the weights of
-            the ANN.
-
-    >>> w_example = read_weights('example_weights.txt')
-    >>> w_example
-    [[[2.1, -3.1], [-0.7, 4.1]], [[3.8, 1.5], [-1.2, 1.1]]]
-    >>> w = read_weights('weights.txt')
-    >>> len(w)
-    3
-    >>> len(w[2])
-    10
-    >>> len(w[2][0])
-    16
-    """
-
-    # weights_file = open(file_name,"r")
-    # w = []
-    # for line in weights_file:
-    #     if "#" == line[0]:
-    #         w.append([])
-    #     else:
-    #         w[-1].append([float(w_ij) for w_ij in line.strip().split(",")])
-
-    # return w
-
-    with open(file_name, "r") as weights_file:
-        w = []
-        for line in weights_file:
-            if "#" == line[0]:
-                w.append([])
-            else:
-                w[-1].append([float(w_ij) for w_ij in line.strip().split(",")])
-    return w
-
-
-def read_biases(file_name):
-    """
-    Input: A string (file_name), that corresponds to the name of the file
-           that contains the biases of the ANN.
-    Output: A table of numbers corresponding to the biases of the ANN.
-
-    >>> b_example = read_biases('example_biases.txt')
-    >>> b_example
-    [[-1.1, 4.2], [-1.7, 2.5]]
-    >>> b = read_biases('biases.txt')
-    >>> len(b)
-    3
-    >>> len(b[0])
-    16
-    """
-
-    # biases_file = open(file_name,"r")
-    # b = []
-    # for line in biases_file:
-    #     if not "#" == line[0]:
-    #         b.append([float(b_j) for b_j in line.strip().split(",")])
-
-    # return b
-
-    with open(file_name, "r") as biases_file:
-        b = []
-        for line in biases_file:
-            if not "#" == line[0]:
-                b.append([float(b_j) for b_j in line.strip().split(",")])
-
-    return b
-
-
-def argmax(x):
-    """
-    Input: A list of numbers (i.e., x) that can represent the scores
-           computed by the ANN.
-    Output: A number representing the index of an element with the maximum
-            value, the function should return the minimum index.
-
-    >>> x = [1.3, -1.52, 3.9, 0.1, 3.9]
-    >>> argmax(x)
-    2
-    """
-
-    num_inputs = len(x)
-    max_index = 0
-
-    for i in range(1, num_inputs):
-        if x[max_index] < x[i]:
-            max_index = i
-
-    return max_index
-
-
-def predict_number(image):
-    """
-    Input: A list of lists of numbers (i.e., image) that corresponds to the image.
-    Output: The number predicted in the image by the ANN.
-
-    >>> i = predict_number(image)
-    >>> print('The image is number ' + str(i))
-    The image is number 4
-    """
-    x = []
-    for row in image:
-        for element in row:
-            x.append(element)
-
-    w = read_weights("./weights.txt")
-    b = read_biases("./biases.txt")
-
-    y = inference(x, w, b)
-    return argmax(y)
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+from itertools import compress, islice
+from operator import add, mul, sub
+
+
+def read_image(image_filename):
+    """
+    Reads an image from a file.
+
+    :param image_filename: String representing the name of the file.
+    :return: 2D list of integers representing an image.
+    """
+    with open(image_filename, "r") as image_file:
+        image = []
+        for line in image_file:
+            y = []
+            for x_i in line.strip():
+                y.append(int(x_i))
+            image.append(y)
+    return image
+
+
+def linear(x, w, b):
+    """
+    Input: A list of inputs (x), a list of weights (w) and a bias (b).
+    Output: A single number corresponding to the value of f(x) in Equation 1.
+
+    >>> x = [1.0, 3.5]
+    >>> w = [3.8, 1.5]
+    >>> b = -1.7
+    >>> round(linear(x, w, b),6) #linear(x, w, b)
+    7.35
+    """
+
+    return sum(w[j] * x[j] for j in range(len(w))) + b
+
+
+def linear_layer(x, w, b):
+    """
+    Input: A list of inputs (x), a table of weights (w) and a list of
+           biases (b).
+    Output: A list of numbers corresponding to the values of f(x) in
+            Equation 2.
+
+    >>> x = [1.0, 3.5]
+    >>> w = [[3.8, 1.5], [-1.2, 1.1]]
+    >>> b = [-1.7, 2.5]
+    >>> y = linear_layer(x, w, b)
+    >>> [round(y_i,6) for y_i in y] #linear_layer(x, w, b)
+    [7.35, 5.15]
+    """
+
+    return [linear(x, w[i], b[i]) for i in range(len(w))]
+
+
+def relu_layer(x, w, b):
+    """
+    Input: A list of inputs (x), a table of weights (w) and a
+           list of biases (b).
+    Output: A list of numbers corresponding to the values of f(x) in
+            Equation 4.
+
+    >>> x = [1, 0]
+    >>> w = [[2.1, -3.1], [-0.7, 4.1]]
+    >>> b = [-1.1, 4.2]
+    >>> y = relu_layer(x, w, b)
+    >>> [round(y_i,6) for y_i in y] #relu_layer(x, w, b)
+    [1.0, 3.5]
+    >>> x = [0, 1]
+    >>> y = relu_layer(x, w, b)
+    >>> [round(y_i,6) for y_i in y] #relu_layer(x, w, b)
+    [0.0, 8.3]
+    """
+
+    return [max(linear(x, w[i], b[i]), 0.0) for i in range(len(w))]
+
+
+def inference(x, w, b):
+    """
+    Input: A list of inputs (x), a list of tables of weights (w) and a table
+           of biases (b).
+    Output: A list of numbers corresponding to output of the ANN.
+
+    >>> x = [1, 0]
+    >>> w = [[[2.1, -3.1], [-0.7, 4.1]], [[3.8, 1.5], [-1.2, 1.1]]]
+    >>> b = [[-1.1, 4.2], [-1.7, 2.5]]
+    >>> y = inference(x, w, b)
+    >>> [round(y_i,6) for y_i in y] #inference(x, w, b)
+    [7.35, 5.15]
+    """
+
+    num_layers = len(w)
+
+    for l in range(num_layers - 1):
+        x = relu_layer(x, w[l], b[l])
+
+    return linear_layer(x, w[num_layers - 1], b[num_layers - 1])
+
+
+def fast_inference(x, layers):
+    """
+    Input: A list of inputs (x) and a list of layers (layers), each layer a
+           pair of a tuple of weight rows and a tuple of biases.
+    Output: A list of numbers corresponding to output of the ANN.
+
+    This computes the same forward pass as inference, in the same order of
+    additions, so the outputs are identical; each dot product is a single
+    sum(map(mul, ...)) over a row instead of a generator indexing both lists.
+
+    >>> x = [1, 0]
+    >>> layers = [(((2.1, -3.1), (-0.7, 4.1)), (-1.1, 4.2)),
+    ...           (((3.8, 1.5), (-1.2, 1.1)), (-1.7, 2.5))]
+    >>> y = fast_inference(x, layers)
+    >>> [round(y_i,6) for y_i in y] #fast_inference(x, layers)
+    [7.35, 5.15]
+    """
+
+    # zip and map stop at the shorter sequence, so a wrong size would not fail on its own
+    if layers and layers[0][0] and len(x) != len(layers[0][0][0]):
+        raise ValueError(f"the input has {len(x)} values, the network takes {len(layers[0][0][0])}")
+    for rows, biases in layers[:-1]:
+        x = [max(sum(map(mul, row, x)) + bias, 0.0) for row, bias in zip(rows, biases)]
+
+    rows, biases = layers[-1]
+    return [sum(map(mul, row, x)) + bias for row, bias in zip(rows, biases)]
+
+
+def batch_inference(xs, layers):
+    """
+    Input: A list of input lists (xs) and a list of layers (layers), as in
+           fast_inference.
+    Output: A list with the output of the ANN for every input, equal to
+            [fast_inference(x, layers) for x in xs].
+
+    The batch goes through the network one layer at a time, so each layer is
+    applied to the whole batch (a matrix-matrix product) before the next
+    layer is touched.
+
+    >>> xs = [[1, 0], [0, 1]]
+    >>> layers = [(((2.1, -3.1), (-0.7, 4.1)), (-1.1, 4.2)),
+    ...           (((3.8, 1.5), (-1.2, 1.1)), (-1.7, 2.5))]
+    >>> ys = batch_inference(xs, layers)
+    >>> [[round(y_i,6) for y_i in y] for y in ys] #batch_inference(xs, layers)
+    [[7.35, 5.15], [10.75, 11.63]]
+    """
+
+    for rows, biases in layers[:-1]:
+        xs = [
+            [max(sum(map(mul, row, x)) + bias, 0.0) for row, bias in zip(rows, biases)]
+            for x in xs
+        ]
+
+    rows, biases = layers[-1]
+    return [[sum(map(mul, row, x)) + bias for row, bias in zip(rows, biases)] for x in xs]
+
+
+def sparse_linear_layer(x, columns, biases):
+    """
+    Input: A list of inputs (x), the weights of a linear layer transposed to
+           one tuple per input (columns) and a tuple of biases (biases).
+    Output: A list with the output of the layer, equal to
+            [sum(map(mul, row, x)) + bias for row, bias in zip(rows, biases)].
+
+    Only the columns of the non-zero inputs are gathered and added up, in the
+    order of the inputs. The skipped products are all zeros, which leave a
+    sum unchanged, so the output is identical to the dense one; for binary
+    inputs the products are the weights themselves and are not computed.
+
+    >>> x = [1, 0, 0, 2]
+    >>> columns = ((2.1, -0.7), (-3.1, 4.1), (0.5, 0.5), (1.0, -1.5))
+    >>> y = sparse_linear_layer(x, columns, (-1.1, 4.2))
+    >>> [round(y_i,6) for y_i in y] #sparse_linear_layer(x, columns, biases)
+    [3.0, 0.5]
+    """
+    if len(x) != len(columns):
+        raise ValueError(f"the input has {len(x)} values, the layer takes {len(columns)}")
+    active = list(compress(range(len(x)), x))
+    if not active:
+        return [0 + bias for bias in biases]
+
+    gathered = zip(*[columns[i] for i in active])
+    values = [x[i] for i in active]
+    if values.count(1) == len(values):
+        return [sum(weights) + bias for weights, bias in zip(gathered, biases)]
+    return [sum(map(mul, weights, values)) + bias for weights, bias in zip(gathered, biases)]
+
+
+# number of times weights were loaded from disk, by read_weights or
+# read_binary_model, in this process
+weight_loads = 0
+
+
+def read_weights(file_name):
+    """
+    Input: A string (file_name) that corresponds to the name of the file
+           that contains the weights of the ANN.
+    Output: A list of tables of numbers corresponding to the weights of
+            the ANN.
+
+    >>> w_example = read_weights('example_weights.txt')
+    >>> w_example
+    [[[2.1, -3.1], [-0.7, 4.1]], [[3.8, 1.5], [-1.2, 1.1]]]
+    >>> w = read_weights('weights.txt')
+    >>> len(w)
+    3
+    >>> len(w[2])
+    10
+    >>> len(w[2][0])
+    16
+    """
+
+    # weights_file = open(file_name,"r")
+    # w = []
+    # for line in weights_file:
+    #     if "#" == line[0]:
+    #         w.append([])
+    #     else:
+    #         w[-1].append([float(w_ij) for w_ij in line.strip().split(",")])
+
+    # return w
+
+    global weight_loads
+    weight_loads += 1
+
+    with open(file_name, "r") as weights_file:
+        w = []
+        for line in weights_file:
+            if "#" == line[0]:
+                w.append([])
+            else:
+                w[-1].append([float(w_ij) for w_ij in line.strip().split(",")])
+    return w
+
+
+def read_biases(file_name):
+    """
+    Input: A string (file_name), that corresponds to the name of the file
+           that contains the biases of the ANN.
+    Output: A table of numbers corresponding to the biases of the ANN.
+
+    >>> b_example = read_biases('example_biases.txt')
+    >>> b_example
+    [[-1.1, 4.2], [-1.7, 2.5]]
+    >>> b = read_biases('biases.txt')
+    >>> len(b)
+    3
+    >>> len(b[0])
+    16
+    """
+
+    # biases_file = open(file_name,"r")
+    # b = []
+    # for line in biases_file:
+    #     if not "#" == line[0]:
+    #         b.append([float(b_j) for b_j in line.strip().split(",")])
+
+    # return b
+
+    with open(file_name, "r") as biases_file:
+        b = []
+        for line in biases_file:
+            if not "#" == line[0]:
+                b.append([float(b_j) for b_j in line.strip().split(",")])
+
+    return b
+
+
+def argmax(x):
+    """
+    Input: A list of numbers (i.e., x) that can represent the scores
+           computed by the ANN.
+    Output: A number representing the index of an element with the maximum
+            value, the function should return the minimum index.
+
+    >>> x = [1.3, -1.52, 3.9, 0.1, 3.9]
+    >>> argmax(x)
+    2
+    """
+
+    num_inputs = len(x)
+    max_index = 0
+
+    for i in range(1, num_inputs):
+        if x[max_index] < x[i]:
+            max_index = i
+
+    return max_index
+
+
+# scores closer than this may be ordered differently by the rounding of the
+# incremental first layer, see Model.predict_flipped
+_TIE_TOLERANCE = 1e-9
+
+
+def _is_near_tie(y):
+    if len(y) < 2:
+        return False
+    second, first = sorted(y)[-2:]
+    return first - second < _TIE_TOLERANCE
+
+
+# the first layer of a Model gathers only the weight columns of the non-zero
+# inputs when at most this fraction of the inputs is non-zero, as in the
+# binary digits, where only about a tenth of the pixels are set
+SPARSE_FRACTION = 0.5
+
+
+def _frozen(values):
+    # memoryviews are kept as they are, so views into a mapped file are not
+    # copied, and any other sequence is frozen into a tuple
+    return values if isinstance(values, memoryview) else tuple(values)
+
+
+class Model:
+    """
+    The weights and biases of the ANN, read once and kept in memory so they
+    can be reused across many predictions.
+    """
+
+    def __init__(self, weights, biases, columns=None):
+        """
+        Input: A list of tables of weights (weights) and a table of biases
+               (biases), in the layout returned by read_weights and
+               read_biases, and optionally the first layer's weights
+               transposed to one sequence per input (columns).
+        """
+        self.weights = weights
+        self.biases = biases
+        # the binary model file the weights are mapped from, if any
+        self.binary_file = None
+        # the same numbers frozen into tuples, which is the layout
+        # fast_inference iterates over the quickest; rows that are views into
+        # a mapped file are used as they are
+        self.layers = tuple(
+            (tuple(_frozen(row) for row in w_l), _frozen(b_l))
+            for w_l, b_l in zip(weights, biases)
+        )
+        # the first layer's weights transposed to one tuple per input, so the
+        # effect of flipping a single input is one column to add or subtract
+        if columns is None:
+            columns = zip(*self.layers[0][0])
+        self.columns = tuple(_frozen(column) for column in columns)
+        # computed by fingerprint when first needed
+        self._fingerprint = None
+        # the weights after the first layer split into their positive and
+        # their negative parts, for carrying bounds through them in
+        # output_bounds
+        self.signed_layers = tuple(
+            (
+                tuple(tuple(max(w, 0.0) for w in row) for row in rows),
+                tuple(tuple(min(w, 0.0) for w in row) for row in rows),
+                biases,
+            )
+            for rows, biases in self.layers[1:]
+        )
+
+    def __reduce__(self):
+        # only the weights and biases are pickled, the other layouts are
+        # derived again; a model mapped from a binary file is mapped again
+        # from the same file, so worker processes share its pages
+        if self.binary_file is not None:
+            return read_binary_model, (self.binary_file,)
+        return Model, (
+            [[list(row) for row in w_l] for w_l in self.weights],
+            [list(b_l) for b_l in self.biases],
+        )
+
+    @classmethod
+    def from_files(cls, weights_file, biases_file):
+        """
+        Input: The names of the weights file (weights_file) and of the biases
+               file (biases_file).
+        Output: A Model holding the parsed weights and biases.
+        """
+        return cls(read_weights(weights_file), read_biases(biases_file))
+
+    def inference(self, x):
+        """
+        Input: A list of inputs (x).
+        Output: A list of numbers corresponding to output of the ANN, equal to
+                inference(x, self.weights, self.biases).
+        """
+        return self.tail_inference(self.first_layer(x))
+
+    def inference_batch(self, xs):
+        """
+        Input: A list of input lists (xs).
+        Output: A list with the output of the ANN for every input.
+        """
+        if len(self.layers) == 1:
+            return [self.first_layer(x) for x in xs]
+        pre_activations = [self.first_layer(x) for x in xs]
+        return batch_inference([[max(p, 0.0) for p in pre] for pre in pre_activations], self.layers[1:])
+
+    def first_layer(self, x):
+        """
+        Input: A list of inputs (x).
+        Output: A list with the pre-activations of the first layer for x,
+                i.e. its values before the ReLU.
+
+        Sparse inputs, like the binary digits, go through
+        sparse_linear_layer with the columns of the first layer, which only
+        touches the weights of the non-zero inputs and gives the same
+        numbers as the dense dot products. An input of another length than
+        the first layer's raises a ValueError.
+        """
+        if len(x) != len(self.columns):
+            raise ValueError(f"the input has {len(x)} values, the model takes {len(self.columns)}")
+        rows, biases = self.layers[0]
+        if len(x) - x.count(0) <= SPARSE_FRACTION * len(x):
+            return sparse_linear_layer(x, self.columns, biases)
+        return [sum(map(mul, row, x)) + bias for row, bias in zip(rows, biases)]
+
+    def flip_first_layer(self, x, pre_activations, flipped):
+        """
+        Input: A list of binary inputs (x), the first layer pre-activations of
+               x (pre_activations) and the indices of the inputs to flip
+               (flipped).
+        Output: A list with the pre-activations of the first layer for x with
+                those inputs flipped, found by adding (0 to 1) or subtracting
+                (1 to 0) the weight column of each flipped input.
+        """
+        columns = self.columns
+        for i in flipped:
+            pre_activations = list(
+                map(sub if x[i] else add, pre_activations, columns[i])
+            )
+        return list(pre_activations)
+
+    def tail_inference(self, pre_activations):
+        """
+        Input: A list with the pre-activations of the first layer
+               (pre_activations).
+        Output: A list of numbers corresponding to output of the ANN.
+        """
+        if len(self.layers) == 1:
+            return list(pre_activations)
+        return fast_inference([max(p, 0.0) for p in pre_activations], self.layers[1:])
+
+    def predict_flipped(self, x, flipped_sets):
+        """
+        Input: A list of binary inputs (x) and an iterable of collections of
+               indices (flipped_sets), each describing a copy of x with those
+               inputs flipped.
+        Output: A list with the number predicted by the ANN for each copy.
+
+        The first layer is computed once for x; every copy then only costs
+        one column per flipped input plus the small tail of the network.
+        """
+        return list(self.iter_predict_flipped(x, flipped_sets))
+
+    def iter_predict_flipped(self, x, flipped_sets):
+        """
+        Input: A list of binary inputs (x) and an iterable of collections of
+               indices (flipped_sets), as in predict_flipped.
+        Output: A generator yielding the number predicted by the ANN for each
+                copy, one at a time as flipped_sets is consumed.
+        """
+        pre_activations = self.first_layer(x)
+        for flipped in flipped_sets:
+            yield self.predict_first_layer(
+                x, self.flip_first_layer(x, pre_activations, flipped), flipped
+            )
+
+    def predict_first_layer(self, x, pre_activations, flipped):
+        """
+        Input: A list of binary inputs (x), the first layer pre-activations of
+               x with some inputs flipped (pre_activations), computed
+               incrementally, and the indices of those inputs (flipped).
+        Output: The number predicted by the ANN for x with the inputs flipped.
+        """
+        return argmax(self.logits_first_layer(x, pre_activations, flipped))
+
+    def logits_first_layer(self, x, pre_activations, flipped):
+        """
+        Input: The same as predict_first_layer.
+        Output: A list of numbers corresponding to output of the ANN for x
+                with the inputs flipped, whose argmax is the predicted number.
+        """
+        y = self.tail_inference(pre_activations)
+        if _is_near_tie(y):
+            # the delta sums are rounded differently from a full pass, so
+            # settle scores this close with the exact forward pass
+            flipped_x = list(x)
+            for i in flipped:
+                flipped_x[i] = 1 - flipped_x[i]
+            y = self.inference(flipped_x)
+        return y
+
+    def output_bounds(self, lower, upper):
+        """
+        Input: Lists with a lower (lower) and an upper (upper) bound for each
+               pre-activation of the first layer.
+        Output: A pair of lists with a lower and an upper bound for each
+                output of the ANN, valid for any pre-activations within the
+                given bounds.
+
+        The bounds are carried through the network as intervals: the ReLU
+        clips both ends, and a linear layer takes the lower bound of a
+        positive weight's input for its own lower bound and the upper bound
+        of a negative weight's input.
+        """
+        if len(self.layers) == 1:
+            return list(lower), list(upper)
+
+        for positive_rows, negative_rows, biases in self.signed_layers:
+            lower = [max(v, 0.0) for v in lower]
+            upper = [max(v, 0.0) for v in upper]
+            lower, upper = (
+                [
+                    sum(map(mul, positive, lower)) + sum(map(mul, negative, upper)) + bias
+                    for positive, negative, bias in zip(positive_rows, negative_rows, biases)
+                ],
+                [
+                    sum(map(mul, positive, upper)) + sum(map(mul, negative, lower)) + bias
+                    for positive, negative, bias in zip(positive_rows, negative_rows, biases)
+                ],
+            )
+        return lower, upper
+
+    def can_predict(self, number, lower, upper):
+        """
+        Input: A number (number) and lists with a lower (lower) and an upper
+               (upper) bound for each pre-activation of the first layer.
+        Output: False when no pre-activations within the bounds can make the
+                ANN predict the number, True when they might.
+        """
+        output_lower, output_upper = self.output_bounds(lower, upper)
+        # some other number always scores higher, by more than rounding could explain
+        return not any(
+            output_lower[k] - output_upper[number] > _TIE_TOLERANCE
+            for k in range(len(output_lower))
+            if k != number
+        )
+
+    def predict(self, image):
+        """
+        Input: A list of lists of numbers (i.e., image) that corresponds to
+               the image.
+        Output: The number predicted in the image by the ANN.
+        """
+        x = [element for row in image for element in row]
+        return argmax(self.inference(x))
+
+    def fingerprint(self):
+        """
+        Input: None.
+        Output: A string of hex digits identifying the weights and biases;
+                models holding the same numbers have the same fingerprint,
+                and changing any number changes it.
+        """
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            for rows, biases in self.layers:
+                digest.update(struct.pack("<II", len(rows), len(biases)))
+                for row in rows:
+                    digest.update(struct.pack(f"<{len(row)}d", *row))
+                digest.update(struct.pack(f"<{len(biases)}d", *biases))
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+
+# weights and biases are multiplied by this and rounded to integers, which is
+# exact for numbers with two decimals like those of weights.txt and biases.txt
+QUANTIZATION_SCALE = 100
+
+
+def _smallest_typecode(values):
+    """
+    Input: A list of integers (values).
+    Output: The typecode of the smallest signed array type holding them all.
+
+    >>> _smallest_typecode([-115, 106]), _smallest_typecode([300])
+    ('b', 'h')
+    """
+    low = min(values, default=0)
+    high = max(values, default=0)
+    for typecode in "bhiq":
+        limit = 1 << (8 * array(typecode).itemsize - 1)
+        if -limit <= low and high < limit:
+            return typecode
+    raise OverflowError("the quantized numbers do not fit in 64 bits")
+
+
+class QuantizedModel:
+    """
+    The ANN of a Model with its weights and biases scaled to integers, for
+    inputs of 0s and 1s only.
+
+    The first layer of an input is the sum of the weight columns of its 1s,
+    and the layers after it run in fixed point: the outputs of layer l are
+    scale ** l times those of the ANN. When every weight and bias is a
+    multiple of 1 / scale, nothing is rounded anywhere, so the outputs are
+    those of the ANN in exact arithmetic and need no tie-breaking by the
+    exact forward pass like Model.predict_first_layer.
+    """
+
+    def __init__(self, model, scale=QUANTIZATION_SCALE):
+        """
+        Input: A Model (model) and the factor its weights and biases are
+               multiplied by before rounding (scale).
+        """
+        self.scale = scale
+        # whether rounding changed any number by more than float noise
+        self.exact = all(
+            abs(value * scale - round(value * scale)) < 1e-6
+            for rows, biases in model.layers
+            for values in (*rows, biases)
+            for value in values
+        )
+        # the quantized weights and biases of every layer, packed into the
+        # smallest integer arrays that hold them, e.g. int8 for weights.txt
+        self.packed = []
+        for rows, biases in model.layers:
+            weights = [round(w * scale) for row in rows for w in row]
+            quantized_biases = [round(b * scale) for b in biases]
+            self.packed.append(
+                (
+                    array(_smallest_typecode(weights), weights),
+                    array(_smallest_typecode(quantized_biases), quantized_biases),
+                    len(rows),
+                )
+            )
+        # the same numbers frozen into tuples of rows for computing, with the
+        # bias of each layer scaled once more for every layer before it, so it
+        # lines up with the scale of that layer's sums
+        layers = []
+        for l, (weights, biases, num_rows) in enumerate(self.packed):
+            num_cols = len(weights) // num_rows
+            rows = tuple(tuple(weights[r * num_cols : (r + 1) * num_cols]) for r in range(num_rows))
+            layers.append((rows, tuple(b * scale**l for b in biases)))
+        self.layers = tuple(layers)
+        # the first layer's weights transposed to one tuple per input
+        self.columns = tuple(zip(*self.layers[0][0]))
+        # the outputs are the outputs of the ANN times this
+        self.output_scale = scale ** len(self.layers)
+        self._fingerprint = None
+
+    @property
+    def nbytes(self):
+        """
+        Output: The number of bytes taken by the packed weights and biases.
+        """
+        return sum(
+            weights.itemsize * len(weights) + biases.itemsize * len(biases)
+            for weights, biases, _ in self.packed
+        )
+
+    def first_layer(self, x):
+        """
+        Input: A list of binary inputs (x).
+        Output: A list with the pre-activations of the first layer for x,
+                found by adding up the weight column of every input that is 1.
+                An input of another length than the first layer's raises a
+                ValueError.
+        """
+        if len(x) != len(self.columns):
+            raise ValueError(f"the input has {len(x)} values, the model takes {len(self.columns)}")
+        return sparse_linear_layer(x, self.columns, self.layers[0][1])
+
+    def tail_inference(self, pre_activations):
+        """
+        Input: A list with the pre-activations of the first layer
+               (pre_activations).
+        Output: A list of integers corresponding to output of the ANN times
+                output_scale.
+        """
+        h = pre_activations
+        for rows, biases in self.layers[1:]:
+            h = [max(v, 0) for v in h]
+            h = [sum(map(mul, row, h)) + bias for row, bias in zip(rows, biases)]
+        return list(h)
+
+    def inference(self, x):
+        """
+        Input: A list of binary inputs (x).
+        Output: A list of integers corresponding to output of the ANN times
+                output_scale.
+        """
+        return self.tail_inference(self.first_layer(x))
+
+    def inference_batch(self, xs):
+        """
+        Input: A list of binary input lists (xs).
+        Output: A list with the output of inference for every input.
+        """
+        return [self.inference(x) for x in xs]
+
+    def logits_first_layer(self, x, pre_activations, flipped):
+        """
+        Input: The same as Model.logits_first_layer.
+        Output: A list of integers corresponding to output of the ANN times
+                output_scale, for x with the inputs flipped.
+        """
+        return self.tail_inference(pre_activations)
+
+    def predict_first_layer(self, x, pre_activations, flipped):
+        """
+        Input: The same as Model.predict_first_layer.
+        Output: The number predicted by the ANN for x with the inputs flipped.
+        """
+        return argmax(self.tail_inference(pre_activations))
+
+    def predict(self, image):
+        """
+        Input: A list of lists of binary numbers (i.e., image).
+        Output: The number predicted in the image by the ANN.
+        """
+        return argmax(self.inference([element for row in image for element in row]))
+
+    def fingerprint(self):
+        """
+        Output: A string of hex digits identifying the quantized weights and
+                biases, which never equals the fingerprint of a Model.
+        """
+        if self._fingerprint is None:
+            digest = hashlib.sha256(b"quantized %d" % self.scale)
+            for weights, biases, num_rows in self.packed:
+                digest.update(struct.pack("<I", num_rows))
+                digest.update(struct.pack(f"<{len(weights)}q", *weights))
+                digest.update(struct.pack(f"<{len(biases)}q", *biases))
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    # flipping inputs and predicting many flipped copies work the same as for
+    # a Model, on the integer columns and with the integer tail
+    flip_first_layer = Model.flip_first_layer
+    predict_flipped = Model.predict_flipped
+    iter_predict_flipped = Model.iter_predict_flipped
+
+
+# layout of a binary model file: the magic bytes, the format version and the
+# number of layers, the rows and columns of every layer, padding up to a
+# multiple of 8 bytes, then for every layer its weights row by row followed by
+# its biases, and then the weights of the first layer column by column, all as
+# little-endian float64; files of version 1 end before the columns
+_BINARY_MAGIC = b"GAIM"
+_BINARY_VERSION = 2
+
+
+def write_binary_model(model, file_name):
+    """
+    Input: A Model (model) and the name of the file to write it to
+           (file_name).
+    Output: None. The file holds the model in the binary model format, which
+            read_binary_model maps back without parsing any text.
+    """
+    header = struct.pack("<4sII", _BINARY_MAGIC, _BINARY_VERSION, len(model.weights))
+    for w_l in model.weights:
+        header += struct.pack("<II", len(w_l), len(w_l[0]))
+    header += bytes(-len(header) % 8)
+
+    with open(file_name, "wb") as model_file:
+        model_file.write(header)
+        for w_l, b_l in zip(model.weights, model.biases):
+            values = array("d", [w_ij for row in w_l for w_ij in row])
+            values.extend(b_l)
+            if sys.byteorder != "little":
+                values.byteswap()
+            model_file.write(values.tobytes())
+        values = array("d", [w_ij for column in model.columns for w_ij in column])
+        if sys.byteorder != "little":
+            values.byteswap()
+        model_file.write(values.tobytes())
+
+
+def convert_model(weights_file, biases_file, model_file):
+    """
+    Input: The names of a weights file (weights_file) and of a biases file
+           (biases_file) in the text format, and the name of the binary model
+           file to create (model_file).
+    Output: None.
+    """
+    write_binary_model(Model.from_files(weights_file, biases_file), model_file)
+
+
+def read_binary_model(file_name):
+    """
+    Input: A string (file_name) that corresponds to the name of a file in the
+           binary model format.
+    Output: A Model whose weights, biases and first layer columns are
+            read-only views into the memory-mapped file, so nothing is parsed
+            or copied to read them and every process mapping the file shares
+            the same pages. Only the positive and negative parts of the
+            layers after the first, a few hundred numbers, are copied.
+    """
+    global weight_loads
+    weight_loads += 1
+
+    with open(file_name, "rb") as model_file:
+        buffer = mmap.mmap(model_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, num_layers = struct.unpack_from("<4sII", buffer, 0)
+    if magic != _BINARY_MAGIC or version not in (1, _BINARY_VERSION):
+        raise ValueError(f"{file_name} is not a binary model file of version {_BINARY_VERSION}")
+    shapes = [struct.unpack_from("<II", buffer, 12 + 8 * l) for l in range(num_layers)]
+    offset = 12 + 8 * num_layers
+    offset += -offset % 8
+
+    values = memoryview(buffer)[offset:].cast("d")
+    if sys.byteorder != "little":
+        # the file is little-endian, so on other machines it has to be copied
+        values = array("d", values)
+        values.byteswap()
+
+    weights = []
+    biases = []
+    position = 0
+    for rows, cols in shapes:
+        weights.append(
+            [values[position + r * cols : position + (r + 1) * cols] for r in range(rows)]
+        )
+        position += rows * cols
+        biases.append(values[position : position + rows])
+        position += rows
+
+    columns = None
+    if version >= 2:
+        rows, cols = shapes[0]
+        columns = [values[position + c * rows : position + (c + 1) * rows] for c in range(cols)]
+
+    model = Model(weights, biases, columns)
+    model.binary_file = os.path.abspath(file_name)
+    return model
+
+
+# models loaded by load_model, keyed by the absolute paths of the weights and
+# biases files; each entry also remembers the files' mtimes so that an edited
+# file is re-read instead of served stale
+_model_cache = {}
+
+
+def _file_signature(file_name):
+    stat = os.stat(file_name)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_model(weights_file="./weights.txt", biases_file="./biases.txt"):
+    """
+    Input: The names of the weights file (weights_file) and of the biases file
+           (biases_file).
+    Output: A Model for those files. The model is parsed on the first call
+            and then shared by every later call for the same files, until
+            either file is modified on disk.
+
+    >>> load_model() is load_model()
+    True
+    """
+    key = (os.path.abspath(weights_file), os.path.abspath(biases_file))
+    signature = (_file_signature(weights_file), _file_signature(biases_file))
+
+    cached = _model_cache.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    model = Model.from_files(weights_file, biases_file)
+    _model_cache[key] = (signature, model)
+    return model
+
+
+def predict_number(image, model=None):
+    """
+    Input: A list of lists of numbers (i.e., image) that corresponds to the
+           image, and optionally a preloaded Model (model). Without a model,
+           the cached model for ./weights.txt and ./biases.txt is used.
+    Output: The number predicted in the image by the ANN.
+
+    >>> i = predict_number(image)
+    >>> print('The image is number ' + str(i))
+    The image is number 4
+    """
+    if model is None:
+        model = load_model()
+
+    return model.predict(image)
+
+
+def predict_numbers(images, model=None, chunk_size=1024):
+    """
+    Input: An iterable of images (images), each a list of lists of numbers,
+           optionally a preloaded Model (model) and the number of images
+           classified per batch (chunk_size).
+    Output: A list with the number predicted in each image by the ANN, in the
+            same order as the images.
+
+    Images are consumed chunk_size at a time, so only one chunk of flattened
+    images and activations is held in memory, however many images there are;
+    a generator of images is never materialized as a whole.
+
+    >>> predict_numbers([image, image])
+    [4, 4]
+    """
+    if model is None:
+        model = load_model()
+
+    images = iter(images)
+    numbers = []
+    while True:
+        chunk = [
+            [element for row in image for element in row]
+            for image in islice(images, chunk_size)
+        ]
+        if not chunk:
+            return numbers
+        numbers.extend(argmax(y) for y in model.inference_batch(chunk))
+
+
+def predict_flipped(image, flipped_sets, model=None):
+    """
+    Input: A list of lists of binary numbers (i.e., image), an iterable of
+           collections of flat pixel indices (flipped_sets) and optionally a
+           preloaded Model (model).
+    Output: A list with the number predicted by the ANN for each copy of the
+            image that has the pixels of one collection flipped, equal to
+            calling predict_number on each flipped copy.
+
+    >>> predict_flipped(image, [[], [0]])
+    [4, 4]
+    """
+    if model is None:
+        model = load_model()
+
+    x = [element for row in image for element in row]
+    return model.predict_flipped(x, flipped_sets)
@@ -0,0 +1,273 @@
+from __future__ import annotations
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from ai import Model, QuantizedModel, inference, load_model, predict_number, read_biases, read_image, read_weights
+from generative import (
+    count_new_images,
+    flatten_image,
+    generate_new_images,
+    iter_flipped_images,
+    iter_new_images,
+    pixel_flip,
+)
+
+IMAGE_FILES = ["image.txt", "another_image.txt", "confusing_image.txt"]
+
+
+def measure(function: Callable[[], object], repeat: int = 1, memory: bool = True) -> dict:
+    """
+    Times a function and measures its memory use.
+
+    The function is first timed `repeat` times without tracing, keeping the fastest run, and then run once more under
+    tracemalloc, which slows it down several times, for its peak memory.
+
+    :param function: Function without arguments to measure.
+    :param repeat: Integer representing the number of timed runs.
+    :param memory: Boolean, when False the traced run is skipped and the memory figures are None.
+    :return: Dictionary with the fastest time in seconds, the peak memory in bytes and the number of memory blocks
+             still allocated for what the function returned.
+    """
+    seconds = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    if not memory:
+        return {"seconds": seconds, "peak_bytes": None, "allocated_blocks": None}
+
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    result = function()
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    allocated_blocks = sys.getallocatedblocks() - blocks_before
+    del result
+
+    return {"seconds": seconds, "peak_bytes": peak_bytes, "allocated_blocks": allocated_blocks}
+
+
+def _pixel_flip(flat_image: list[int], budget: int) -> list[list[int]]:
+    results = []
+    pixel_flip(flat_image, flat_image, budget, results)
+    return results
+
+
+def run_benchmarks(
+    image_files: list[str], budgets: list[int], repeat: int = 3, max_candidates: int = 20000
+) -> list[dict]:
+    """
+    Runs every benchmark on every image and budget.
+
+    Benchmarks that hold every candidate in memory (pixel_flip and generate_new_images) are skipped when there are
+    more than max_candidates candidates; iter_new_images, which streams them, always runs, but its memory is then
+    not traced.
+
+    :param image_files: List of strings representing the names of the image files.
+    :param budgets: List of integers representing the budgets to benchmark.
+    :param repeat: Integer representing the number of timed runs of the fast benchmarks.
+    :param max_candidates: Integer representing the largest number of candidates to hold in memory.
+    :return: List of dictionaries, one per benchmark, image and budget.
+    """
+    results = []
+
+    def add(name: str, image_file: str | None, budget: int | None, candidates: int, measurement: dict) -> None:
+        seconds = measurement["seconds"]
+        results.append(
+            {
+                "name": name,
+                "image": image_file,
+                "budget": budget,
+                "candidates": candidates,
+                **measurement,
+                "ops_per_sec": 1 / seconds if seconds else None,
+                "candidates_per_sec": candidates / seconds if candidates and seconds else None,
+            }
+        )
+
+    add("read_weights", None, None, 0, measure(lambda: read_weights("./weights.txt"), repeat))
+    add("read_biases", None, None, 0, measure(lambda: read_biases("./biases.txt"), repeat))
+    add("Model.from_files", None, None, 0, measure(lambda: Model.from_files("./weights.txt", "./biases.txt"), repeat))
+
+    model = load_model()
+    quantized = QuantizedModel(model)
+    for image_file in image_files:
+        image = read_image(image_file)
+        x = flatten_image(image)
+        add("inference", image_file, None, 0, measure(lambda: inference(x, model.weights, model.biases), repeat))
+        add("predict_number", image_file, None, 0, measure(lambda: predict_number(image, model), repeat))
+        add("predict_number (quantized)", image_file, None, 0, measure(lambda: quantized.predict(image), repeat))
+
+        for budget in budgets:
+            candidates = count_new_images(image, budget)
+            add(
+                "iter_new_images",
+                image_file,
+                budget,
+                candidates,
+                measure(
+                    lambda: sum(1 for _ in iter_new_images(image, budget, model)),
+                    memory=candidates <= max_candidates,
+                ),
+            )
+            add(
+                "iter_new_images (quantized)",
+                image_file,
+                budget,
+                candidates,
+                measure(
+                    lambda: sum(1 for _ in iter_new_images(image, budget, quantized)),
+                    memory=candidates <= max_candidates,
+                ),
+            )
+            if candidates > max_candidates:
+                continue
+            add(
+                "pixel_flip",
+                image_file,
+                budget,
+                candidates,
+                measure(lambda: _pixel_flip(x, budget)),
+            )
+            add(
+                "generate_new_images",
+                image_file,
+                budget,
+                candidates,
+                measure(lambda: generate_new_images(image, budget, model)),
+            )
+
+    return results
+
+
+def quantization_report(image_files: list[str], budget: int, model: Model | None = None) -> dict:
+    """
+    Compares the numbers predicted by a QuantizedModel with those of the float model, for every candidate image.
+
+    :param image_files: List of strings representing the names of the image files.
+    :param budget: Integer representing the budget of the candidates.
+    :param model: Model to quantize, defaults to the cached model from load_model().
+    :return: Dictionary with the scale, whether the quantization is exact, the size of the float64 and of the
+             quantized weights in bytes, the number of candidates, how many of them get the same number from both
+             models, and the first few that do not.
+    """
+    if model is None:
+        model = load_model()
+    quantized = QuantizedModel(model)
+
+    candidates = agreements = 0
+    disagreements = []
+    for image_file in image_files:
+        image = read_image(image_file)
+        x = flatten_image(image)
+        combinations = list(iter_flipped_images(image, budget))
+        for flipped, number, quantized_number in zip(
+            combinations, model.predict_flipped(x, combinations), quantized.predict_flipped(x, combinations)
+        ):
+            candidates += 1
+            if number == quantized_number:
+                agreements += 1
+            elif len(disagreements) < 10:
+                disagreements.append(
+                    {"image": image_file, "flipped": list(flipped), "float": number, "quantized": quantized_number}
+                )
+
+    return {
+        "scale": quantized.scale,
+        "exact": quantized.exact,
+        "float_bytes": 8 * sum(len(rows) * len(rows[0]) + len(biases) for rows, biases in model.layers),
+        "quantized_bytes": quantized.nbytes,
+        "budget": budget,
+        "candidates": candidates,
+        "agreements": agreements,
+        "agreement": agreements / candidates if candidates else None,
+        "disagreements": disagreements,
+    }
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float) -> list[str]:
+    """
+    Compares benchmark results with a baseline.
+
+    :param results: List of dictionaries returned by run_benchmarks.
+    :param baseline: List of dictionaries of an earlier run.
+    :param threshold: Float representing the allowed slowdown, e.g. 0.2 for 20% slower.
+    :return: List of strings describing every benchmark slower than the baseline by more than the threshold.
+    """
+    baseline_seconds = {(r["name"], r["image"], r["budget"]): r["seconds"] for r in baseline}
+    regressions = []
+    for result in results:
+        before = baseline_seconds.get((result["name"], result["image"], result["budget"]))
+        if before and result["seconds"] > before * (1 + threshold):
+            regressions.append(
+                f"{result['name']} image={result['image']} budget={result['budget']}: "
+                f"{result['seconds']:.6f}s against {before:.6f}s ({result['seconds'] / before:.2f}x)"
+            )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Command-line entry point: runs the benchmarks and writes their results as JSON.
+
+    :param argv: List of strings representing the command-line arguments, defaults to sys.argv[1:].
+    :return: Integer representing the exit status, 1 when a benchmark regressed against the baseline.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark inference, enumeration and generation.")
+    parser.add_argument("--images", nargs="+", default=IMAGE_FILES, help="image files (default: the sample images)")
+    parser.add_argument("--budgets", nargs="+", type=int, default=[1, 2, 3], help="budgets (default: 1 2 3)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs of the fast benchmarks (default: 3)")
+    parser.add_argument(
+        "--max-candidates",
+        type=int,
+        default=20000,
+        help="skip benchmarks holding more candidates than this in memory (default: 20000)",
+    )
+    parser.add_argument(
+        "--quantization-budget",
+        type=int,
+        default=2,
+        help="budget of the candidates the quantized model is checked against (default: 2)",
+    )
+    parser.add_argument("--output", help="file to write the JSON results to (default: standard output)")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="slowdown against the baseline that fails the run (default: 0.2)"
+    )
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.images, args.budgets, args.repeat, args.max_candidates)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": results,
+        "quantization": quantization_report(args.images, args.quantization_budget),
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
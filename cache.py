@@ -0,0 +1,286 @@
+from __future__ import annotations
+import hashlib
+import sqlite3
+import struct
+from array import array
+from collections.abc import Iterable, Iterator
+from itertools import islice
+from ai import Model, argmax, load_model
+
+# layout of a cache file: a meta table holding the schema version and the
+# fingerprint of the model the predictions were made with, and a predictions
+# table with the number and logits predicted for each image, keyed by the hash
+# of the image, along with a counter of when the entry was last used
+_SCHEMA_VERSION = "1"
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS predictions (
+    image BLOB PRIMARY KEY,
+    number INTEGER NOT NULL,
+    logits BLOB NOT NULL,
+    used INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS predictions_used ON predictions (used);
+"""
+
+# images looked up per query, below the smallest limit on query parameters of any SQLite version
+_LOOKUP_SIZE = 500
+
+
+def pack_image(flat_image: list[int]) -> bytes:
+    """
+    Packs a flattened binary image 8 pixels per byte, in the layout of BitImage.bits.
+
+    :param flat_image: 1D list of integers representing a flattened image of 0s and 1s.
+    :return: Bytes with pixel i in bit i % 8 of byte i // 8.
+    """
+    value = 0
+    for idx, pixel in enumerate(flat_image):
+        if pixel:
+            value |= 1 << idx
+    return value.to_bytes((len(flat_image) + 7) // 8, "little")
+
+
+def image_key(height: int, width: int, bits: bytes) -> bytes:
+    """
+    Hashes a packed image into the key its predictions are cached under.
+
+    :param height: Integer representing the number of rows of the image.
+    :param width: Integer representing the number of columns of the image.
+    :param bits: Bytes returned by pack_image, or the bits of a BitImage.
+    :return: Bytes, a 16-byte digest of the size and pixels of the image.
+    """
+    digest = hashlib.blake2b(struct.pack("<II", height, width), digest_size=16)
+    digest.update(bits)
+    return digest.digest()
+
+
+class PredictionCache:
+    """
+    Predicted numbers and logits of images, kept in an SQLite file so that later runs do not classify them again.
+
+    Entries are keyed by image_key and belong to one model: the fingerprint of the model is stored with them, and
+    the first time the cache is used with a model of another fingerprint, every entry is dropped. Without a model,
+    the cache uses load_model, which reloads the weights and biases files whenever they change on disk, so editing
+    either file invalidates the cache on its own. Once more than max_entries entries are stored, the least recently
+    used ones are evicted.
+
+    A cache file should only be used by one process at a time.
+    """
+
+    def __init__(
+        self,
+        file_name: str = "predictions.sqlite",
+        model: Model | None = None,
+        max_entries: int = 1_000_000,
+        weights_file: str = "./weights.txt",
+        biases_file: str = "./biases.txt",
+    ) -> None:
+        """
+        :param file_name: String representing the name of the cache file, created when missing.
+        :param model: Model to make and cache predictions with, defaults to load_model(weights_file, biases_file).
+        :param max_entries: Integer representing the largest number of entries to keep.
+        :param weights_file: String representing the name of the weights file, when no model is given.
+        :param biases_file: String representing the name of the biases file, when no model is given.
+        """
+        self.file_name = file_name
+        self.max_entries = max_entries
+        self.weights_file = weights_file
+        self.biases_file = biases_file
+        self.hits = 0
+        self.misses = 0
+        self._model = model
+        self._bound_model = None
+
+        self._connection = sqlite3.connect(file_name)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.executescript(_SCHEMA)
+        version = self._connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if version is not None and version[0] != _SCHEMA_VERSION:
+            raise ValueError(f"{file_name} is a prediction cache of version {version[0]}, not {_SCHEMA_VERSION}")
+        self._connection.execute("INSERT OR IGNORE INTO meta VALUES ('version', ?)", (_SCHEMA_VERSION,))
+        self._connection.commit()
+
+        self._count = self._connection.execute("SELECT count(*) FROM predictions").fetchone()[0]
+        # entries are stamped with an increasing counter when used, the oldest stamps are evicted first
+        self._clock = self._connection.execute("SELECT coalesce(max(used), 0) FROM predictions").fetchone()[0]
+
+    @property
+    def model(self) -> Model:
+        """
+        :return: Model the predictions are made with; the cache is emptied when it differs from the last one used.
+        """
+        model = self._model if self._model is not None else load_model(self.weights_file, self.biases_file)
+        if model is not self._bound_model:
+            self._bind(model)
+        return model
+
+    def _bind(self, model: Model) -> None:
+        fingerprint = model.fingerprint()
+        row = self._connection.execute("SELECT value FROM meta WHERE key = 'model'").fetchone()
+        if row is None or row[0] != fingerprint:
+            # the entries were predicted by other weights or biases
+            self._connection.execute("DELETE FROM predictions")
+            self._connection.execute("INSERT OR REPLACE INTO meta VALUES ('model', ?)", (fingerprint,))
+            self._connection.commit()
+            self._count = 0
+        self._bound_model = model
+
+    def _lookup(self, keys: list[bytes]) -> dict[bytes, tuple[int, bytes]]:
+        # finds the entries of the keys and marks them as used
+        found = {}
+        for start in range(0, len(keys), _LOOKUP_SIZE):
+            batch = keys[start : start + _LOOKUP_SIZE]
+            rows = self._connection.execute(
+                f"SELECT image, number, logits FROM predictions WHERE image IN ({', '.join('?' * len(batch))})",
+                batch,
+            )
+            for key, number, logits in rows:
+                found[key] = (number, logits)
+
+        if found:
+            self._connection.executemany(
+                "UPDATE predictions SET used = ? WHERE image = ?",
+                ((self._clock + k, key) for k, key in enumerate(found, start=1)),
+            )
+            self._clock += len(found)
+            self._connection.commit()
+        self.hits += len(found)
+        return found
+
+    def _store(self, entries: list[tuple[bytes, int, list[float]]]) -> None:
+        # adds the entries of new predictions, then evicts the least recently used ones over the limit
+        if not entries:
+            return
+        self.misses += len(entries)
+        cursor = self._connection.executemany(
+            "INSERT OR IGNORE INTO predictions VALUES (?, ?, ?, ?)",
+            (
+                (key, number, array("d", logits).tobytes(), self._clock + k)
+                for k, (key, number, logits) in enumerate(entries, start=1)
+            ),
+        )
+        self._clock += len(entries)
+        self._count += cursor.rowcount
+
+        if self._count > self.max_entries:
+            cursor = self._connection.execute(
+                "DELETE FROM predictions WHERE image IN (SELECT image FROM predictions ORDER BY used LIMIT ?)",
+                (self._count - self.max_entries,),
+            )
+            self._count -= cursor.rowcount
+        self._connection.commit()
+
+    def get(self, image: list[list[int]]) -> tuple[int, list[float]] | None:
+        """
+        :param image: 2D list of integers representing a binary image.
+        :return: Tuple of the cached number and logits of the image, or None when it is not cached.
+        """
+        # looking the model up first drops the entries of a stale model
+        self.model
+        x = [pixel for row in image for pixel in row]
+        key = image_key(len(image), len(image[0]) if image else 0, pack_image(x))
+        entry = self._lookup([key]).get(key)
+        if entry is None:
+            return None
+        return entry[0], array("d", entry[1]).tolist()
+
+    def predict(self, image: list[list[int]]) -> int:
+        """
+        Predicts the number in an image like predict_number, classifying it only when it is not cached yet.
+
+        :param image: 2D list of integers representing a binary image.
+        :return: Integer representing the predicted number.
+        """
+        return self.predict_numbers([image])[0]
+
+    def predict_numbers(self, images: Iterable[list[list[int]]], chunk_size: int = 1024) -> list[int]:
+        """
+        Predicts the numbers in many images like predict_numbers, classifying only those that are not cached yet.
+
+        :param images: Iterable of 2D lists of integers representing binary images.
+        :param chunk_size: Integer representing the number of images looked up and classified at once.
+        :return: List of integers representing the predicted numbers, in the order of the images.
+        """
+        model = self.model
+        images = iter(images)
+        numbers = []
+        while True:
+            chunk = list(islice(images, chunk_size))
+            if not chunk:
+                return numbers
+            flat_images = [[pixel for row in image for pixel in row] for image in chunk]
+            keys = [
+                image_key(len(image), len(image[0]) if image else 0, pack_image(x))
+                for image, x in zip(chunk, flat_images)
+            ]
+            found = self._lookup(keys)
+
+            missing = [k for k, key in enumerate(keys) if key not in found]
+            new_entries = []
+            for k, y in zip(missing, model.inference_batch([flat_images[k] for k in missing])):
+                if keys[k] not in found:
+                    found[keys[k]] = (argmax(y), None)
+                    new_entries.append((keys[k], argmax(y), y))
+            self._store(new_entries)
+            numbers.extend(found[key][0] for key in keys)
+
+    def iter_predict_flipped(
+        self, x: list[int], width: int, flipped_sets: Iterable[Iterable[int]], chunk_size: int = 4096
+    ) -> Iterator[int]:
+        """
+        Predicts the numbers of copies of an image with some pixels flipped, like Model.iter_predict_flipped, but
+        classifies only the copies that are not cached yet.
+
+        :param x: 1D list of integers representing the flattened binary image.
+        :param width: Integer representing the number of columns of the image.
+        :param flipped_sets: Iterable of collections of flat indices, each describing a copy with those pixels flipped.
+        :param chunk_size: Integer representing the number of copies looked up and classified at once.
+        :return: Generator of integers representing the predicted number of each copy, in order.
+        """
+        model = self.model
+        height = len(x) // width if width else 0
+        num_bytes = (len(x) + 7) // 8
+        value = int.from_bytes(pack_image(x), "little")
+        # the first layer of x is only computed once a copy has to be classified
+        pre_activations = None
+
+        flipped_sets = iter(flipped_sets)
+        while True:
+            chunk = list(islice(flipped_sets, chunk_size))
+            if not chunk:
+                return
+            keys = []
+            for flipped in chunk:
+                flipped_value = value
+                for idx in flipped:
+                    flipped_value ^= 1 << idx
+                keys.append(image_key(height, width, flipped_value.to_bytes(num_bytes, "little")))
+            found = self._lookup(keys)
+
+            new_entries = []
+            for key, flipped in zip(keys, chunk):
+                if key not in found:
+                    if pre_activations is None:
+                        pre_activations = model.first_layer(x)
+                    y = model.logits_first_layer(x, model.flip_first_layer(x, pre_activations, flipped), flipped)
+                    found[key] = (argmax(y), None)
+                    new_entries.append((key, argmax(y), y))
+            self._store(new_entries)
+            yield from (found[key][0] for key in keys)
+
+    def close(self) -> None:
+        """
+        :return: None.
+        """
+        self._connection.close()
+
+    def __enter__(self) -> PredictionCache:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
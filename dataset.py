@@ -0,0 +1,164 @@
+from __future__ import annotations
+import glob
+import mmap
+import os
+import struct
+from collections.abc import Iterator
+
+# maps the characters "0" to "9" to the byte values 0 to 9
+_DIGITS = bytes.maketrans(b"0123456789", bytes(range(10)))
+
+# layout of a packed dataset file: the magic bytes, the format version, the
+# number of images, their height and width and the length of the names, then
+# the names of the images joined by newlines, padding up to a multiple of 8
+# bytes, and then the pixels of all images as one byte each, image by image
+_PACKED_MAGIC = b"GAID"
+_PACKED_VERSION = 1
+_PACKED_HEADER = "<4sIIIII"
+
+
+def read_image_bytes(file_name: str) -> tuple[int, int, bytes]:
+    """
+    Reads an image file like read_image, but into bytes holding one pixel value per byte.
+
+    The whole file is read at once and converted with a single bytes.translate, instead of calling int() per character.
+
+    :param file_name: String representing the name of the file.
+    :return: Tuple of the height, the width and the pixels of the image, row after row.
+    """
+    with open(file_name, "rb") as image_file:
+        rows = image_file.read().split()
+
+    width = len(rows[0]) if rows else 0
+    if any(len(row) != width for row in rows):
+        raise ValueError(f"{file_name} has rows of different lengths")
+    pixels = b"".join(rows).translate(_DIGITS)
+    if pixels and max(pixels) > 9:
+        raise ValueError(f"{file_name} holds characters other than digits")
+    return len(rows), width, pixels
+
+
+class Dataset:
+    """
+    Many images of the same size held as one contiguous buffer of bytes, one byte per pixel.
+
+    The buffer is laid out as an (N, height, width) array of uint8; `array` exposes it with that shape. A Dataset can
+    be saved to a packed file and loaded back memory-mapped, so a job over thousands of images starts without parsing
+    any text.
+    """
+
+    def __init__(self, names: list[str], height: int, width: int, pixels: bytes | bytearray | memoryview) -> None:
+        """
+        :param names: List of strings naming each image, e.g. the files they were read from.
+        :param height: Integer representing the number of rows of every image.
+        :param width: Integer representing the number of columns of every image.
+        :param pixels: Buffer with the pixels of all images, image after image and row after row.
+        """
+        if len(pixels) != len(names) * height * width:
+            raise ValueError("the pixels do not match the number and size of the images")
+        self.names = names
+        self.height = height
+        self.width = width
+        self.pixels = memoryview(pixels)
+
+    @classmethod
+    def from_files(cls, file_names: list[str]) -> Dataset:
+        """
+        Reads image files in bulk.
+
+        :param file_names: List of strings representing the names of the image files, which must have the same size.
+        :return: Dataset of the images, in the order of the files.
+        """
+        pixels = bytearray()
+        height = width = 0
+        for k, file_name in enumerate(file_names):
+            image_height, image_width, image_pixels = read_image_bytes(file_name)
+            if k == 0:
+                height, width = image_height, image_width
+            elif (image_height, image_width) != (height, width):
+                raise ValueError(f"{file_name} is {image_height}x{image_width}, not {height}x{width}")
+            pixels += image_pixels
+        return cls(list(file_names), height, width, pixels)
+
+    @classmethod
+    def from_directory(cls, directory: str, pattern: str = "*.txt") -> Dataset:
+        """
+        Reads every image file of a directory in bulk.
+
+        :param directory: String representing the name of the directory.
+        :param pattern: String representing the glob pattern the image files match.
+        :return: Dataset of the images, sorted by file name.
+        """
+        return cls.from_files(sorted(glob.glob(os.path.join(directory, pattern))))
+
+    def save(self, file_name: str) -> None:
+        """
+        Writes the dataset to a packed file, see load.
+
+        :param file_name: String representing the name of the file.
+        :return: None.
+        """
+        names = "\n".join(self.names).encode("utf-8")
+        header = struct.pack(
+            _PACKED_HEADER, _PACKED_MAGIC, _PACKED_VERSION, len(self.names), self.height, self.width, len(names)
+        )
+        header += names
+        header += bytes(-len(header) % 8)
+        with open(file_name, "wb") as packed_file:
+            packed_file.write(header)
+            packed_file.write(self.pixels)
+
+    @classmethod
+    def load(cls, file_name: str) -> Dataset:
+        """
+        Maps a packed file written by save; the pixels are a read-only view into the file and are not copied.
+
+        :param file_name: String representing the name of the file.
+        :return: Dataset of the images in the file.
+        """
+        with open(file_name, "rb") as packed_file:
+            buffer = mmap.mmap(packed_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, height, width, names_length = struct.unpack_from(_PACKED_HEADER, buffer, 0)
+        if magic != _PACKED_MAGIC or version != _PACKED_VERSION:
+            raise ValueError(f"{file_name} is not a packed dataset file of version {_PACKED_VERSION}")
+        offset = struct.calcsize(_PACKED_HEADER)
+        names = buffer[offset : offset + names_length].decode("utf-8").split("\n") if count else []
+        offset += names_length
+        offset += -offset % 8
+
+        return cls(names, height, width, memoryview(buffer)[offset : offset + count * height * width])
+
+    @property
+    def array(self) -> memoryview:
+        """
+        :return: Memoryview of the pixels with the shape (number of images, height, width), or an empty view of shape
+                 (0,) when the dataset holds no pixels, as memoryview cannot cast to a shape with a zero in it.
+        """
+        if not self.pixels:
+            return self.pixels.cast("B")
+        return self.pixels.cast("B", (len(self), self.height, self.width))
+
+    def flat_image(self, k: int) -> list[int]:
+        """
+        :param k: Integer representing the position of the image.
+        :return: 1D list of integers representing the flattened image.
+        """
+        size = self.height * self.width
+        return list(self.pixels[k * size : (k + 1) * size])
+
+    def __getitem__(self, k: int) -> list[list[int]]:
+        """
+        :param k: Integer representing the position of the image.
+        :return: 2D list of integers representing the image, as read_image returns it.
+        """
+        if not -len(self) <= k < len(self):
+            raise IndexError("Dataset index out of range")
+        flat_image = self.flat_image(k % len(self))
+        return [flat_image[idx : idx + self.width] for idx in range(0, len(flat_image), self.width)]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self) -> Iterator[list[list[int]]]:
+        return (self[k] for k in range(len(self)))
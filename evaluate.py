@@ -0,0 +1,338 @@
+from __future__ import annotations
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from itertools import tee
+from ai import Model, QuantizedModel, load_model, read_binary_model, read_image
+from dataset import Dataset
+from generative import NEIGHBOURHOODS, flatten_image, iter_flipped_images
+
+# columns of a row of results, one row per image and budget: the number
+# predicted for the image, how many candidates the budget allows, how many of
+# them keep the number and which fraction that is, the fewest flipped pixels
+# that change the number (empty when no candidate within the budget does), and
+# how many candidates are predicted as each number
+FIELDS = (
+    "name",
+    "budget",
+    "number",
+    "candidates",
+    "preserved",
+    "preserved_fraction",
+    "min_flips_to_change",
+) + tuple(f"predicted_{number}" for number in range(10))
+
+
+def evaluate_image(
+    image: list[list[int]],
+    budgets: Iterable[int],
+    model: Model | None = None,
+    neighbourhood: int | Iterable[tuple[int, int]] = 4,
+    name: str = "",
+) -> list[dict]:
+    """
+    Classifies every candidate of an image within the largest budget once, and tallies the results for each budget.
+
+    :param image: 2D list of integers representing an image.
+    :param budgets: Iterable of integers representing the budgets to report.
+    :param model: Preloaded Model used for predictions, defaults to the cached model from load_model().
+    :param neighbourhood: 4, 8 or the (row, column) offsets of the neighbours of a pixel, see flippable_pixels.
+    :param name: String identifying the image in the rows, e.g. its file name.
+    :return: List of dictionaries with the FIELDS of each budget, in the order of the budgets.
+    """
+    if model is None:
+        model = load_model()
+    budgets = list(budgets)
+    flat_image = flatten_image(image)
+    number = model.predict(image)
+
+    # counts[size][k] is the number of candidates of size flipped pixels predicted as number k
+    max_budget = max(budgets, default=0)
+    counts = [[0] * 10 for _ in range(max_budget + 1)]
+    flips, sizes = tee(iter_flipped_images(image, max_budget, neighbourhood))
+    for flipped, predicted in zip(sizes, model.iter_predict_flipped(flat_image, flips)):
+        counts[len(flipped)][predicted] += 1
+
+    rows = []
+    for budget in budgets:
+        predicted = [sum(counts[size][k] for size in range(1, budget + 1)) for k in range(10)]
+        candidates = sum(predicted)
+        changed = [size for size in range(1, budget + 1) if sum(counts[size]) > counts[size][number]]
+        row = {
+            "name": name,
+            "budget": budget,
+            "number": number,
+            "candidates": candidates,
+            "preserved": predicted[number],
+            "preserved_fraction": predicted[number] / candidates if candidates else 1.0,
+            "min_flips_to_change": changed[0] if changed else None,
+        }
+        row.update((f"predicted_{k}", predicted[k]) for k in range(10))
+        rows.append(row)
+    return rows
+
+
+def summarize(rows: Iterable[dict]) -> list[dict]:
+    """
+    Aggregates the rows of many images into one summary per budget.
+
+    :param rows: Iterable of dictionaries with the FIELDS, as returned by evaluate_image or read_rows.
+    :return: List of dictionaries, one per budget in increasing order, with the number of images, the candidates and
+             preserved candidates summed over them, the pooled and the mean preserved fraction, the number of images
+             whose number can be changed, a histogram of their fewest flips to change it and the candidates predicted
+             as each number.
+    """
+    summaries = {}
+    for row in rows:
+        summary = summaries.setdefault(
+            row["budget"],
+            {
+                "budget": row["budget"],
+                "images": 0,
+                "candidates": 0,
+                "preserved": 0,
+                "preserved_fraction": 1.0,
+                "mean_preserved_fraction": 0.0,
+                "changeable_images": 0,
+                "min_flips_to_change": {},
+                "predicted": [0] * 10,
+            },
+        )
+        summary["images"] += 1
+        summary["candidates"] += row["candidates"]
+        summary["preserved"] += row["preserved"]
+        summary["mean_preserved_fraction"] += row["preserved_fraction"]
+        if row["min_flips_to_change"] is not None:
+            summary["changeable_images"] += 1
+            flips = row["min_flips_to_change"]
+            summary["min_flips_to_change"][flips] = summary["min_flips_to_change"].get(flips, 0) + 1
+        for k in range(10):
+            summary["predicted"][k] += row[f"predicted_{k}"]
+
+    for summary in summaries.values():
+        # as for a single row, no candidates means none of them changed the number
+        summary["preserved_fraction"] = summary["preserved"] / summary["candidates"] if summary["candidates"] else 1.0
+        summary["mean_preserved_fraction"] /= summary["images"]
+        summary["min_flips_to_change"] = dict(sorted(summary["min_flips_to_change"].items()))
+    return [summaries[budget] for budget in sorted(summaries)]
+
+
+def _is_csv(file_name: str) -> bool:
+    return file_name.lower().endswith(".csv")
+
+
+def _parse_row(row: dict) -> dict:
+    # converts the strings of a CSV row back to the types of evaluate_image
+    parsed = {}
+    for field in FIELDS:
+        value = row[field]
+        if field == "name":
+            parsed[field] = value
+        elif field == "preserved_fraction":
+            parsed[field] = float(value)
+        elif field == "min_flips_to_change":
+            parsed[field] = int(value) if value else None
+        else:
+            parsed[field] = int(value)
+    return parsed
+
+
+def read_rows(file_name: str) -> list[dict]:
+    """
+    Reads the rows written by evaluate_images, as CSV when the file name ends in .csv and as JSON lines otherwise.
+
+    A run that was interrupted can leave a last line that was only partly written; it is cut off the file, so that
+    appending to the file carries on from the last complete row.
+
+    :param file_name: String representing the name of the file, which may be missing.
+    :return: List of dictionaries with the FIELDS of every complete row, in the order they were written.
+    """
+    if not os.path.exists(file_name):
+        return []
+    with open(file_name, "rb+") as f:
+        data = f.read()
+        complete = data.rfind(b"\n") + 1
+        if complete < len(data):
+            f.truncate(complete)
+    lines = data[:complete].decode("utf-8").splitlines()
+    if not lines:
+        return []
+
+    if _is_csv(file_name):
+        reader = csv.DictReader(lines)
+        if tuple(reader.fieldnames or ()) != FIELDS:
+            raise ValueError(f"{file_name} does not hold the columns {', '.join(FIELDS)}")
+        return [_parse_row(row) for row in reader]
+    return [json.loads(line) for line in lines]
+
+
+# state of a worker process of evaluate_images, set once per worker by _init_worker
+_worker_state: dict = {}
+
+
+def _init_worker(model: Model, neighbourhood: int | Iterable[tuple[int, int]]) -> None:
+    _worker_state.update(model=model, neighbourhood=neighbourhood)
+
+
+def _evaluate_task(task: tuple[str, list[list[int]], list[int]]) -> list[dict]:
+    name, image, budgets = task
+    return evaluate_image(image, budgets, _worker_state["model"], _worker_state["neighbourhood"], name)
+
+
+def evaluate_images(
+    images: Iterable[tuple[str, list[list[int]]]],
+    budgets: Iterable[int],
+    file_name: str,
+    model: Model | None = None,
+    workers: int = 1,
+    neighbourhood: int | Iterable[tuple[int, int]] = 4,
+) -> Iterator[dict]:
+    """
+    Evaluates many images for every budget and appends each row to a file as soon as its image is done.
+
+    Rows already in the file are not computed again, so a run that was interrupted is resumed by running it again
+    with the same file; names identify the images, so they should be distinct. The file is written as CSV when its
+    name ends in .csv and as JSON lines otherwise. With more than one worker, images are evaluated in worker
+    processes that each receive the model once, and rows are still written in the order of the images.
+
+    :param images: Iterable of pairs of a string naming an image and the 2D list of integers of the image.
+    :param budgets: Iterable of integers representing the budgets to evaluate.
+    :param file_name: String representing the name of the file to append the rows to, created when missing.
+    :param model: Preloaded Model used for predictions, defaults to the cached model from load_model().
+    :param workers: Integer representing the number of worker processes.
+    :param neighbourhood: 4, 8 or the (row, column) offsets of the neighbours of a pixel, see flippable_pixels.
+    :return: Generator of the dictionaries with the FIELDS of every new row, as they are written.
+    """
+    if model is None:
+        model = load_model()
+    budgets = sorted(set(budgets))
+    done = {}
+    for row in read_rows(file_name):
+        done.setdefault(row["name"], set()).add(row["budget"])
+    # an image missing only some budgets is evaluated for those budgets alone
+    tasks = (
+        (name, image, missing)
+        for name, image in images
+        if (missing := [budget for budget in budgets if budget not in done.get(name, ())])
+    )
+
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model, neighbourhood))
+        results = executor.map(_evaluate_task, tasks)
+    else:
+        results = (evaluate_image(image, missing, model, neighbourhood, name) for name, image, missing in tasks)
+
+    is_csv = _is_csv(file_name)
+    try:
+        with open(file_name, "a", newline="") as f:
+            writer = csv.DictWriter(f, FIELDS) if is_csv else None
+            if is_csv and f.tell() == 0:
+                writer.writeheader()
+            for rows in results:
+                for row in rows:
+                    if is_csv:
+                        writer.writerow(row)
+                    else:
+                        f.write(json.dumps(row) + "\n")
+                # every finished image is on disk before the next one is waited for
+                f.flush()
+                yield from rows
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Command-line entry point: evaluates images for a range of budgets, appending rows to a results file, and prints
+    a summary of every budget.
+
+    :param argv: List of strings representing the command-line arguments, defaults to sys.argv[1:].
+    :return: Integer representing the exit status.
+    """
+    parser = argparse.ArgumentParser(
+        description="Count, for every image and budget, the candidates that keep or change the predicted number."
+    )
+    parser.add_argument("inputs", nargs="*", help="image files or glob patterns (default: image.txt)")
+    parser.add_argument("--dataset", help="packed dataset file to read the images from, instead of image files")
+    parser.add_argument("--budgets", nargs="+", type=int, default=[1, 2], help="budgets (default: 1 2)")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes (default: 1)")
+    parser.add_argument(
+        "--output",
+        default="evaluation.csv",
+        help="file the rows are appended to, CSV for .csv and JSON lines otherwise; rows already in it are "
+        "skipped (default: evaluation.csv)",
+    )
+    parser.add_argument("--summary", help="file to write the summary of every budget to as JSON")
+    parser.add_argument("--weights", default="./weights.txt", help="weights file (default: ./weights.txt)")
+    parser.add_argument("--biases", default="./biases.txt", help="biases file (default: ./biases.txt)")
+    parser.add_argument("--model", help="binary model file, used instead of --weights and --biases")
+    parser.add_argument(
+        "--quantized", action="store_true", help="classify with the weights scaled to integers, see QuantizedModel"
+    )
+    parser.add_argument(
+        "--neighbourhood",
+        type=int,
+        choices=sorted(NEIGHBOURHOODS),
+        default=4,
+        help="pixels next to a 1 that can be flipped: 4 sharing an edge, 8 also sharing a corner (default: 4)",
+    )
+    args = parser.parse_args(argv)
+    if min(args.budgets) < 1:
+        parser.error("budgets must be at least 1")
+
+    # expand the glob patterns ourselves, so they also work where the shell does not
+    if args.dataset:
+        if args.inputs:
+            parser.error("image files cannot be given together with --dataset")
+        dataset = Dataset.load(args.dataset)
+        images = ((name, dataset[k]) for k, name in enumerate(dataset.names))
+    else:
+        file_names = []
+        for pattern in args.inputs or ["image.txt"]:
+            matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+            if not matches:
+                parser.error(f"no files match {pattern}")
+            file_names.extend(matches)
+        images = ((file_name, read_image(file_name)) for file_name in file_names)
+
+    # the model is loaded once for the whole run, and sent once to every worker
+    model = read_binary_model(args.model) if args.model else load_model(args.weights, args.biases)
+    if args.quantized:
+        model = QuantizedModel(model)
+
+    start = time.perf_counter()
+    num_rows = 0
+    for num_rows, row in enumerate(
+        evaluate_images(images, args.budgets, args.output, model, args.workers, args.neighbourhood), start=1
+    ):
+        print(
+            f"{row['name']} budget {row['budget']}: {row['preserved']}/{row['candidates']} keep {row['number']} "
+            f"({row['preserved_fraction']:.2%}), fewest flips to change it: {row['min_flips_to_change']}"
+        )
+    elapsed = time.perf_counter() - start
+    print(f"{num_rows} new rows written to {args.output} in {elapsed:.3f}s", file=sys.stderr)
+
+    summaries = summarize(read_rows(args.output))
+    for summary in summaries:
+        print(
+            f"Budget {summary['budget']}: {summary['images']} images, {summary['preserved']}/{summary['candidates']} "
+            f"candidates keep their number ({summary['preserved_fraction']:.2%}, mean per image "
+            f"{summary['mean_preserved_fraction']:.2%}), {summary['changeable_images']} images can change, "
+            f"fewest flips {summary['min_flips_to_change']}"
+        )
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(summaries, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,228 +1,1603 @@
-from __future__ import annotations
-from ai import predict_number, read_image
-
-
-def flatten_image(image: list[list[int]]) -> list[int]:
-    """
-    Flattens a 2D list into a 1D list.
-
-    :param image: 2D list of integers representing an image.
-    :return: 1D list of integers representing a flattened image.
-    """
-    return [pixel for row in image for pixel in row]
-
-
-def unflatten_image(flat_image: list[int]) -> list[list[int]]:
-    """
-    Unflattens a 1D list into a 2D list.
-
-    :param flat_image: 1D list of integers representing a flattened image.
-    :return: 2D list of integers.
-    """
-
-    # find the dimensions of the 2d list, since the 2d list always has same amount of rows and columns
-    dimensions = int(len(flat_image) ** 0.5)
-    # hold values of each row
-    row = []
-    # hold all the row arrays into one array
-    unflatten_list = []
-
-    # add row to unflatten_list
-    # idx is incremented by dimensions, as that shows the limit of how many items can be in each row
-    for idx in range(0, len(flat_image), dimensions):
-        row = flat_image[idx : idx + dimensions]
-        unflatten_list.append(row)
-
-    return unflatten_list
-
-
-def check_adjacent_for_one(flat_image: list[int], flat_pixel: int) -> bool:
-    """
-    Checks if a pixel has an adjacent pixel with the value of 1.
-
-    :param flat_image: 1D list of integers representing a flattened image.
-    :param flat_pixel: Integer representing the index of the pixel in question.
-    :return: Boolean.
-    """
-
-    # make the image unflat so we can see the adjacent values
-    image = unflatten_image(flat_image)
-    DIMENSIONS = len(image[0])
-
-    unflatten_row_index = int(flat_pixel / DIMENSIONS)
-    unflatten_col_index = flat_pixel % DIMENSIONS
-    is_adjacent = False
-
-    # make sure whichever row and column index we are looking, it is valid by being less than the dimensions of unflatten image
-    if unflatten_row_index < DIMENSIONS and unflatten_col_index < DIMENSIONS:
-        # check if value is adjacent left, right or vertical
-        if (
-            check_adjacent_left(image, unflatten_row_index, unflatten_col_index)
-            or check_adjacent_right(image, unflatten_row_index, unflatten_col_index)
-            or check_adjacent_vertical(image, unflatten_row_index, unflatten_col_index)
-        ):
-            is_adjacent = True
-
-    return is_adjacent
-
-
-def check_adjacent_left(image, row_index, col_index):
-    """
-    Checks if a pixel has an adjacent pixel with the value of 1 to the left.
-
-    :param image: 2D list of an unflattened image.
-    :param row_index: Integer representing the row index of image.
-    :param col_index: Integer representing the column index of image.
-    :return: Boolean.
-    """
-    # make sure col_index isn't 0 (i.e., the leftmost column), since there is no pixel to the left of it
-    if col_index != 0:
-        if image[row_index][col_index] == 0 and image[row_index][col_index - 1] == 1:
-            return True
-    return False
-
-
-def check_adjacent_right(image, row_index, col_index):
-    """
-    Checks if a pixel has an adjacent pixel with the value of 1 to the right.
-
-    :param image: 2D list of an unflattened image.
-    :param row_index: Integer representing the row index of image.
-    :param col_index: Integer representing the column index of image.
-    :return: Boolean.
-    """
-    # make sure col_index isn't the last index of the `row, since that would cause the index to be out of the array's range
-    if col_index != len(image[0]) - 1:
-        if image[row_index][col_index] == 0 and image[row_index][col_index + 1] == 1:
-            return True
-    return False
-
-
-def check_adjacent_vertical(image, row_index, col_index):
-    """
-    Checks if a pixel has an adjacent pixel with the value of 1 that is above or below.
-
-    :param image: 2D list of an unflattened image.
-    :param row_index: Integer representing the row index of image.
-    :param col_index: Integer representing the column index of image.
-    :return: Boolean.
-    """
-    # when checking down, make sure we don't arrive to the last row
-    if row_index < len(image) - 1:
-        if image[row_index][col_index] == 0 and image[row_index + 1][col_index] == 1:
-            return True
-    # when checking up, make sure we don't arrive to the top row
-    if row_index > 0:
-        if image[row_index][col_index] == 0 and image[row_index - 1][col_index] == 1:
-            return True
-
-    return False
-
-
-def pixel_flip(
-    lst: list[int], orig_lst: list[int], budget: int, results: list, i: int = 0
-) -> None:
-    """
-    Uses recursion to generate all possible combinations of flipped arrays where
-    a pixel was a 0 and there was an adjacent pixel with the value of 1.
-
-    :param lst: 1D list of integers representing a flattened image.
-    :param orig_lst: 1D list of integers representing the original flattened image.
-    :param budget: Integer representing the number of pixels that can be flipped.
-    :param results: List of 1D lists of integers representing all possible combinations of flipped arrays, initially empty.
-    :param i: Integer representing the index of the pixel in question.
-    :return: None.
-    """
-    # copy() is used otherwise original list and changed list will be referring the same object
-    # copy() is also used to ensure any modifications made inside the func, would stay in the func
-    orignal_list = orig_lst.copy()
-    changed_list = lst.copy()
-
-    # the base case has two conditions that need to be met, or the recursion will be stopped
-    # 1) checks if budget is not 0
-    # 2) checks for the possible flips that can be done to the image
-    while i < len(orignal_list) and budget > 0:
-        # checks if the value is adjacent or not from the original_list
-        if check_adjacent_for_one(orignal_list, i):
-            # create a copy() again because we're trying to find all possibilities
-            # keeping it as changed_list will limit the possibilities found, as it creates a reference to the same object in memory (any modifications made in new_changed_list would also modify changed_list)
-            # this is our changed state (new_changed_list, results)
-            new_changed_list = changed_list.copy()
-            new_changed_list[i] = 1
-            results.append(new_changed_list)
-            # recursion is inside the while loop and not outside because we want to generate all possibilities
-            # keeping it outside, meant we generate flipped arrays for the first pixel that met the condition
-            pixel_flip(new_changed_list, orignal_list, budget - 1, results, i + 1)
-        i += 1
-
-
-def write_image(
-    orig_image: list[list[int]], new_image: list[list[int]], file_name: str
-) -> None:
-    """
-    Writes a newly generated image into a file where the modified pixels are marked as 'X'.
-
-    :param orig_image: 2D list of integers representing the original image.
-    :param new_image: 2D list of integers representing a newly generated image.
-    :param file_name: String representing the name of the file.
-    :return: None.
-    """
-    # new_row is responsible to hold the values of each row
-    new_row = ""
-
-    # use w, since we are writing
-    with open(file_name, "w") as f:
-        for row_index in range(len(orig_image)):
-            for col_index in range(len(orig_image[0])):
-                # check if we shoud add an X or the original value of the cell
-                # The condition is if the original image and new image are identical or not when looking at the same position of the row and column for each image
-                if orig_image[row_index][col_index] != new_image[row_index][col_index]:
-                    new_row += "X"
-                else:
-                    new_row += str(orig_image[row_index][col_index])
-                # check when the length of the new_row is the same as length of a row in an image such as original image
-                # if it is, we want to add a new line, and write it, and reset row back to an empty string
-                if len(new_row) == len(orig_image[0]):
-                    f.write(new_row + "\n")
-                    new_row = ""
-        # a final write for the last new_row since the for loop will end before the last new_row can be written
-        f.write(new_row)
-
-
-def generate_new_images(image: list[list[int]], budget: int) -> list[list[list[int]]]:
-    """
-    Generates all possible new images that can be generated within the budget.
-
-    :param image: 2D list of integers representing an image.
-    :param budget: Integer representing the number of pixels that can be flipped.
-    :return: List of 2D lists of integers representing all possible new images.
-    """
-    # grab all the flipped possibilities
-    flipped_possibilities = []
-    flat_image = flatten_image(image)
-    pixel_flip(flat_image, flat_image, budget, flipped_possibilities)
-
-    # new list as we need to return a 3D array
-    all_new_possible_images_list = []
-
-    # find the original image number from predict number
-    original_image_number = predict_number(image)
-
-    # form the flipped_possibilities into unflatten image (2D array) and add it to all_new_possible_images_list
-    for possibility in flipped_possibilities:
-        new_image = unflatten_image(possibility)
-        # find the new image number from predict number
-        new_image_number = predict_number(new_image)
-        # compare if the image numbers are the same, as we only want to add possibilities with the same predicted number
-        if new_image_number == original_image_number:
-            all_new_possible_images_list.append(new_image)
-
-    return all_new_possible_images_list
-
-
-if __name__ == "__main__":
-    image = read_image("image.txt")
-    new_images = generate_new_images(image, 2)
-    print(f"Number of new images generated: {len(new_images)}")
-    # Write first image to test generation
-    write_image(image, new_images[0], "new_image_1.txt")
+from __future__ import annotations
+import argparse
+import glob
+import heapq
+import os
+import random
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice, tee
+from math import comb
+from operator import add, sub
+import ai
+from ai import Model, QuantizedModel, argmax, load_model, read_binary_model, read_image
+from cache import PredictionCache
+from dataset import Dataset
+
+
+class BitImage:
+    """
+    A binary image packed into a bytearray, 8 pixels per byte.
+
+    Pixels are addressed by their flat index, like in a flattened image. Indexing a BitImage by row gives that row as
+    a list, and iterating gives the rows, so it can be passed where a 2D list of integers is expected.
+    """
+
+    __slots__ = ("height", "width", "bits")
+
+    def __init__(self, height: int, width: int, bits: bytearray | None = None) -> None:
+        """
+        :param height: Integer representing the number of rows.
+        :param width: Integer representing the number of columns.
+        :param bits: Bytearray holding the packed pixels, pixel i in bit i % 8 of byte i // 8, all 0 when not given.
+        """
+        self.height = height
+        self.width = width
+        self.bits = bytearray((height * width + 7) // 8) if bits is None else bits
+
+    @classmethod
+    def from_image(cls, image: list[list[int]]) -> BitImage:
+        """
+        Packs a 2D list of 0s and 1s.
+
+        :param image: 2D list of integers representing an image.
+        :return: BitImage with the same pixels.
+        """
+        return cls.from_flat(flatten_image(image), len(image[0]) if image else 0)
+
+    @classmethod
+    def from_flat(cls, flat_image: list[int], width: int) -> BitImage:
+        """
+        Packs a flattened image of 0s and 1s.
+
+        :param flat_image: 1D list of integers representing a flattened image.
+        :param width: Integer representing the number of columns of the image.
+        :return: BitImage with the same pixels.
+        """
+        # the bit of each set pixel, added up into one integer and written out in one go
+        value = sum(1 << idx for idx, pixel in enumerate(flat_image) if pixel)
+        bits = bytearray(value.to_bytes((len(flat_image) + 7) // 8, "little"))
+        return cls(len(flat_image) // width if width else 0, width, bits)
+
+    def get(self, idx: int) -> int:
+        """
+        :param idx: Integer representing the flat index of a pixel.
+        :return: Integer, the value of the pixel.
+        """
+        return (self.bits[idx >> 3] >> (idx & 7)) & 1
+
+    def set(self, idx: int, value: int) -> None:
+        """
+        :param idx: Integer representing the flat index of a pixel.
+        :param value: Integer, the new value of the pixel.
+        :return: None.
+        """
+        if value:
+            self.bits[idx >> 3] |= 1 << (idx & 7)
+        else:
+            self.bits[idx >> 3] &= ~(1 << (idx & 7)) & 0xFF
+
+    def flipped(self, flipped: tuple[int, ...]) -> BitImage:
+        """
+        Builds a copy of the image where the given pixels are flipped to 1, like flip_pixels.
+
+        :param flipped: Tuple of integers representing the flat indices of the pixels to flip.
+        :return: New BitImage.
+        """
+        new_image = BitImage(self.height, self.width, self.bits.copy())
+        for idx in flipped:
+            new_image.set(idx, 1)
+        return new_image
+
+    def diff(self, other: BitImage) -> list[int]:
+        """
+        Finds the pixels that differ between two images of the same size, by XOR-ing their bits.
+
+        :param other: BitImage to compare with.
+        :return: Sorted list of integers representing the flat indices of the differing pixels.
+        """
+        value = int.from_bytes(self.bits, "little") ^ int.from_bytes(other.bits, "little")
+        indices = []
+        while value:
+            lowest = value & -value
+            indices.append(lowest.bit_length() - 1)
+            value ^= lowest
+        return indices
+
+    def to_flat(self) -> list[int]:
+        """
+        :return: 1D list of integers representing the flattened image.
+        """
+        value = int.from_bytes(self.bits, "little")
+        return [(value >> idx) & 1 for idx in range(self.height * self.width)]
+
+    def to_image(self) -> list[list[int]]:
+        """
+        :return: 2D list of integers representing the image.
+        """
+        flat_image = self.to_flat()
+        return [flat_image[idx : idx + self.width] for idx in range(0, len(flat_image), self.width)]
+
+    def __getitem__(self, row_index: int) -> list[int]:
+        if not -self.height <= row_index < self.height:
+            raise IndexError("BitImage row index out of range")
+        start = (row_index % self.height) * self.width
+        return [self.get(idx) for idx in range(start, start + self.width)]
+
+    def __len__(self) -> int:
+        return self.height
+
+    def __iter__(self) -> Iterator[list[int]]:
+        return iter(self.to_image())
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, BitImage):
+            return NotImplemented
+        return (self.height, self.width, self.bits) == (other.height, other.width, other.bits)
+
+    def __hash__(self) -> int:
+        return hash((self.height, self.width, bytes(self.bits)))
+
+    def __repr__(self) -> str:
+        return f"BitImage({self.height}, {self.width}, {self.bits!r})"
+
+
+def flatten_image(image: list[list[int]] | BitImage) -> list[int]:
+    """
+    Flattens a 2D list into a 1D list.
+
+    :param image: 2D list of integers or BitImage representing an image.
+    :return: 1D list of integers representing a flattened image.
+    """
+    if isinstance(image, BitImage):
+        return image.to_flat()
+    return [pixel for row in image for pixel in row]
+
+
+def unflatten_image(flat_image: list[int] | BitImage, width: int | None = None) -> list[list[int]]:
+    """
+    Unflattens a 1D list into a 2D list.
+
+    :param flat_image: 1D list of integers or BitImage representing a flattened image.
+    :param width: Integer representing the number of columns, for a list assumed square when not given.
+    :return: 2D list of integers.
+    """
+    # a BitImage already knows its rows and columns
+    if isinstance(flat_image, BitImage):
+        return flat_image.to_image()
+
+    # without a width, the 2d list is taken to have the same amount of rows and columns
+    dimensions = int(len(flat_image) ** 0.5) if width is None else width
+    # hold values of each row
+    row = []
+    # hold all the row arrays into one array
+    unflatten_list = []
+
+    # add row to unflatten_list
+    # idx is incremented by dimensions, as that shows the limit of how many items can be in each row
+    for idx in range(0, len(flat_image), dimensions):
+        row = flat_image[idx : idx + dimensions]
+        unflatten_list.append(row)
+
+    return unflatten_list
+
+
+def image_width(image: list[list[int]] | BitImage) -> int:
+    """
+    :param image: 2D list of integers or BitImage representing an image.
+    :return: Integer representing the number of columns of the image.
+    """
+    if isinstance(image, BitImage):
+        return image.width
+    return len(image[0]) if image else 0
+
+
+def check_adjacent_for_one(flat_image: list[int] | BitImage, flat_pixel: int, width: int | None = None) -> bool:
+    """
+    Checks if a pixel has an adjacent pixel with the value of 1.
+
+    :param flat_image: 1D list of integers or BitImage representing a flattened image.
+    :param flat_pixel: Integer representing the index of the pixel in question.
+    :param width: Integer representing the number of columns, for a list assumed square when not given.
+    :return: Boolean.
+    """
+
+    # make the image unflat so we can see the adjacent values, a BitImage can be indexed by row as it is
+    image = flat_image if isinstance(flat_image, BitImage) else unflatten_image(flat_image, width)
+    HEIGHT = len(image)
+    WIDTH = len(image[0])
+
+    unflatten_row_index = int(flat_pixel / WIDTH)
+    unflatten_col_index = flat_pixel % WIDTH
+    is_adjacent = False
+
+    # make sure whichever row and column index we are looking, it is valid by being less than the dimensions of unflatten image
+    if unflatten_row_index < HEIGHT and unflatten_col_index < WIDTH:
+        # check if value is adjacent left, right or vertical
+        if (
+            check_adjacent_left(image, unflatten_row_index, unflatten_col_index)
+            or check_adjacent_right(image, unflatten_row_index, unflatten_col_index)
+            or check_adjacent_vertical(image, unflatten_row_index, unflatten_col_index)
+        ):
+            is_adjacent = True
+
+    return is_adjacent
+
+
+def check_adjacent_left(image, row_index, col_index):
+    """
+    Checks if a pixel has an adjacent pixel with the value of 1 to the left.
+
+    :param image: 2D list of an unflattened image, or a BitImage.
+    :param row_index: Integer representing the row index of image.
+    :param col_index: Integer representing the column index of image.
+    :return: Boolean.
+    """
+    # make sure col_index isn't 0 (i.e., the leftmost column), since there is no pixel to the left of it
+    if col_index != 0:
+        if image[row_index][col_index] == 0 and image[row_index][col_index - 1] == 1:
+            return True
+    return False
+
+
+def check_adjacent_right(image, row_index, col_index):
+    """
+    Checks if a pixel has an adjacent pixel with the value of 1 to the right.
+
+    :param image: 2D list of an unflattened image, or a BitImage.
+    :param row_index: Integer representing the row index of image.
+    :param col_index: Integer representing the column index of image.
+    :return: Boolean.
+    """
+    # make sure col_index isn't the last index of the `row, since that would cause the index to be out of the array's range
+    if col_index != len(image[0]) - 1:
+        if image[row_index][col_index] == 0 and image[row_index][col_index + 1] == 1:
+            return True
+    return False
+
+
+def check_adjacent_vertical(image, row_index, col_index):
+    """
+    Checks if a pixel has an adjacent pixel with the value of 1 that is above or below.
+
+    :param image: 2D list of an unflattened image, or a BitImage.
+    :param row_index: Integer representing the row index of image.
+    :param col_index: Integer representing the column index of image.
+    :return: Boolean.
+    """
+    # when checking down, make sure we don't arrive to the last row
+    if row_index < len(image) - 1:
+        if image[row_index][col_index] == 0 and image[row_index + 1][col_index] == 1:
+            return True
+    # when checking up, make sure we don't arrive to the top row
+    if row_index > 0:
+        if image[row_index][col_index] == 0 and image[row_index - 1][col_index] == 1:
+            return True
+
+    return False
+
+
+# row and column offsets of the neighbours of a pixel, for the neighbourhoods that can be given by their size
+NEIGHBOURHOODS = {
+    4: ((0, -1), (0, 1), (-1, 0), (1, 0)),
+    8: ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)),
+}
+
+
+def neighbour_offsets(neighbourhood: int | Iterable[tuple[int, int]]) -> tuple[tuple[int, int], ...]:
+    """
+    :param neighbourhood: 4 or 8 for the pixels sharing an edge or a corner, or the (row, column) offsets of a stencil.
+    :return: Tuple of (row, column) offsets of the neighbours of a pixel.
+    """
+    if isinstance(neighbourhood, int):
+        if neighbourhood not in NEIGHBOURHOODS:
+            raise ValueError(f"unknown neighbourhood {neighbourhood}, expected 4, 8 or a list of offsets")
+        return NEIGHBOURHOODS[neighbourhood]
+    return tuple((row, col) for row, col in neighbourhood)
+
+
+@lru_cache(maxsize=32)
+def neighbour_table(height: int, width: int, offsets: tuple[tuple[int, int], ...]) -> tuple[tuple[int, ...], ...]:
+    """
+    Precomputes where the neighbours of every pixel are, once per image size and neighbourhood.
+
+    :param height: Integer representing the number of rows of the images.
+    :param width: Integer representing the number of columns of the images.
+    :param offsets: Tuple of (row, column) offsets returned by neighbour_offsets.
+    :return: Tuple with, per offset, the flat index of that neighbour of each pixel, or height * width for a
+             neighbour outside the image, which points at a 0 appended to the flattened image.
+    """
+    outside = height * width
+    return tuple(
+        tuple(
+            (row + row_offset) * width + col + col_offset
+            if 0 <= row + row_offset < height and 0 <= col + col_offset < width
+            else outside
+            for row in range(height)
+            for col in range(width)
+        )
+        for row_offset, col_offset in offsets
+    )
+
+
+def flippable_pixels(
+    flat_image: list[int] | BitImage, width: int | None = None, neighbourhood: int | Iterable[tuple[int, int]] = 4
+) -> list[int]:
+    """
+    Finds every pixel that is 0 and has a neighbour with the value of 1, in one pass over the image.
+
+    With the default 4-neighbourhood, these are the pixels check_adjacent_for_one accepts. Instead of unflattening
+    the image for each pixel, every pixel with the value of 1 marks the pixels it is a neighbour of, read from the
+    neighbour_table of the mirrored offsets, so the cost grows linearly with the number of pixels.
+
+    :param flat_image: 1D list of integers or BitImage representing a flattened image.
+    :param width: Integer representing the number of columns, for a list assumed square when not given.
+    :param neighbourhood: 4, 8 or the (row, column) offsets of the neighbours of a pixel, see neighbour_offsets.
+    :return: Sorted list of integers representing the indices of the pixels that can be flipped.
+    """
+    if isinstance(flat_image, BitImage):
+        width = flat_image.width
+        flat_image = flat_image.to_flat()
+    elif width is None:
+        width = int(len(flat_image) ** 0.5)
+    height = len(flat_image) // width if width else 0
+
+    # pixel p has a neighbour q at offset (r, c) when q has p as its neighbour at offset (-r, -c)
+    mirrored = tuple((-row_offset, -col_offset) for row_offset, col_offset in neighbour_offsets(neighbourhood))
+    ones = [idx for idx, pixel in enumerate(flat_image) if pixel == 1]
+    # one flag per pixel, plus one for the neighbours outside the image
+    has_one = bytearray(len(flat_image) + 1)
+    for sources in neighbour_table(height, width, mirrored):
+        for idx in ones:
+            has_one[sources[idx]] = 1
+
+    return [idx for idx, (pixel, flag) in enumerate(zip(flat_image, has_one)) if flag and pixel == 0]
+
+
+def iter_flip_combinations(flippable: list[int], budget: int) -> Iterator[tuple[int, ...]]:
+    """
+    Generates every combination of 1 up to budget pixels out of the flippable pixels, without recursion.
+
+    Combinations come in lexicographic order of their index tuples, which means every combination is directly
+    followed by the combinations extending it, e.g. (a,), (a, b), (a, b, c), (a, b, d), (a, c), ...
+    This is the order the recursive pixel_flip has always produced.
+
+    :param flippable: Sorted list of integers representing the indices of the pixels that can be flipped.
+    :param budget: Integer representing the number of pixels that can be flipped.
+    :return: Generator of tuples of integers, each holding the increasing indices of the flipped pixels.
+    """
+    # positions holds, for the current combination, the position in flippable of each flipped pixel
+    positions = [0] if budget > 0 and flippable else []
+
+    while positions:
+        yield tuple([flippable[position] for position in positions])
+
+        # extend the combination with the next pixel while the budget allows it
+        if len(positions) < budget and positions[-1] + 1 < len(flippable):
+            positions.append(positions[-1] + 1)
+            continue
+
+        # otherwise move the last pixel on, dropping it when it runs past the end
+        while positions:
+            positions[-1] += 1
+            if positions[-1] < len(flippable):
+                break
+            positions.pop()
+
+
+def count_new_images(
+    image: list[list[int]], budget: int, neighbourhood: int | Iterable[tuple[int, int]] = 4
+) -> int:
+    """
+    Counts the combinations of flipped pixels within the budget, without generating any of them.
+
+    This is the number of candidates generate_new_images classifies, before it keeps those with the same predicted number.
+
+    :param image: 2D list of integers representing an image.
+    :param budget: Integer representing the number of pixels that can be flipped.
+    :param neighbourhood: 4, 8 or the (row, column) offsets of the neighbours of a pixel, see flippable_pixels.
+    :return: Integer representing the number of candidate images.
+    """
+    num_flippable = len(flippable_pixels(flatten_image(image), image_width(image), neighbourhood))
+    return sum(comb(num_flippable, size) for size in range(1, budget + 1))
+
+
+def pixel_flip(
+    lst: list[int],
+    orig_lst: list[int],
+    budget: int,
+    results: list,
+    i: int = 0,
+    flippable: list[int] | None = None,
+) -> None:
+    """
+    Generates all possible combinations of flipped arrays where
+    a pixel was a 0 and there was an adjacent pixel with the value of 1.
+
+    The combinations are appended in the order of iter_flip_combinations.
+
+    :param lst: 1D list of integers representing a flattened image.
+    :param orig_lst: 1D list of integers representing the original flattened image.
+    :param budget: Integer representing the number of pixels that can be flipped.
+    :param results: List of 1D lists of integers representing all possible combinations of flipped arrays, initially empty.
+    :param i: Integer representing the index of the first pixel that may be flipped.
+    :param flippable: Sorted list of the pixels of orig_lst that can be flipped, computed with flippable_pixels when not given.
+    :return: None.
+    """
+    # the pixels that can be flipped only depend on the original image, so they are found once
+    if flippable is None:
+        flippable = flippable_pixels(orig_lst)
+
+    # only the flippable pixels from index i onwards are possible flips for the image
+    # each combination is a tuple of indices, and lst is only copied once for every combination added to results
+    for flipped in iter_flip_combinations(flippable[bisect_left(flippable, i) :], budget):
+        results.append(flip_pixels(lst, flipped))
+
+
+def render_image(
+    orig_image: list[list[int]] | BitImage, new_image: list[list[int]] | BitImage
+) -> str:
+    """
+    Renders a newly generated image as the text write_image writes, where the modified pixels are marked as 'X'.
+
+    :param orig_image: 2D list of integers or BitImage representing the original image.
+    :param new_image: 2D list of integers or BitImage representing a newly generated image.
+    :return: String with one line per row of the image.
+    """
+    # unpack BitImages once, rather than rebuilding a row for every pixel below
+    orig_image = unflatten_image(orig_image) if isinstance(orig_image, BitImage) else orig_image
+    new_image = unflatten_image(new_image) if isinstance(new_image, BitImage) else new_image
+
+    # each row is built in one join, an X wherever the new image differs from the original
+    return "".join(
+        "".join("X" if new != orig else str(orig) for orig, new in zip(orig_row, new_row)) + "\n"
+        for orig_row, new_row in zip(orig_image, new_image)
+    )
+
+
+def write_image(
+    orig_image: list[list[int]] | BitImage,
+    new_image: list[list[int]] | BitImage,
+    file_name: str,
+) -> None:
+    """
+    Writes a newly generated image into a file where the modified pixels are marked as 'X'.
+
+    :param orig_image: 2D list of integers or BitImage representing the original image.
+    :param new_image: 2D list of integers or BitImage representing a newly generated image.
+    :param file_name: String representing the name of the file.
+    :return: None.
+    """
+    # use w, since we are writing
+    with open(file_name, "w") as f:
+        f.write(render_image(orig_image, new_image))
+
+
+class ImageArchiveWriter:
+    """
+    Appends many generated images of one original image to a single text file, each rendered as by write_image.
+
+    Next to the archive, an index file (the archive name plus ".idx") holds the byte offset of every image as
+    little-endian 64-bit integers, so ImageArchive can read image k without scanning the archive. Opening an existing
+    archive appends to it.
+    """
+
+    def __init__(self, file_name: str, orig_image: list[list[int]] | BitImage) -> None:
+        """
+        :param file_name: String representing the name of the archive file.
+        :param orig_image: 2D list of integers or BitImage representing the original image.
+        """
+        orig_image = unflatten_image(orig_image) if isinstance(orig_image, BitImage) else orig_image
+        self.orig_flat_image = flatten_image(orig_image)
+        self.width = len(orig_image[0])
+        # the original image rendered once, flipped pixels are then marked by overwriting single bytes
+        self.rendered = render_image(orig_image, orig_image).encode("ascii")
+        self.data_file = open(file_name, "ab")
+        self.index_file = open(file_name + ".idx", "ab")
+
+    def add(self, new_image: list[list[int]] | BitImage) -> None:
+        """
+        Appends a newly generated image.
+
+        :param new_image: 2D list of integers or BitImage representing a newly generated image.
+        :return: None.
+        """
+        new_flat_image = flatten_image(new_image)
+        self.add_flipped(
+            tuple(
+                idx
+                for idx, (orig, new) in enumerate(zip(self.orig_flat_image, new_flat_image))
+                if orig != new
+            )
+        )
+
+    def add_flipped(self, flipped: tuple[int, ...]) -> None:
+        """
+        Appends the image where the given pixels of the original image are flipped, e.g. from iter_flipped_images.
+
+        :param flipped: Tuple of integers representing the flat indices of the flipped pixels.
+        :return: None.
+        """
+        rendered = bytearray(self.rendered)
+        for idx in flipped:
+            # every row before the pixel adds one newline to its offset in the text
+            rendered[idx + idx // self.width] = ord("X")
+        self.index_file.write(self.data_file.tell().to_bytes(8, "little"))
+        self.data_file.write(rendered)
+
+    def close(self) -> None:
+        """
+        Flushes the images and their offsets to disk and closes both files.
+
+        :return: None.
+        """
+        self.data_file.close()
+        self.index_file.close()
+
+    def __enter__(self) -> ImageArchiveWriter:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+class ImageArchive:
+    """
+    Reads the images of an archive written by ImageArchiveWriter, each one by its position and without scanning the others.
+    """
+
+    def __init__(self, file_name: str) -> None:
+        """
+        :param file_name: String representing the name of the archive file.
+        """
+        self.file_name = file_name
+        self.offsets = array("Q")
+        with open(file_name + ".idx", "rb") as index_file:
+            self.offsets.frombytes(index_file.read())
+        if sys.byteorder != "little":
+            self.offsets.byteswap()
+        self.size = os.path.getsize(file_name)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, k: int) -> str:
+        """
+        :param k: Integer representing the position of the image in the archive.
+        :return: String with the image as write_image would have written it.
+        """
+        start = self.offsets[k]
+        end = self.offsets[k + 1] if k + 1 < len(self.offsets) else self.size
+        with open(self.file_name, "rb") as data_file:
+            data_file.seek(start)
+            return data_file.read(end - start).decode("ascii")
+
+
+def flip_pixels(flat_image: list[int], flipped: tuple[int, ...]) -> list[int]:
+    """
+    Builds a copy of a flattened image where the given pixels are flipped to 1.
+
+    :param flat_image: 1D list of integers representing the original flattened image.
+    :param flipped: Tuple of integers representing the indices of the pixels to flip.
+    :return: 1D list of integers representing the new flattened image.
+    """
+    new_flat_image = flat_image.copy()
+    for idx in flipped:
+        new_flat_image[idx] = 1
+    return new_flat_image
+
+
+def iter_flipped_images(
+    image: list[list[int]], budget: int, neighbourhood: int | Iterable[tuple[int, int]] = 4
+) -> Iterator[tuple[int, ...]]:
+    """
+    Lazily generates every combination of flipped pixels within the budget, in the same order as pixel_flip.
+
+    :param image: 2D list of integers representing an image.
+    :param budget: Integer representing the number of pixels that can be flipped.
+    :param neighbourhood: 4, 8 or the (row, column) offsets of the neighbours of a pixel, see flippable_pixels.
+    :return: Generator of tuples of integers, each holding the increasing flat indices of the flipped pixels.
+    """
+    flat_image = flatten_image(image)
+    # the pixels that can be flipped only depend on the original image, so find them once
+    flippable = flippable_pixels(flat_image, image_width(image), neighbourhood)
+    yield from iter_flip_combinations(flippable, budget)
+
+
+def flip_key(flipped: Iterable[int]) -> tuple[int, ...]:
+    """
+    Identifies a new image by the pixels flipped to make it, whatever order or repeats they were given in.
+
+    Keys sort in the order the new images are generated in, for every budget: sorted() of any keys is the order of
+    iter_flip_combinations.
+
+    :param flipped: Iterable of integers representing the flat indices of the flipped pixels.
+    :return: Tuple of the distinct indices in increasing order.
+    """
+    return tuple(sorted(set(flipped)))
+
+
+def flip_mask(flipped: Iterable[int]) -> int:
+    """
+    Identifies a new image by an integer bitmask of its flipped pixels, the compact, hashable form of flip_key.
+
+    :param flipped: Iterable of integers representing the flat indices of the flipped pixels.
+    :return: Integer with bit i set for every flipped pixel i.
+    """
+    mask = 0
+    for idx in flipped:
+        mask |= 1 << idx
+    return mask
+
+
+def mask_key(mask: int) -> tuple[int, ...]:
+    """
+    :param mask: Integer returned by flip_mask.
+    :return: Tuple of integers, the flip_key of the same flipped pixels.
+    """
+    key = []
+    while mask:
+        lowest = mask & -mask
+        key.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return tuple(key)
+
+
+class ResultStore:
+    """
+    The distinct new images of one original image, held as their flip_key instead of as 2D lists.
+
+    Adding a result and checking for one take constant time whatever run or budget it came from, so the results of
+    several runs merge without duplicates. Iterating always gives the keys in canonical order, sorted as flip_key
+    describes, so two stores with the same results iterate identically.
+    """
+
+    def __init__(self, orig_image: list[list[int]] | BitImage, keys: Iterable[tuple[int, ...]] = ()) -> None:
+        """
+        :param orig_image: 2D list of integers or BitImage representing the original image.
+        :param keys: Iterable of flip_key tuples to start with.
+        """
+        self.orig_image = orig_image if isinstance(orig_image, BitImage) else BitImage.from_image(orig_image)
+        self.keys = set(keys)
+
+    def add(self, flipped: Iterable[int]) -> bool:
+        """
+        :param flipped: Iterable of integers representing the flat indices of the flipped pixels.
+        :return: Boolean, True when the result was not in the store yet.
+        """
+        key = flip_key(flipped)
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        return True
+
+    def add_image(self, new_image: list[list[int]] | BitImage) -> bool:
+        """
+        Adds a new image by comparing it with the original image.
+
+        :param new_image: 2D list of integers or BitImage representing the new image.
+        :return: Boolean, True when the result was not in the store yet.
+        """
+        if not isinstance(new_image, BitImage):
+            new_image = BitImage.from_image(new_image)
+        return self.add(new_image.diff(self.orig_image))
+
+    def update(self, results: Iterable[Iterable[int]]) -> int:
+        """
+        :param results: Iterable of the flipped pixels of each result, e.g. iter_new_flips.
+        :return: Integer representing the number of results that were not in the store yet.
+        """
+        size = len(self.keys)
+        self.keys.update(map(flip_key, results))
+        return len(self.keys) - size
+
+    def merge(self, other: ResultStore) -> int:
+        """
+        :param other: ResultStore of the same original image.
+        :return: Integer representing the number of results of other that were not in this store yet.
+        """
+        if other.orig_image != self.orig_image:
+            raise ValueError("cannot merge the results of different original images")
+        size = len(self.keys)
+        self.keys |= other.keys
+        return len(self.keys) - size
+
+    def difference(self, other: ResultStore) -> list[tuple[int, ...]]:
+        """
+        :param other: ResultStore of the same original image.
+        :return: List of the keys in this store but not in other, in canonical order.
+        """
+        return sorted(self.keys - other.keys)
+
+    def images(self) -> Iterator[list[list[int]]]:
+        """
+        :return: Generator of 2D lists of integers representing the new images, in canonical order.
+        """
+        for key in self:
+            yield self.orig_image.flipped(key).to_image()
+
+    def __contains__(self, flipped: Iterable[int]) -> bool:
+        return flip_key(flipped) in self.keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __iter__(self) -> Iterator[tuple[int, ...]]:
+        return iter(sorted(self.keys))
+
+
+class _PrunedSearch:
+    """
+    Depth-first search over the combinations of flipped pixels that skips every subtree of combinations
+    that provably cannot keep the predicted number of the original image.
+
+    A subtree holds a combination and all its extensions by later flippable pixels. Flipping a pixel adds its
+    weight column to the first layer pre-activations, so over a subtree every pre-activation stays between the
+    combination's own value plus the most negative and the most positive total the remaining pixels could add.
+    Those bounds are carried through the network by Model.can_predict.
+    """
+
+    def __init__(
+        self,
+        model: Model,
+        flat_image: list[int],
+        budget: int,
+        flippable: list[int],
+        stop: Callable[[], bool] | None = None,
+    ) -> None:
+        self.model = model
+        self.stop = stop
+        self.flat_image = flat_image
+        self.budget = budget
+        self.original_image_number = argmax(model.inference(flat_image))
+        self.flippable = flippable
+        self.pre_activations = model.first_layer(flat_image)
+        self.columns = [model.columns[idx] for idx in self.flippable]
+
+        # for the pixels flippable[position:], per pre-activation:
+        # the sums of all negative and of all positive weights, and the smallest and largest weight
+        num_flippable = len(self.flippable)
+        zeros = [0.0] * len(self.pre_activations)
+        self.negative_sums = [zeros] * (num_flippable + 1)
+        self.positive_sums = [zeros] * (num_flippable + 1)
+        self.smallest = [zeros] * (num_flippable + 1)
+        self.largest = [zeros] * (num_flippable + 1)
+        for position in range(num_flippable - 1, -1, -1):
+            column = self.columns[position]
+            self.negative_sums[position] = [s + min(w, 0.0) for s, w in zip(self.negative_sums[position + 1], column)]
+            self.positive_sums[position] = [s + max(w, 0.0) for s, w in zip(self.positive_sums[position + 1], column)]
+            self.smallest[position] = [min(s, w) for s, w in zip(self.smallest[position + 1], column)]
+            self.largest[position] = [max(s, w) for s, w in zip(self.largest[position + 1], column)]
+
+    def can_keep_number(self, pre_activations: list[float], position: int, remaining: int) -> bool:
+        # adding at most `remaining` of the pixels flippable[position:] moves each pre-activation by no more than
+        # the sum of all weights with that sign, nor by more than `remaining` times the most extreme weight
+        lower = [
+            p + max(negative, remaining * smallest)
+            for p, negative, smallest in zip(pre_activations, self.negative_sums[position], self.smallest[position])
+        ]
+        upper = [
+            p + min(positive, remaining * largest)
+            for p, positive, largest in zip(pre_activations, self.positive_sums[position], self.largest[position])
+        ]
+        return self.model.can_predict(self.original_image_number, lower, upper)
+
+    def shard(self, position: int) -> tuple[list[tuple[int, ...]], int, int]:
+        """
+        Searches the combinations whose first flipped pixel is flippable[position].
+
+        :param position: Integer representing the position of the first flipped pixel in the flippable pixels.
+        :return: Tuple of the kept combinations, in the order of iter_flip_combinations, the number of classified
+                 combinations and the number of pruned ones.
+        """
+        kept = []
+        num_classified = 0
+        num_pruned = 0
+        num_flippable = len(self.flippable)
+
+        # every entry stands for the combination `flipped` extended by flippable[position]
+        # the pre-activations are those of `flipped`, and siblings tells whether flippable[position + 1] comes next
+        stack = [(self.pre_activations, (), position, False)]
+        while stack:
+            if self.stop is not None and self.stop():
+                break
+            pre_activations, flipped, position, siblings = stack.pop()
+            if siblings and position + 1 < num_flippable:
+                stack.append((pre_activations, flipped, position + 1, True))
+
+            new_flipped = flipped + (self.flippable[position],)
+            new_pre_activations = list(map(add, pre_activations, self.columns[position]))
+            remaining = min(self.budget - len(new_flipped), num_flippable - position - 1)
+
+            # a whole subtree is skipped once no combination in it can keep the number
+            if remaining > 0 and not self.can_keep_number(new_pre_activations, position + 1, remaining):
+                num_pruned += sum(comb(num_flippable - position - 1, size) for size in range(remaining + 1))
+                continue
+
+            new_image_number = self.model.predict_first_layer(self.flat_image, new_pre_activations, new_flipped)
+            num_classified += 1
+            if new_image_number == self.original_image_number:
+                kept.append(new_flipped)
+            if remaining > 0:
+                stack.append((new_pre_activations, new_flipped, position + 1, True))
+
+        return kept, num_classified, num_pruned
+
+
+class GenerationStats:
+    """
+    Counters and timers of generation runs, filled in by iter_new_images and generate_new_images when passed as stats.
+
+    The counters are the combinations enumerated, classified, kept and pruned, and the number of times weights were
+    loaded from disk. The timers hold the seconds spent in each stage: "eligibility" finds the flippable pixels,
+    "enumeration" produces the combinations, "classification" predicts their numbers and "materialization" builds the
+    kept ones into images. The pruned search and worker processes enumerate while they classify, so there both are
+    timed as classification. Without stats, none of this is measured.
+    """
+
+    STAGES = ("eligibility", "enumeration", "classification", "materialization")
+
+    def __init__(self, callback: Callable[[GenerationStats], None] | None = None) -> None:
+        """
+        :param callback: Function called with the stats at the end of every run, including runs stopped early.
+        """
+        self.runs = 0
+        self.enumerated = 0
+        self.classified = 0
+        self.kept = 0
+        self.pruned = 0
+        self.weight_loads = 0
+        self.seconds = dict.fromkeys(self.STAGES, 0.0)
+        self.callback = callback
+
+    def as_dict(self) -> dict:
+        """
+        :return: Dictionary with every counter and the seconds of every stage.
+        """
+        return {
+            "runs": self.runs,
+            "enumerated": self.enumerated,
+            "classified": self.classified,
+            "kept": self.kept,
+            "pruned": self.pruned,
+            "weight_loads": self.weight_loads,
+            "seconds": dict(self.seconds),
+        }
+
+    def __repr__(self) -> str:
+        return f"GenerationStats({self.as_dict()})"
+
+
+def _timed(iterable: Iterable, stats: GenerationStats, stage: str, counter: str) -> Iterator:
+    # yields the items of iterable, adding the time spent producing them to the stage and counting them
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            stats.seconds[stage] += time.perf_counter() - start
+            return
+        stats.seconds[stage] += time.perf_counter() - start
+        setattr(stats, counter, getattr(stats, counter) + 1)
+        yield item
+
+
+def _timed_call(stats: GenerationStats | None, stage: str, function: Callable, *args: object) -> object:
+    if stats is None:
+        return function(*args)
+    start = time.perf_counter()
+    result = function(*args)
+    stats.seconds[stage] += time.perf_counter() - start
+    return result
+
+
+def _iter_pruned(search: _PrunedSearch, stats: GenerationStats | None = None) -> Iterator[tuple[int, ...]]:
+    if search.budget <= 0:
+        return
+    for position in range(len(search.flippable)):
+        start = time.perf_counter()
+        kept, num_classified, num_pruned = search.shard(position)
+        if stats is not None:
+            stats.seconds["classification"] += time.perf_counter() - start
+            stats.enumerated += num_classified
+            stats.classified += num_classified
+            stats.pruned += num_pruned
+        if search.stop is not None and search.stop():
+            return
+        yield from kept
+
+
+def search_flipped_images(
+    image: list[list[int]],
+    budget: int,
+    model: Model | None = None,
+    neighbourhood: int | Iterable[tuple[int, int]] = 4,
+) -> tuple[list[tuple[int, ...]], int]:
+    """
+    Finds the combinations of flipped pixels that keep the predicted number, pruning the ones that provably cannot.
+
+    The result is the same as classifying every combination of iter_flipped_images, in the same order.
+
+    :param image: 2D list of integers representing an image.
+    :param budget: Integer representing the number of pixels that can be flipped.
+    :param model: Preloaded Model used for predictions, defaults to the cached model from load_model().
+    :param neighbourhood: 4, 8 or the (row, column) offsets of the neighbours of a pixel, see flippable_pixels.
+    :return: Tuple of the list of kept combinations, as tuples of flat indices, and the number of pruned combinations.
+    """
+    if model is None:
+        model = load_model()
+
+    flat_image = flatten_image(image)
+    flippable = flippable_pixels(flat_image, image_width(image), neighbourhood)
+    stats = GenerationStats()
+    kept = list(_iter_pruned(_PrunedSearch(model, flat_image, budget, flippable), stats))
+    return kept, stats.pruned
+
+
+def _until(iterable: Iterable, stop: Callable[[], bool]) -> Iterator:
+    # yields the items of iterable until stop returns True, which is checked before every item
+    for item in iterable:
+        if stop():
+            return
+        yield item
+
+
+def _iter_same_number(
+    model: Model,
+    flat_image: list[int],
+    original_image_number: int,
+    combinations: Iterator[tuple[int, ...]],
+    stats: GenerationStats | None = None,
+    cache: PredictionCache | None = None,
+    width: int = 0,
+) -> Iterator[tuple[int, ...]]:
+    # one copy of the combinations feeds the predictions, the other is zipped back with them
+    # both are consumed in lockstep, so tee only ever buffers a single combination, or one chunk with a cache
+    flipped_for_prediction, flipped_for_images = tee(combinations)
+    if cache is None:
+        new_image_numbers = model.iter_predict_flipped(flat_image, flipped_for_prediction)
+    else:
+        new_image_numbers = cache.iter_predict_flipped(flat_image, width, flipped_for_prediction)
+    if stats is not None:
+        new_image_numbers = _timed(new_image_numbers, stats, "classification", "classified")
+
+    for flipped, new_image_number in zip(flipped_for_images, new_image_numbers):
+        # we only want possibilities with the same predicted number
+        if new_image_number == original_image_number:
+            yield flipped
+
+
+def _iter_shard(flippable: list[int], budget: int, position: int) -> Iterator[tuple[int, ...]]:
+    # the combinations whose first flipped pixel is flippable[position], in the order of iter_flip_combinations
+    first = (flippable[position],)
+    yield first
+    for rest in iter_flip_combinations(flippable[position + 1 :], budget - 1):
+        yield first + rest
+
+
+# state of a worker process of a generation pool: the model, set once per worker by _init_worker, and the pruned
+# search of the last image the worker was given shards of
+_worker_state: dict = {}
+
+
+def _init_worker(model: Model) -> None:
+    _worker_state.update(model=model, search_key=None, search=None)
+
+
+def generation_pool(model: Model, workers: int) -> ProcessPoolExecutor:
+    """
+    Starts a pool of worker processes for iter_new_flips, which receive the model once when they start.
+
+    One pool can serve the generations of any number of images classified with the same model, so a run over many
+    inputs only starts its workers once. Shut it down, or use it as a context manager, when the run is over.
+
+    :param model: Model or QuantizedModel the workers classify with; pass the same model to iter_new_flips.
+    :param workers: Integer representing the number of worker processes.
+    :return: ProcessPoolExecutor to pass as executor to iter_new_flips, iter_new_images or generate_new_images.
+    """
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model,))
+
+
+def _split_shards(num_flippable: int, budget: int, num_tasks: int) -> list[range]:
+    # splits the shards, one per first flipped pixel, into about num_tasks runs of consecutive shards holding about
+    # as many combinations each; the first shards hold the most, as the later pixels extend them
+    sizes = [
+        sum(comb(num_flippable - position - 1, size) for size in range(budget)) for position in range(num_flippable)
+    ]
+    target = sum(sizes) / num_tasks
+    tasks = []
+    start = 0
+    total = 0
+    for position, size in enumerate(sizes):
+        total += size
+        if total >= target * (len(tasks) + 1) or position == num_flippable - 1:
+            tasks.append(range(start, position + 1))
+            start = position + 1
+    return tasks
+
+
+def _generate_shards(
+    flat_image: list[int], flippable: list[int], budget: int, original_image_number: int, prune: bool, positions: range
+) -> tuple[list[tuple[int, ...]], int, int]:
+    # returns the kept combinations of the shards, in order, how many combinations were classified and how many were
+    # pruned
+    state = _worker_state
+    if prune:
+        # the search only depends on the image, so the shards of one image share it
+        key = (tuple(flat_image), tuple(flippable), budget)
+        if state["search_key"] != key:
+            state["search"] = _PrunedSearch(state["model"], flat_image, budget, flippable)
+            state["search_key"] = key
+        kept = []
+        num_classified = num_pruned = 0
+        for position in positions:
+            shard_kept, shard_classified, shard_pruned = state["search"].shard(position)
+            kept.extend(shard_kept)
+            num_classified += shard_classified
+            num_pruned += shard_pruned
+        return kept, num_classified, num_pruned
+    combinations = (combination for position in positions for combination in _iter_shard(flippable, budget, position))
+    kept = list(_iter_same_number(state["model"], flat_image, original_image_number, combinations))
+    num_classified = sum(
+        comb(len(flippable) - position - 1, size) for position in positions for size in range(budget)
+    )
+    return kept, num_classified, 0
+
+
+def iter_new_flips(
+    image: list[list[int]],
+    budget: int,
+    model: Model | None = None,
+    workers: int = 1,
+    prune: bool = False,
+    stats: GenerationStats | None = None,
+    cache: PredictionCache | None = None,
+    neighbourhood: int | Iterable[tuple[int, int]] = 4,
+    stop: Callable[[], bool] | None = None,
+    executor: ProcessPoolExecutor | None = None,
+) -> Iterator[tuple[int, ...]]:
+    """
+    Lazily generates the flipped pixels of the new images of iter_new_images, without building the images.
+
+    Every new image is identified by its tuple of flipped pixels, see flip_key. The tuples come in canonical order,
+    which is the order of sorted(), so results of separate runs can be merged and compared without building images.
+
+    With more than one worker, the combinations are split by their first flipped pixel into one shard per flippable
+    pixel, and the shards are classified in a pool of worker processes that each receive the model once. Shards are
+    merged back in order of their first pixel, so the results come out exactly as with a single worker. A pool from
+    generation_pool can be passed as executor to be shared by many runs; otherwise one is started for this run.
+
+    :param image: 2D list of integers representing an image.
+    :param budget: Integer representing the number of pixels that can be flipped.
+    :param model: Preloaded Model or QuantizedModel used for predictions, defaults to the cached load_model().
+    :param workers: Integer representing the number of worker processes, 1 runs everything in this process unless an
+                    executor is given; with an executor, pass the number of workers of its pool.
+    :param prune: Boolean, when True skips the combinations that provably change the number, see search_flipped_images.
+    :param stats: GenerationStats to add the counters and timers of this run to, nothing is measured when not given.
+    :param cache: PredictionCache to look the candidates up in before classifying them, with a single worker and
+                  without pruning; its model then makes the predictions.
+    :param neighbourhood: 4, 8 or the (row, column) offsets of the neighbours of a pixel, see flippable_pixels.
+    :param stop: Function returning True once the run should end early, called before every candidate is classified,
+                 or before every shard with more than one worker.
+    :param executor: Pool of worker processes from generation_pool(model, ...) to classify the shards in, whatever
+                     the number of workers; it is left running for later runs.
+    :return: Generator of tuples of integers, each holding the increasing flat indices of the flipped pixels.
+    """
+    weight_loads = ai.weight_loads
+
+    if cache is not None:
+        if workers > 1 or executor is not None or prune:
+            raise ValueError("a prediction cache can only be used with a single worker and without pruning")
+        if model is not None and model.fingerprint() != cache.model.fingerprint():
+            raise ValueError("the model differs from the model of the prediction cache")
+        model = cache.model
+
+    # load the model once, so every candidate below reuses the same parsed weights
+    if model is None:
+        model = load_model()
+    if prune and isinstance(model, QuantizedModel):
+        raise ValueError("pruning needs the float weights of a Model, not a QuantizedModel")
+
+    flat_image = flatten_image(image)
+    width = image_width(image)
+    original_image_number = model.predict(image)
+    # the pixels that can be flipped only depend on the original image, so find them once
+    flippable = _timed_call(stats, "eligibility", flippable_pixels, flat_image, width, neighbourhood)
+
+    if workers > 1 or executor is not None:
+        kept = _iter_same_number_parallel(
+            model, flat_image, flippable, original_image_number, budget, workers, prune, stats, stop, executor
+        )
+    elif prune:
+        search = _timed_call(stats, "eligibility", _PrunedSearch, model, flat_image, budget, flippable, stop)
+        kept = _iter_pruned(search, stats)
+    else:
+        combinations = iter_flip_combinations(flippable, budget)
+        if stop is not None:
+            combinations = _until(combinations, stop)
+        if stats is not None:
+            combinations = _timed(combinations, stats, "enumeration", "enumerated")
+        kept = _iter_same_number(model, flat_image, original_image_number, combinations, stats, cache, width)
+
+    if stats is None:
+        yield from kept
+        return
+
+    try:
+        for flipped in kept:
+            stats.kept += 1
+            yield flipped
+    finally:
+        stats.runs += 1
+        stats.weight_loads += ai.weight_loads - weight_loads
+        if stats.callback is not None:
+            stats.callback(stats)
+
+
+def iter_new_images(
+    image: list[list[int]],
+    budget: int,
+    model: Model | None = None,
+    workers: int = 1,
+    prune: bool = False,
+    stats: GenerationStats | None = None,
+    cache: PredictionCache | None = None,
+    neighbourhood: int | Iterable[tuple[int, int]] = 4,
+    stop: Callable[[], bool] | None = None,
+    executor: ProcessPoolExecutor | None = None,
+) -> Iterator[list[list[int]]]:
+    """
+    Lazily generates the new images of generate_new_images, one at a time and in the same order.
+
+    :param image: 2D list of integers representing an image.
+    :param budget: Integer representing the number of pixels that can be flipped.
+    :param model: Preloaded Model used for predictions, defaults to the cached model from load_model().
+    :param workers: Integer representing the number of worker processes, see iter_new_flips.
+    :param prune: Boolean, when True skips the combinations that provably change the number, see search_flipped_images.
+    :param stats: GenerationStats to add the counters and timers of this run to, nothing is measured when not given.
+    :param cache: PredictionCache to look the candidates up in before classifying them, see iter_new_flips.
+    :param neighbourhood: 4, 8 or the (row, column) offsets of the neighbours of a pixel, see flippable_pixels.
+    :param stop: Function returning True once the run should end early, see iter_new_flips.
+    :param executor: Pool of worker processes from generation_pool to classify in, see iter_new_flips.
+    :return: Generator of 2D lists of integers representing the new images.
+    """
+    flat_image = flatten_image(image)
+    width = image_width(image)
+    new_flips = iter_new_flips(image, budget, model, workers, prune, stats, cache, neighbourhood, stop, executor)
+
+    # only the possibilities that were kept are built into images
+    if stats is None:
+        for flipped in new_flips:
+            yield unflatten_image(flip_pixels(flat_image, flipped), width)
+        return
+
+    try:
+        for flipped in new_flips:
+            start = time.perf_counter()
+            new_image = unflatten_image(flip_pixels(flat_image, flipped), width)
+            stats.seconds["materialization"] += time.perf_counter() - start
+            yield new_image
+    finally:
+        # ends the run, and with it the stats, as soon as this generator is closed
+        new_flips.close()
+
+
+def _iter_same_number_parallel(
+    model: Model,
+    flat_image: list[int],
+    flippable: list[int],
+    original_image_number: int,
+    budget: int,
+    workers: int,
+    prune: bool,
+    stats: GenerationStats | None = None,
+    stop: Callable[[], bool] | None = None,
+    executor: ProcessPoolExecutor | None = None,
+) -> Iterator[tuple[int, ...]]:
+    if budget <= 0 or not flippable:
+        return
+
+    own_executor = executor is None
+    if own_executor:
+        executor = generation_pool(model, workers)
+    shards = []
+    try:
+        # the image travels with every task, so a shared pool can serve any image; a few tasks per worker keep them
+        # all busy without paying for one round trip per flippable pixel
+        for positions in _split_shards(len(flippable), budget, 4 * workers):
+            shards.append(
+                executor.submit(
+                    _generate_shards, flat_image, flippable, budget, original_image_number, prune, positions
+                )
+            )
+        # shards are taken in the order they were submitted, whichever worker finishes first
+        for shard in shards:
+            # the shards still waiting are cancelled below when the run is stopped
+            if stop is not None and stop():
+                return
+            start = time.perf_counter()
+            kept, num_classified, num_pruned = shard.result()
+            if stats is not None:
+                stats.seconds["classification"] += time.perf_counter() - start
+                stats.enumerated += num_classified
+                stats.classified += num_classified
+                stats.pruned += num_pruned
+            yield from kept
+    finally:
+        # a consumer that stops early should not wait for the remaining shards
+        for shard in shards:
+            shard.cancel()
+        if own_executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def generate_new_images(
+    image: list[list[int]],
+    budget: int,
+    model: Model | None = None,
+    workers: int = 1,
+    prune: bool = False,
+    stats: GenerationStats | None = None,
+    cache: PredictionCache | None = None,
+    neighbourhood: int | Iterable[tuple[int, int]] = 4,
+    executor: ProcessPoolExecutor | None = None,
+) -> list[list[list[int]]]:
+    """
+    Generates all possible new images that can be generated within the budget.
+
+    :param image: 2D list of integers representing an image.
+    :param budget: Integer representing the number of pixels that can be flipped.
+    :param model: Preloaded Model used for predictions, defaults to the cached model from load_model().
+    :param workers: Integer representing the number of worker processes, see iter_new_flips.
+    :param prune: Boolean, when True skips the combinations that provably change the number, see search_flipped_images.
+    :param stats: GenerationStats to add the counters and timers of this run to, see iter_new_images.
+    :param cache: PredictionCache to look the candidates up in before classifying them, see iter_new_flips.
+    :param neighbourhood: 4, 8 or the (row, column) offsets of the neighbours of a pixel, see flippable_pixels.
+    :param executor: Pool of worker processes from generation_pool to classify in, see iter_new_flips.
+    :return: List of 2D lists of integers representing all possible new images.
+    """
+    return list(iter_new_images(image, budget, model, workers, prune, stats, cache, neighbourhood, None, executor))
+
+
+class GenerationSession:
+    """
+    A generation of new images that can be extended to a larger budget without redoing the work of smaller ones.
+
+    The session keeps the flippable pixels, the first layer pre-activations of the original image and the results
+    found so far. Extending it from budget k to a larger budget only visits the combinations of more than k pixels,
+    deriving the pre-activations of each from those of its prefix, so sweeping budgets upward costs no more than
+    generating the largest budget once. Whether a combination keeps the number does not follow from whether its
+    subsets do, so every new combination is still classified.
+    """
+
+    def __init__(
+        self,
+        image: list[list[int]],
+        model: Model | None = None,
+        neighbourhood: int | Iterable[tuple[int, int]] = 4,
+    ) -> None:
+        """
+        :param image: 2D list of integers representing an image.
+        :param model: Preloaded Model used for predictions, defaults to the cached model from load_model().
+        :param neighbourhood: 4, 8 or the (row, column) offsets of the neighbours of a pixel, see flippable_pixels.
+        """
+        self.model = load_model() if model is None else model
+        self.flat_image = flatten_image(image)
+        self.flippable = flippable_pixels(self.flat_image, image_width(image), neighbourhood)
+        self.original_image_number = self.model.predict(image)
+        self.pre_activations = self.model.first_layer(self.flat_image)
+        self.results = ResultStore(image)
+        self.budget = 0
+
+    def _iter_size(self, size: int) -> Iterator[tuple[tuple[int, ...], list[float]]]:
+        # generates the combinations of exactly size pixels in canonical order, each with its pre-activations, which
+        # are summed in the same order as Model.flip_first_layer so the predictions are the same as without a session
+        x = self.flat_image
+        flippable = self.flippable
+        columns = self.model.columns
+        num_flippable = len(flippable)
+        if not 0 < size <= num_flippable:
+            return
+
+        # the positions of the pixels of the current prefix, and the pre-activations of every prefix of it
+        positions = []
+        prefixes = [self.pre_activations]
+        position = 0
+        while True:
+            # there are enough pixels left to complete the combination
+            if position <= num_flippable - size + len(positions):
+                idx = flippable[position]
+                pre_activations = list(map(sub if x[idx] else add, prefixes[-1], columns[idx]))
+                if len(positions) + 1 == size:
+                    yield tuple([flippable[p] for p in positions]) + (idx,), pre_activations
+                else:
+                    positions.append(position)
+                    prefixes.append(pre_activations)
+                position += 1
+            elif positions:
+                position = positions.pop() + 1
+                prefixes.pop()
+            else:
+                return
+
+    def extend(self, budget: int | None = None) -> list[tuple[int, ...]]:
+        """
+        Generates the new images of the combinations larger than the current budget, up to the new one.
+
+        :param budget: Integer representing the new budget, defaults to one more than the current budget.
+        :return: List of tuples of integers representing the flipped pixels of the new images found, in canonical order.
+        """
+        if budget is None:
+            budget = self.budget + 1
+
+        new_flips = []
+        for size in range(self.budget + 1, budget + 1):
+            for flipped, pre_activations in self._iter_size(size):
+                if (
+                    self.model.predict_first_layer(self.flat_image, pre_activations, flipped)
+                    == self.original_image_number
+                ):
+                    new_flips.append(flipped)
+        self.budget = max(self.budget, budget)
+        self.results.update(new_flips)
+        return sorted(new_flips)
+
+    def images(self) -> Iterator[list[list[int]]]:
+        """
+        :return: Generator of 2D lists of integers representing the new images within the current budget, in the
+                 order of generate_new_images.
+        """
+        return self.results.images()
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+
+SAMPLE_STRATEGIES = ("random", "margin")
+
+
+def sample_new_flips(
+    image: list[list[int]],
+    budget: int,
+    limit: int,
+    model: Model | None = None,
+    strategy: str = "random",
+    seed: int | None = None,
+    max_candidates: int = 100_000,
+    neighbourhood: int | Iterable[tuple[int, int]] = 4,
+) -> tuple[list[tuple[int, ...]], float]:
+    """
+    Finds at most limit new images without enumerating every combination, for budgets too large to generate in full.
+
+    The "random" strategy draws combinations uniformly from all combinations of 1 up to budget pixels, each drawn
+    combination being classified once. The "margin" strategy is a best-first search: it starts from every single
+    pixel and keeps expanding the combination whose predicted number wins by the largest margin over the runner-up,
+    with one more pixel after its last one, so the images that keep the number most clearly come first.
+
+    Either way, at most max_candidates combinations are classified and held, which bounds the time and the memory.
+
+    :param image: 2D list of integers representing an image.
+    :param budget: Integer representing the number of pixels that can be flipped.
+    :param limit: Integer representing the largest number of new images to find.
+    :param model: Preloaded Model used for predictions, defaults to the cached model from load_model().
+    :param strategy: String, "random" or "margin".
+    :param seed: Integer seeding the random strategy, so that a run can be repeated.
+    :param max_candidates: Integer representing the largest number of combinations to classify.
+    :param neighbourhood: 4, 8 or the (row, column) offsets of the neighbours of a pixel, see flippable_pixels.
+    :return: Tuple of the list of flipped pixels of the new images found, in canonical order for "random" and by
+             decreasing margin for "margin", and the fraction of all combinations that was classified.
+    """
+    if strategy not in SAMPLE_STRATEGIES:
+        raise ValueError(f"unknown strategy {strategy!r}, expected one of {', '.join(SAMPLE_STRATEGIES)}")
+    if model is None:
+        model = load_model()
+
+    flat_image = flatten_image(image)
+    flippable = flippable_pixels(flat_image, image_width(image), neighbourhood)
+    original_image_number = model.predict(image)
+    pre_activations = model.first_layer(flat_image)
+    budget = min(budget, len(flippable))
+    num_candidates = sum(comb(len(flippable), size) for size in range(1, budget + 1))
+    if num_candidates == 0 or limit <= 0:
+        return [], 0.0
+
+    def classify(flipped: tuple[int, ...]) -> tuple[bool, float]:
+        # whether the number is kept, and by how much it scores above the best other number, negative when it loses
+        y = model.logits_first_layer(
+            flat_image, model.flip_first_layer(flat_image, pre_activations, flipped), flipped
+        )
+        others = y[:original_image_number] + y[original_image_number + 1 :]
+        return argmax(y) == original_image_number, y[original_image_number] - max(others, default=0.0)
+
+    found = []
+    num_classified = 0
+    if strategy == "random":
+        rng = random.Random(seed)
+        sizes = range(1, budget + 1)
+        weights = [comb(len(flippable), size) for size in sizes]
+        seen = set()
+        # duplicates are drawn more often as the combinations run out, so the draws are bounded too
+        for _ in range(4 * max_candidates):
+            if len(found) >= limit or num_classified >= min(max_candidates, num_candidates):
+                break
+            flipped = tuple(sorted(rng.sample(flippable, rng.choices(sizes, weights)[0])))
+            if flipped in seen:
+                continue
+            seen.add(flipped)
+            num_classified += 1
+            if classify(flipped)[0]:
+                found.append(flipped)
+        found.sort()
+    else:
+        # the heap holds (negated margin, combination, position of its last pixel, whether it keeps the number),
+        # so the combination with the largest margin pops first
+        heap = []
+        for position, idx in enumerate(flippable[:max_candidates]):
+            kept, score = classify((idx,))
+            heap.append((-score, (idx,), position, kept))
+        num_classified = len(heap)
+        heapq.heapify(heap)
+        while heap and len(found) < limit:
+            _, flipped, last, kept = heapq.heappop(heap)
+            if kept:
+                found.append(flipped)
+            if len(flipped) == budget:
+                continue
+            for position in range(last + 1, len(flippable)):
+                if num_classified >= max_candidates:
+                    break
+                extended = flipped + (flippable[position],)
+                kept, score = classify(extended)
+                heapq.heappush(heap, (-score, extended, position, kept))
+                num_classified += 1
+
+    return found, num_classified / num_candidates
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Command-line entry point: generates new images for every input image and writes them to files.
+
+    :param argv: List of strings representing the command-line arguments, defaults to sys.argv[1:].
+    :return: Integer representing the exit status.
+    """
+    parser = argparse.ArgumentParser(
+        description="Generate new images from existing ones by flipping pixels next to a 1, "
+        "keeping only the images the ANN still predicts as the same number."
+    )
+    parser.add_argument("inputs", nargs="*", help="image files or glob patterns (default: image.txt)")
+    parser.add_argument("--dataset", help="packed dataset file to read the images from, instead of image files")
+    parser.add_argument("--budget", type=int, default=2, help="number of pixels that can be flipped (default: 2)")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes (default: 1)")
+    parser.add_argument("--output-dir", default=".", help="directory the new images are written to (default: .)")
+    parser.add_argument(
+        "--limit", type=int, default=1, help="new images written per input, 0 writes all of them (default: 1)"
+    )
+    parser.add_argument(
+        "--archive",
+        action="store_true",
+        help="write the new images of each input into one indexed <stem>_new_images.txt instead of one file each",
+    )
+    parser.add_argument("--prune", action="store_true", help="skip flips that provably change the number")
+    parser.add_argument("--weights", default="./weights.txt", help="weights file (default: ./weights.txt)")
+    parser.add_argument("--biases", default="./biases.txt", help="biases file (default: ./biases.txt)")
+    parser.add_argument("--model", help="binary model file, used instead of --weights and --biases")
+    parser.add_argument(
+        "--quantized", action="store_true", help="classify with the weights scaled to integers, see QuantizedModel"
+    )
+    parser.add_argument("--stats", action="store_true", help="print the counters and stage timers of every input")
+    parser.add_argument("--cache", help="SQLite file caching predictions across runs, created when missing")
+    parser.add_argument(
+        "--sample",
+        choices=SAMPLE_STRATEGIES,
+        help="find up to --limit new images by random sampling or best-first by margin, instead of enumerating all",
+    )
+    parser.add_argument("--seed", type=int, help="seed of --sample random, to repeat a run")
+    parser.add_argument(
+        "--neighbourhood",
+        type=int,
+        choices=sorted(NEIGHBOURHOODS),
+        default=4,
+        help="pixels next to a 1 that can be flipped: 4 sharing an edge, 8 also sharing a corner (default: 4)",
+    )
+    parser.add_argument(
+        "--max-candidates",
+        type=int,
+        default=100_000,
+        help="combinations classified per input at most with --sample (default: 100000)",
+    )
+    args = parser.parse_args(argv)
+    if args.cache and (args.workers > 1 or args.prune):
+        parser.error("--cache cannot be used with more than one worker or with --prune")
+    if args.sample and (args.limit <= 0 or args.workers > 1 or args.prune or args.cache):
+        parser.error("--sample needs a --limit and cannot be used with workers, --prune or --cache")
+    if args.quantized and (args.prune or args.cache):
+        parser.error("--quantized cannot be used with --prune or --cache")
+
+    # expand the glob patterns ourselves, so they also work where the shell does not
+    dataset = None
+    file_names = []
+    if args.dataset:
+        if args.inputs:
+            parser.error("image files cannot be given together with --dataset")
+        dataset = Dataset.load(args.dataset)
+        file_names = list(dataset.names)
+    for pattern in args.inputs or ([] if dataset is not None else ["image.txt"]):
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            parser.error(f"no files match {pattern}")
+        file_names.extend(matches)
+
+    # the model is loaded once for the whole run
+    model = read_binary_model(args.model) if args.model else load_model(args.weights, args.biases)
+    if args.quantized:
+        model = QuantizedModel(model)
+    cache = PredictionCache(args.cache, model) if args.cache else None
+    # the worker processes are started once for the whole run, and receive the model once
+    executor = generation_pool(model, args.workers) if args.workers > 1 else None
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    total_images = 0
+    start = time.perf_counter()
+    for k, file_name in enumerate(file_names):
+        image_start = time.perf_counter()
+        image = dataset[k] if dataset is not None else read_image(file_name)
+        stem = os.path.splitext(os.path.basename(file_name))[0]
+
+        # images are written as they are generated, and generation stops as soon as the limit is reached
+        stats = GenerationStats() if args.stats and not args.sample else None
+        if args.sample:
+            flips, explored = sample_new_flips(
+                image, args.budget, args.limit, model, args.sample, args.seed, args.max_candidates, args.neighbourhood
+            )
+            flat_image = flatten_image(image)
+            generator = (unflatten_image(flip_pixels(flat_image, flipped), image_width(image)) for flipped in flips)
+        else:
+            generator = iter_new_images(
+                image, args.budget, model, args.workers, args.prune, stats, cache, args.neighbourhood, None, executor
+            )
+        new_images = islice(generator, args.limit) if args.limit > 0 else generator
+        num_images = 0
+        if args.archive:
+            with ImageArchiveWriter(os.path.join(args.output_dir, f"{stem}_new_images.txt"), image) as archive:
+                for num_images, new_image in enumerate(new_images, start=1):
+                    archive.add(new_image)
+        else:
+            for num_images, new_image in enumerate(new_images, start=1):
+                write_image(image, new_image, os.path.join(args.output_dir, f"{stem}_new_image_{num_images}.txt"))
+        # closing the generator ends the run now, so its stats are complete even when the limit stopped it
+        generator.close()
+
+        elapsed = time.perf_counter() - image_start
+        total_images += num_images
+        print(f"{file_name}: {num_images} new images written in {elapsed:.3f}s ({num_images / elapsed:.0f} images/s)")
+        if args.sample:
+            print(f"  explored {explored:.6%} of the combinations")
+        if stats is not None:
+            stages = ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in stats.seconds.items())
+            print(
+                f"  enumerated {stats.enumerated}, classified {stats.classified}, kept {stats.kept}, "
+                f"pruned {stats.pruned}, weight loads {stats.weight_loads}; {stages}"
+            )
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Number of new images generated: {total_images} from {len(file_names)} inputs in {elapsed:.3f}s "
+        f"({len(file_names) / elapsed:.1f} inputs/s, {total_images / elapsed:.0f} images/s)"
+    )
+    if cache is not None:
+        print(f"Prediction cache: {cache.hits} hits, {cache.misses} misses, {len(cache)} entries")
+        cache.close()
+    if executor is not None:
+        executor.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
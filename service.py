@@ -0,0 +1,353 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from ai import Model, argmax, load_model, read_image
+from generative import generation_pool, iter_new_images
+
+
+class GenerationService:
+    """
+    An asyncio front for predictions and generation, sharing one preloaded model between every request.
+
+    The synchronous work runs in a bounded pool of threads, so the event loop is never blocked by it. Concurrent
+    predict calls are coalesced into micro-batches classified together, at most max_pending requests are handled at
+    once with later ones waiting for a free slot, and cancelling a generate call stops its generation between two
+    images.
+
+    Threads share the model without copying it, but CPU-bound Python code in them still takes turns on one core;
+    generation_workers spreads each generation over a pool of worker processes started once for the service, see
+    generation_pool.
+    """
+
+    def __init__(
+        self,
+        model: Model | None = None,
+        max_workers: int = 2,
+        max_pending: int = 64,
+        batch_size: int = 256,
+        batch_delay: float = 0.002,
+        generation_workers: int = 1,
+    ) -> None:
+        """
+        :param model: Preloaded Model used for predictions, defaults to the cached model from load_model().
+        :param max_workers: Integer representing the number of threads running predictions and generations.
+        :param max_pending: Integer representing the number of requests handled at once; later ones wait.
+        :param batch_size: Integer representing the largest number of predict calls classified together.
+        :param batch_delay: Float representing the seconds a predict call waits for others to join its batch.
+        :param generation_workers: Integer representing the number of worker processes of each generation.
+        """
+        self.model = load_model() if model is None else model
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.generation_workers = generation_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation")
+        # the worker processes are started once and shared by every generation
+        self.generation_pool = generation_pool(self.model, generation_workers) if generation_workers > 1 else None
+        self.batches = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._slots = asyncio.Semaphore(max_pending)
+        self._batch: list[tuple[list[int], asyncio.Future]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+
+    async def _acquire(self) -> None:
+        # waits for a free slot, which is how callers are slowed down once max_pending requests are being handled
+        await self._slots.acquire()
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._slots.release()
+
+    async def predict(self, image: list[list[int]]) -> int:
+        """
+        Predicts the number in an image like predict_number, batched with the other predict calls made meanwhile.
+
+        :param image: 2D list of integers representing an image.
+        :return: Integer representing the predicted number.
+        """
+        # a bad image is refused here, so it fails its own call and not the batch it would have joined
+        x = self._check_image(image)
+        await self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._batch.append((x, future))
+            if len(self._batch) >= self.batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.batch_delay, self._flush)
+            return await future
+        finally:
+            self._release()
+
+    def _check_image(self, image: list[list[int]]) -> list[int]:
+        # flattens the image, raising a ValueError unless it is a binary image of the model's input size
+        x = [pixel for row in image for pixel in row]
+        num_inputs = len(self.model.columns)
+        if len(x) != num_inputs:
+            raise ValueError(f"the image has {len(x)} pixels, the model takes {num_inputs}")
+        if any(pixel not in (0, 1) for pixel in x):
+            raise ValueError("the image holds pixels other than 0 and 1")
+        return x
+
+    def _flush(self) -> None:
+        # sends the waiting predict calls to the executor as one batch
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._batch = self._batch, []
+        # calls cancelled while waiting are left out of the batch
+        batch = [(x, future) for x, future in batch if not future.cancelled()]
+        if not batch:
+            return
+        self.batches += 1
+        loop = asyncio.get_running_loop()
+        outputs = loop.run_in_executor(self.executor, self._classify, [x for x, _ in batch])
+        outputs.add_done_callback(lambda done: self._resolve(batch, done))
+
+    def _classify(self, xs: list[list[int]]) -> list[int | Exception]:
+        # runs in the executor; an input that fails the batch is found by classifying each input on its own, so
+        # its exception is given to its caller alone
+        try:
+            return [argmax(y) for y in self.model.inference_batch(xs)]
+        except Exception:
+            numbers = []
+            for x in xs:
+                try:
+                    numbers.append(argmax(self.model.inference(x)))
+                except Exception as error:
+                    numbers.append(error)
+            return numbers
+
+    @staticmethod
+    def _resolve(batch: list[tuple[list[int], asyncio.Future]], outputs: asyncio.Future) -> None:
+        for k, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if outputs.cancelled():
+                future.cancel()
+            elif outputs.exception() is not None:
+                future.set_exception(outputs.exception())
+            elif isinstance(outputs.result()[k], Exception):
+                future.set_exception(outputs.result()[k])
+            else:
+                future.set_result(outputs.result()[k])
+
+    async def generate(
+        self, image: list[list[int]], budget: int, limit: int | None = None, prune: bool = False
+    ) -> list[list[list[int]]]:
+        """
+        Generates new images like generate_new_images, in the executor.
+
+        :param image: 2D list of integers representing an image.
+        :param budget: Integer representing the number of pixels that can be flipped.
+        :param limit: Integer representing the largest number of new images to return, all of them when None.
+        :param prune: Boolean, when True skips the combinations that provably change the number.
+        :return: List of 2D lists of integers representing the new images, in the order of generate_new_images.
+        """
+        # a bad image fails its own call before it takes a slot, as in predict
+        self._check_image(image)
+        await self._acquire()
+        cancelled = threading.Event()
+        try:
+            job = self.executor.submit(self._generate, image, budget, limit, prune, cancelled)
+        except BaseException:
+            self._release()
+            raise
+        try:
+            return await asyncio.wrap_future(job)
+        except asyncio.CancelledError:
+            # the thread cannot be interrupted, but it checks the event before every candidate
+            cancelled.set()
+            raise
+        finally:
+            # the slot is freed once the thread is done, not when the call is cancelled while the thread still runs
+            if job.done():
+                self._release()
+            else:
+                loop = asyncio.get_running_loop()
+                job.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+
+    def _generate(
+        self, image: list[list[int]], budget: int, limit: int | None, prune: bool, cancelled: threading.Event
+    ) -> list[list[list[int]]]:
+        new_images = iter_new_images(
+            image,
+            budget,
+            self.model,
+            self.generation_workers,
+            prune,
+            stop=cancelled.is_set,
+            executor=self.generation_pool,
+        )
+        results = []
+        try:
+            for new_image in islice(new_images, limit):
+                if cancelled.is_set():
+                    break
+                results.append(new_image)
+        finally:
+            new_images.close()
+        return results
+
+    async def close(self) -> None:
+        """
+        Waits for the work in the executor to finish and shuts it down.
+
+        :return: None.
+        """
+        if self._batch:
+            self._flush()
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+        if self.generation_pool is not None:
+            self.generation_pool.shutdown()
+
+    async def __aenter__(self) -> GenerationService:
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.close()
+
+
+async def _handle_request(service: GenerationService, request: dict) -> dict:
+    # answers one request of the JSON lines protocol of serve
+    response = {"id": request.get("id")}
+    try:
+        if request.get("op") == "predict":
+            response["number"] = await service.predict(request["image"])
+        elif request.get("op") == "generate":
+            response["images"] = await service.generate(
+                request["image"], request.get("budget", 1), request.get("limit"), request.get("prune", False)
+            )
+        else:
+            response["error"] = f"unknown op {request.get('op')!r}"
+    except (KeyError, TypeError, ValueError, IndexError) as error:
+        response["error"] = f"{type(error).__name__}: {error}"
+    return response
+
+
+async def serve(service: GenerationService, host: str = "127.0.0.1", port: int = 0) -> asyncio.Server:
+    """
+    Starts a local server answering requests with the service, one JSON object per line.
+
+    A request is {"id": ..., "op": "predict", "image": [[...]]} or {"id": ..., "op": "generate", "image": [[...]],
+    "budget": 2, "limit": 10}, and is answered by {"id": ..., "number": 4}, {"id": ..., "images": [...]} or
+    {"id": ..., "error": "..."}. Requests on one connection are handled concurrently, so answers can come out of
+    order and are matched to requests by their id.
+
+    :param service: GenerationService answering the requests.
+    :param host: String representing the address to listen on.
+    :param port: Integer representing the port to listen on, 0 picks a free one.
+    :return: The started asyncio.Server; its sockets tell the port it listens on.
+    """
+
+    async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        tasks = set()
+
+        async def answer(line: bytes) -> None:
+            try:
+                response = await _handle_request(service, json.loads(line))
+            except json.JSONDecodeError as error:
+                response = {"id": None, "error": f"JSONDecodeError: {error}"}
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(answer(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        finally:
+            # a client that disconnects cancels its requests still running
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    return await asyncio.start_server(handle_connection, host, port, limit=2**24)
+
+
+async def load_test(
+    host: str, port: int, images: list[list[list[int]]], requests: int = 1000, concurrency: int = 50
+) -> dict:
+    """
+    Sends predict requests to a server started by serve from concurrent connections and measures the throughput.
+
+    :param host: String representing the address of the server.
+    :param port: Integer representing the port of the server.
+    :param images: List of 2D lists of integers representing the images to send, in turn.
+    :param requests: Integer representing the number of requests to send in total.
+    :param concurrency: Integer representing the number of connections sending requests at the same time.
+    :return: Dictionary with the number of requests, the seconds taken, the requests per second and the answers,
+             as a list of predicted numbers in the order of the requests.
+    """
+    answers = [None] * requests
+
+    async def client(start: int) -> None:
+        reader, writer = await asyncio.open_connection(host, port, limit=2**24)
+        for k in range(start, requests, concurrency):
+            request = {"id": k, "op": "predict", "image": images[k % len(images)]}
+            writer.write(json.dumps(request).encode() + b"\n")
+            await writer.drain()
+            answers[k] = json.loads(await reader.readline())["number"]
+        writer.close()
+        await writer.wait_closed()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(k) for k in range(min(concurrency, requests))))
+    seconds = time.perf_counter() - start
+    return {"requests": requests, "seconds": seconds, "requests_per_sec": requests / seconds, "answers": answers}
+
+
+async def _run(args: argparse.Namespace) -> None:
+    async with GenerationService(max_workers=args.threads, max_pending=args.max_pending) as service:
+        server = await serve(service, args.host, args.port)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            if not args.load_test:
+                print(f"Serving on {args.host}:{port}")
+                await server.serve_forever()
+            images = [read_image(file_name) for file_name in args.images]
+            result = await load_test(args.host, port, images, args.requests, args.concurrency)
+            print(
+                f"{result['requests']} predict requests from {args.concurrency} connections in "
+                f"{result['seconds']:.3f}s ({result['requests_per_sec']:.0f} requests/s, {service.batches} batches)"
+            )
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Command-line entry point: serves requests, or runs a load test against a server in this process.
+
+    :param argv: List of strings representing the command-line arguments, defaults to sys.argv[1:].
+    :return: Integer representing the exit status.
+    """
+    parser = argparse.ArgumentParser(description="Serve predictions and generation over JSON lines.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on, 0 picks one (default: 8765)")
+    parser.add_argument("--threads", type=int, default=2, help="threads running the work (default: 2)")
+    parser.add_argument("--max-pending", type=int, default=64, help="requests handled at once (default: 64)")
+    parser.add_argument("--load-test", action="store_true", help="send predict requests to the server and exit")
+    parser.add_argument(
+        "--images",
+        nargs="+",
+        default=["image.txt", "another_image.txt", "confusing_image.txt"],
+        help="images sent by the load test (default: the sample images)",
+    )
+    parser.add_argument("--requests", type=int, default=1000, help="requests sent by the load test (default: 1000)")
+    parser.add_argument("--concurrency", type=int, default=50, help="connections of the load test (default: 50)")
+    args = parser.parse_args(argv)
+
+    asyncio.run(_run(args))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
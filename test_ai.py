@@ -0,0 +1,224 @@
+from __future__ import annotations
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from ai import (
+    Model,
+    QuantizedModel,
+    argmax,
+    convert_model,
+    fast_inference,
+    inference,
+    load_model,
+    predict_flipped,
+    predict_number,
+    predict_numbers,
+    read_binary_model,
+    read_image,
+)
+
+
+class TestAi(unittest.TestCase):
+    """Unit tests for the module ai.py"""
+
+    def test_load_model_is_cached(self) -> None:
+        """
+        Verify load_model returns the same Model for the same files.
+        """
+        assert load_model() is load_model(), "Model was parsed twice"
+
+    def test_load_model_reloads_modified_file(self) -> None:
+        """
+        Verify load_model re-reads the files once one of them has been modified.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            weights_file = os.path.join(directory, "weights.txt")
+            biases_file = os.path.join(directory, "biases.txt")
+            shutil.copy("weights.txt", weights_file)
+            shutil.copy("biases.txt", biases_file)
+
+            model = load_model(weights_file, biases_file)
+            stat = os.stat(biases_file)
+            os.utime(biases_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+            assert (
+                load_model(weights_file, biases_file) is not model
+            ), "Modified file was not reloaded"
+
+    def test_model_fingerprint(self) -> None:
+        """
+        Verify models with the same weights and biases share a fingerprint, and other biases change it.
+        """
+        model = load_model()
+        with tempfile.TemporaryDirectory() as directory:
+            model_file = os.path.join(directory, "model.gaim")
+            convert_model("weights.txt", "biases.txt", model_file)
+            assert read_binary_model(model_file).fingerprint() == model.fingerprint(), "Fingerprints differ"
+
+        biases = [list(b_l) for b_l in model.biases]
+        biases[-1][0] += 0.01
+        assert Model(model.weights, biases).fingerprint() != model.fingerprint(), "Fingerprint did not change"
+
+    def test_quantized_model_is_exact(self) -> None:
+        """
+        Verify the quantized outputs are the float outputs times the output scale, and the predictions are the same.
+        """
+        model = load_model()
+        quantized = QuantizedModel(model)
+        assert quantized.exact, "The two-decimal weights were rounded"
+        assert [weights.typecode for weights, _, _ in quantized.packed] == ["b", "b", "b"], "Weights are not int8"
+        for file_name in ["image.txt", "another_image.txt", "confusing_image.txt"]:
+            image = read_image(file_name)
+            x = [element for row in image for element in row]
+            y = model.inference(x)
+            assert all(
+                abs(q / quantized.output_scale - v) < 1e-9 for q, v in zip(quantized.inference(x), y)
+            ), "Outputs differ"
+            assert quantized.predict(image) == model.predict(image), "Predictions differ"
+            flipped_sets = [[0], [100, 101], [300, 301, 302]]
+            assert quantized.predict_flipped(x, flipped_sets) == model.predict_flipped(
+                x, flipped_sets
+            ), "Predictions of flipped copies differ"
+
+    def test_predict_number_with_model(self) -> None:
+        """
+        Verify predict_number gives the same result with and without a preloaded model.
+        """
+        model = Model.from_files("weights.txt", "biases.txt")
+        for file_name in ["image.txt", "another_image.txt", "confusing_image.txt"]:
+            image = read_image(file_name)
+            assert predict_number(image, model) == predict_number(
+                image
+            ), "Prediction differs with a preloaded model"
+
+    def test_model_inference_matches_reference(self) -> None:
+        """
+        Verify Model.inference gives exactly the output of the reference inference.
+        """
+        model = load_model()
+        for file_name in ["image.txt", "another_image.txt", "confusing_image.txt"]:
+            x = [pixel for row in read_image(file_name) for pixel in row]
+            assert model.inference(x) == inference(
+                x, model.weights, model.biases
+            ), "Fast inference differs from the reference"
+
+    def test_sparse_first_layer_matches_dense(self) -> None:
+        """
+        Verify the first layer gives the same pre-activations for sparse binary, sparse real and dense inputs.
+        """
+        model = load_model()
+        rows, biases = model.layers[0]
+        x = [pixel for row in read_image("image.txt") for pixel in row]
+        inputs = [x, [0.5 * pixel for pixel in x], [1 - pixel for pixel in x], [0] * len(x)]
+        for x in inputs:
+            dense = [sum(w * x_j for w, x_j in zip(row, x)) + bias for row, bias in zip(rows, biases)]
+            assert model.first_layer(x) == dense, "Sparse first layer differs from the dense one"
+            assert model.inference(x) == inference(x, model.weights, model.biases), "Inference differs"
+        assert model.inference_batch(inputs) == [
+            inference(x, model.weights, model.biases) for x in inputs
+        ], "Batch inference differs"
+
+    def test_wrong_input_size_raises(self) -> None:
+        """
+        Verify an input or image of another size than the first layer's raises a ValueError.
+        """
+        model = load_model()
+        for predictor in [model, QuantizedModel(model)]:
+            with self.assertRaises(ValueError):
+                predictor.predict([[1, 0], [0, 1]])
+            with self.assertRaises(ValueError):
+                predictor.inference([0] * 785)
+        with self.assertRaises(ValueError):
+            predict_number([[1, 0], [0, 1]])
+        with self.assertRaises(ValueError):
+            fast_inference([1, 0], model.layers)
+
+    def test_predict_numbers_matches_predict_number(self) -> None:
+        """
+        Verify predict_numbers gives the per-image predictions in order, across several chunks.
+        """
+        images = [
+            read_image(file_name)
+            for file_name in ["image.txt", "another_image.txt", "confusing_image.txt"]
+        ] * 3
+        assert predict_numbers(iter(images), chunk_size=2) == [
+            predict_number(image) for image in images
+        ], "Batch predictions differ from single predictions"
+
+    def test_flip_first_layer_matches_inference(self) -> None:
+        """
+        Verify the incremental first layer plus the tail gives the output of inference on the flipped image.
+        """
+        model = load_model()
+        x = [pixel for row in read_image("image.txt") for pixel in row]
+        pre_activations = model.first_layer(x)
+        for flipped in [[0], [100, 101], [200, 300, 400], [i for i in range(784) if x[i]]]:
+            flipped_x = list(x)
+            for i in flipped:
+                flipped_x[i] = 1 - flipped_x[i]
+            y = model.tail_inference(model.flip_first_layer(x, pre_activations, flipped))
+            expected = inference(flipped_x, model.weights, model.biases)
+            assert all(
+                abs(y_i - e_i) < 1e-9 for y_i, e_i in zip(y, expected)
+            ), "Incremental output differs from inference"
+            assert argmax(y) == argmax(expected), "Incremental prediction differs"
+
+    def test_predict_flipped_matches_predict_number(self) -> None:
+        """
+        Verify predict_flipped predicts the same numbers as predict_number on the flipped images.
+        """
+        image = read_image("confusing_image.txt")
+        flipped_sets = [[], [5], [40, 41], [300, 329, 358], list(range(350, 420))]
+        expected = []
+        for flipped in flipped_sets:
+            flat_image = [pixel for row in image for pixel in row]
+            for i in flipped:
+                flat_image[i] = 1 - flat_image[i]
+            expected.append(predict_number([flat_image[r : r + 28] for r in range(0, 784, 28)]))
+        assert (
+            predict_flipped(image, flipped_sets) == expected
+        ), "Incremental predictions differ from predict_number"
+
+    def test_binary_model_matches_text_model(self) -> None:
+        """
+        Verify a model converted to the binary format has the same weights and predictions as the text model.
+        """
+        text_model = load_model()
+        with tempfile.TemporaryDirectory() as directory:
+            model_file = os.path.join(directory, "model.bin")
+            convert_model("weights.txt", "biases.txt", model_file)
+            binary_model = read_binary_model(model_file)
+
+            layers = [([tuple(row) for row in rows], tuple(biases)) for rows, biases in binary_model.layers]
+            assert layers == [(list(rows), biases) for rows, biases in text_model.layers], "Weights differ"
+            assert [tuple(column) for column in binary_model.columns] == list(text_model.columns), "Columns differ"
+            # the weights are views into the mapped file, not copies
+            assert all(
+                isinstance(row, memoryview) for rows, _ in binary_model.layers for row in rows
+            ), "Weights were copied"
+            assert all(isinstance(column, memoryview) for column in binary_model.columns), "Columns were copied"
+            for file_name in ["image.txt", "another_image.txt", "confusing_image.txt"]:
+                x = [pixel for row in read_image(file_name) for pixel in row]
+                assert binary_model.inference(x) == text_model.inference(
+                    x
+                ), "Predictions differ"
+
+            unpickled_model = pickle.loads(pickle.dumps(binary_model))
+            assert unpickled_model.binary_file == binary_model.binary_file, "Not mapped again"
+            assert [tuple(column) for column in unpickled_model.columns] == list(
+                text_model.columns
+            ), "Weights differ after pickling"
+            del binary_model, unpickled_model
+
+    def test_read_binary_model_rejects_other_files(self) -> None:
+        """
+        Verify read_binary_model raises a ValueError for a file in another format.
+        """
+        with self.assertRaises(ValueError):
+            read_binary_model("weights.txt")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+from __future__ import annotations
+import unittest
+from benchmark import compare, quantization_report, run_benchmarks
+
+
+class TestBenchmark(unittest.TestCase):
+    """Unit tests for the module benchmark.py"""
+
+    def test_run_benchmarks_reports_every_hot_path(self) -> None:
+        """
+        Verify run_benchmarks reports timings and memory for every benchmark on one image and budget.
+        """
+        results = run_benchmarks(["image.txt"], [1], repeat=1)
+        names = {result["name"] for result in results}
+        assert names == {
+            "read_weights",
+            "read_biases",
+            "Model.from_files",
+            "inference",
+            "predict_number",
+            "predict_number (quantized)",
+            "iter_new_images",
+            "iter_new_images (quantized)",
+            "pixel_flip",
+            "generate_new_images",
+        }, "Benchmarks are missing"
+        for result in results:
+            assert result["seconds"] > 0, "Benchmark was not timed"
+            assert result["peak_bytes"] > 0, "Memory was not measured"
+
+    def test_quantization_report(self) -> None:
+        """
+        Verify the quantized model predicts the same number as the float model for every candidate of the samples.
+        """
+        report = quantization_report(["image.txt", "another_image.txt", "confusing_image.txt"], 1)
+        assert report["exact"] and report["candidates"] == 71 + 97 + 85, "Wrong candidates"
+        assert report["agreement"] == 1.0 and report["disagreements"] == [], "Quantized predictions differ"
+        assert report["quantized_bytes"] * 8 == report["float_bytes"], "Weights were not packed into int8"
+
+    def test_compare_finds_regressions(self) -> None:
+        """
+        Verify compare reports only the benchmarks slower than the baseline by more than the threshold.
+        """
+        baseline = [
+            {"name": "inference", "image": "image.txt", "budget": None, "seconds": 1.0},
+            {"name": "pixel_flip", "image": "image.txt", "budget": 1, "seconds": 1.0},
+        ]
+        results = [
+            {"name": "inference", "image": "image.txt", "budget": None, "seconds": 1.1},
+            {"name": "pixel_flip", "image": "image.txt", "budget": 1, "seconds": 1.5},
+            {"name": "pixel_flip", "image": "image.txt", "budget": 2, "seconds": 9.0},
+        ]
+        regressions = compare(results, baseline, 0.2)
+        assert len(regressions) == 1, "Wrong number of regressions"
+        assert regressions[0].startswith("pixel_flip image=image.txt budget=1"), "Wrong regression"
+
+
+if __name__ == "__main__":
+    unittest.main()
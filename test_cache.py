@@ -0,0 +1,104 @@
+from __future__ import annotations
+import os
+import shutil
+import tempfile
+import unittest
+from cache import PredictionCache
+from generative import count_new_images, generate_new_images, iter_flipped_images
+from ai import Model, inference, load_model, predict_flipped, predict_number, read_image
+
+IMAGE_FILES = ["image.txt", "another_image.txt", "confusing_image.txt"]
+
+
+class TestCache(unittest.TestCase):
+    """Unit tests for the module cache.py"""
+
+    def test_predictions_persist(self) -> None:
+        """
+        Verify cached predictions match predict_number and are found again after the cache file is reopened.
+        """
+        images = [read_image(file_name) for file_name in IMAGE_FILES]
+        model = load_model()
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "predictions.sqlite")
+            with PredictionCache(file_name, model) as cache:
+                assert cache.predict_numbers(images) == [predict_number(image) for image in images], "Wrong numbers"
+                assert (cache.hits, cache.misses, len(cache)) == (0, 3, 3), "Images were not cached"
+
+            with PredictionCache(file_name, model) as cache:
+                assert cache.predict(images[1]) == predict_number(images[1]), "Wrong cached number"
+                number, logits = cache.get(images[2])
+                assert number == predict_number(images[2]), "Wrong cached number"
+                assert logits == inference(sum(images[2], []), model.weights, model.biases), "Wrong cached logits"
+                assert (cache.hits, cache.misses) == (2, 0), "Images were classified again"
+
+    def test_least_recently_used_are_evicted(self) -> None:
+        """
+        Verify a full cache evicts the entries used the longest time ago.
+        """
+        images = [read_image(file_name) for file_name in IMAGE_FILES]
+        with tempfile.TemporaryDirectory() as directory:
+            with PredictionCache(os.path.join(directory, "predictions.sqlite"), load_model(), 2) as cache:
+                cache.predict(images[0])
+                cache.predict(images[1])
+                cache.predict(images[0])
+                cache.predict(images[2])
+
+                assert len(cache) == 2, "Cache grew past its limit"
+                assert cache.get(images[1]) is None, "The least recently used image was kept"
+                assert cache.get(images[0]) is not None, "A recently used image was evicted"
+
+    def test_modified_biases_invalidate(self) -> None:
+        """
+        Verify the cache drops its entries once the biases file changes, and is then filled by the new model.
+        """
+        image = read_image("image.txt")
+        with tempfile.TemporaryDirectory() as directory:
+            weights_file = os.path.join(directory, "weights.txt")
+            biases_file = os.path.join(directory, "biases.txt")
+            shutil.copy("weights.txt", weights_file)
+            shutil.copy("biases.txt", biases_file)
+            cache = PredictionCache(os.path.join(directory, "predictions.sqlite"), None, 100, weights_file, biases_file)
+            cache.predict(image)
+
+            # make number 0 win whatever the image
+            with open(biases_file) as f:
+                lines = f.read().splitlines()
+            lines[-1] = ",".join(["1000"] + lines[-1].split(",")[1:])
+            with open(biases_file, "w") as f:
+                f.write("\n".join(lines) + "\n")
+            stat = os.stat(biases_file)
+            os.utime(biases_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+            assert cache.get(image) is None, "Stale entry was kept"
+            assert cache.predict(image) == 0, "Prediction of the old biases"
+            cache.close()
+
+    def test_generate_new_images_with_cache(self) -> None:
+        """
+        Verify generate_new_images gives the same images with a cache, and classifies nothing again on a second run.
+        """
+        image = read_image("confusing_image.txt")
+        model = load_model()
+        expected = generate_new_images(image, 2, model)
+        with tempfile.TemporaryDirectory() as directory:
+            with PredictionCache(os.path.join(directory, "predictions.sqlite"), model) as cache:
+                assert generate_new_images(image, 1, cache=cache) == generate_new_images(image, 1), "Images differ"
+                assert generate_new_images(image, 2, cache=cache) == expected, "Images differ"
+                assert cache.misses == count_new_images(image, 2), "Budget 1 candidates were classified again"
+
+                assert generate_new_images(image, 2, cache=cache) == expected, "Cached images differ"
+                assert cache.misses == count_new_images(image, 2), "Cached candidates were classified again"
+                numbers = predict_flipped(image, iter_flipped_images(image, 2))
+                assert list(
+                    cache.iter_predict_flipped(sum(image, []), 28, iter_flipped_images(image, 2))
+                ) == numbers, "Cached numbers differ"
+
+                with self.assertRaises(ValueError):
+                    generate_new_images(image, 1, workers=2, cache=cache)
+                with self.assertRaises(ValueError):
+                    generate_new_images(image, 1, Model([[[0.0] * 784]], [[0.0]]), cache=cache)
+
+
+if __name__ == "__main__":
+    unittest.main()
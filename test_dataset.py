@@ -0,0 +1,71 @@
+from __future__ import annotations
+import os
+import tempfile
+import unittest
+from dataset import Dataset, read_image_bytes
+from ai import read_image
+
+IMAGE_FILES = ["image.txt", "another_image.txt", "confusing_image.txt"]
+
+
+class TestDataset(unittest.TestCase):
+    """Unit tests for the module dataset.py"""
+
+    def test_read_image_bytes_matches_read_image(self) -> None:
+        """
+        Verify read_image_bytes reads the same pixels as read_image.
+        """
+        for file_name in IMAGE_FILES:
+            height, width, pixels = read_image_bytes(file_name)
+            image = read_image(file_name)
+            assert (height, width) == (len(image), len(image[0])), "Wrong size"
+            assert list(pixels) == [pixel for row in image for pixel in row], "Wrong pixels"
+
+    def test_read_image_bytes_rejects_other_files(self) -> None:
+        """
+        Verify read_image_bytes raises a ValueError for a file that is not an image.
+        """
+        with self.assertRaises(ValueError):
+            read_image_bytes("weights.txt")
+
+    def test_from_files(self) -> None:
+        """
+        Verify a Dataset read from files holds every image as read_image reads it.
+        """
+        dataset = Dataset.from_files(IMAGE_FILES)
+        assert len(dataset) == 3, "Wrong number of images"
+        assert dataset.array.shape == (3, 28, 28), "Wrong shape"
+        for k, file_name in enumerate(IMAGE_FILES):
+            assert dataset[k] == read_image(file_name), "Wrong image"
+        assert dataset.array[1, 10, 10] == dataset[1][10][10], "Wrong pixel"
+
+    def test_empty_dataset(self) -> None:
+        """
+        Verify an empty Dataset, built directly, from an empty directory or loaded back, has an empty array.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "empty.gaid")
+            Dataset([], 0, 0, b"").save(file_name)
+            loaded = Dataset.load(file_name)
+            for dataset in [Dataset([], 0, 0, b""), Dataset.from_directory(directory), loaded]:
+                assert len(dataset) == 0 and list(dataset) == [], "Images in an empty dataset"
+                assert len(dataset.array) == 0, "Array of an empty dataset is not empty"
+            del loaded, dataset
+
+    def test_save_and_load(self) -> None:
+        """
+        Verify a Dataset loads back from a packed file with the same names and images.
+        """
+        dataset = Dataset.from_files(IMAGE_FILES)
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "digits.gaid")
+            dataset.save(file_name)
+            loaded = Dataset.load(file_name)
+
+            assert loaded.names == IMAGE_FILES, "Wrong names"
+            assert list(loaded) == list(dataset), "Wrong images"
+            del loaded
+
+
+if __name__ == "__main__":
+    unittest.main()
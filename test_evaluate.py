@@ -0,0 +1,73 @@
+from __future__ import annotations
+import os
+import tempfile
+import unittest
+from evaluate import FIELDS, evaluate_image, evaluate_images, read_rows, summarize
+from generative import count_new_images, generate_new_images
+from ai import load_model, predict_number, read_image
+
+IMAGE_FILES = ["image.txt", "another_image.txt", "confusing_image.txt"]
+
+
+class TestEvaluate(unittest.TestCase):
+    """Unit tests for the module evaluate.py"""
+
+    def test_evaluate_image_matches_generation(self) -> None:
+        """
+        Verify the rows of an image count the candidates and the images generate_new_images keeps, for every budget.
+        """
+        image = read_image("another_image.txt")
+        rows = evaluate_image(image, [1, 2], load_model(), name="another")
+        assert [row["budget"] for row in rows] == [1, 2], "Wrong budgets"
+        for row in rows:
+            assert set(row) == set(FIELDS), "Wrong fields"
+            assert row["number"] == predict_number(image), "Wrong number"
+            assert row["candidates"] == count_new_images(image, row["budget"]), "Wrong number of candidates"
+            assert row["preserved"] == len(generate_new_images(image, row["budget"])), "Wrong number kept"
+            assert sum(row[f"predicted_{k}"] for k in range(10)) == row["candidates"], "Histogram does not add up"
+        # every single flip keeps the number, some pairs of flips change it
+        assert [row["min_flips_to_change"] for row in rows] == [None, 2], "Wrong fewest flips"
+
+    def test_resume_after_interruption(self) -> None:
+        """
+        Verify a run stopped midway, with a partly written last line, is finished by running it again, for CSV and
+        JSON lines, with one or two workers.
+        """
+        images = [(file_name, read_image(file_name)) for file_name in IMAGE_FILES]
+        model = load_model()
+        expected = [row for name, image in images for row in evaluate_image(image, [1, 2], model, name=name)]
+        for file_name, workers in [("rows.csv", 1), ("rows.jsonl", 2)]:
+            with tempfile.TemporaryDirectory() as directory:
+                file_name = os.path.join(directory, file_name)
+                rows = evaluate_images(images, [1, 2], file_name, model, workers)
+                # the rows of an image are all written before the first of them is yielded
+                first = [next(rows) for _ in range(4)]
+                rows.close()
+                with open(file_name, "a") as f:
+                    f.write("confusing_image.txt,1,4")
+
+                rest = list(evaluate_images(images, [2, 1], file_name, model, workers))
+                assert first + rest == expected, "Resumed rows differ"
+                assert read_rows(file_name) == expected, "Rows on disk differ"
+                assert list(evaluate_images(images, [1, 2], file_name, model)) == [], "Rows were evaluated again"
+
+    def test_summarize(self) -> None:
+        """
+        Verify the summary of a budget adds up the rows of every image, and keeps every number without candidates.
+        """
+        model = load_model()
+        rows = [row for file_name in IMAGE_FILES for row in evaluate_image(read_image(file_name), [2], model)]
+        (summary,) = summarize(rows)
+        assert summary["images"] == 3, "Wrong number of images"
+        assert summary["candidates"] == sum(row["candidates"] for row in rows), "Wrong number of candidates"
+        assert summary["preserved"] == sum(row["preserved"] for row in rows), "Wrong number kept"
+        assert summary["min_flips_to_change"] == {2: 2}, "Wrong histogram of fewest flips"
+        assert sum(summary["predicted"]) == summary["candidates"], "Histogram does not add up"
+
+        # a budget without candidates keeps every number, as its rows say
+        (summary,) = summarize([dict(row, candidates=0, preserved=0, preserved_fraction=1.0) for row in rows])
+        assert summary["preserved_fraction"] == 1.0, "Wrong fraction kept without candidates"
+
+
+if __name__ == "__main__":
+    unittest.main()
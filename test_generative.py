@@ -1,360 +1,869 @@
-from __future__ import annotations
-import unittest
-from generative import (
-    flatten_image,
-    unflatten_image,
-    check_adjacent_for_one,
-    pixel_flip,
-    write_image,
-    generate_new_images,
-)
-from ai import read_image
-
-
-class TestGenerative(unittest.TestCase):
-    """Unit tests for the module generative.py"""
-
-    def test_flatten_image_5x5(self) -> None:
-        """
-        Verify flatten_image of a 5x5 table.
-        """
-        image = [
-            [1, 0, 0, 0, 1],
-            [0, 1, 0, 1, 0],
-            [0, 0, 1, 0, 0],
-            [0, 1, 0, 1, 0],
-            [1, 0, 0, 0, 1],
-        ]
-        flat_image = flatten_image(image)
-        assert flat_image == [
-            1,
-            0,
-            0,
-            0,
-            1,
-            0,
-            1,
-            0,
-            1,
-            0,
-            0,
-            0,
-            1,
-            0,
-            0,
-            0,
-            1,
-            0,
-            1,
-            0,
-            1,
-            0,
-            0,
-            0,
-            1,
-        ], "Image was not flatten"
-
-    def test_flatten_image_3x3(self) -> None:
-        """
-        Verify flatten_image of a 3x3 table.
-        """
-        image = [
-            [1, 0, 1],
-            [0, 1, 0],
-            [0, 1, 0],
-        ]
-        flat_image = flatten_image(image)
-        assert flat_image == [1, 0, 1, 0, 1, 0, 0, 1, 0], "Image was not flatten"
-
-    def test_flatten_image_4x4(self) -> None:
-        """
-        Verify flatten_image of a 4x4 table.
-        """
-        image = [
-            [1, 0, 1, 0],
-            [0, 1, 0, 1],
-            [0, 0, 0, 1],
-            [1, 0, 0, 1],
-        ]
-        flat_image = flatten_image(image)
-        assert flat_image == [
-            1,
-            0,
-            1,
-            0,
-            0,
-            1,
-            0,
-            1,
-            0,
-            0,
-            0,
-            1,
-            1,
-            0,
-            0,
-            1,
-        ], "Image was not flatten"
-
-    def test_unflatten_image_5x5(self) -> None:
-        """
-        Verify output of unflatten_image for a 5x5 image.
-        """
-        flat_image = [
-            1,
-            0,
-            0,
-            0,
-            1,
-            0,
-            1,
-            0,
-            1,
-            0,
-            0,
-            0,
-            1,
-            0,
-            0,
-            0,
-            1,
-            0,
-            1,
-            0,
-            1,
-            0,
-            0,
-            0,
-            1,
-        ]
-        unflat_image = unflatten_image(flat_image)
-        assert unflat_image == [
-            [1, 0, 0, 0, 1],
-            [0, 1, 0, 1, 0],
-            [0, 0, 1, 0, 0],
-            [0, 1, 0, 1, 0],
-            [1, 0, 0, 0, 1],
-        ], "Image was not unflatten"
-
-    def test_unflatten_image_3x3(self) -> None:
-        """
-        Verify output of unflatten_image for a 3x3 image.
-        """
-        flat_image = [1, 0, 1, 0, 1, 0, 0, 1, 0]
-        unflat_image = unflatten_image(flat_image)
-        assert unflat_image == [
-            [1, 0, 1],
-            [0, 1, 0],
-            [0, 1, 0],
-        ], "Image was not unflatten"
-
-    def test_unflatten_image_4x4(self) -> None:
-        """
-        Verify output of unflatten_image for a 4x4 image.
-        """
-        flat_image = [1, 0, 1, 0, 0, 1, 0, 1, 0, 0, 0, 1, 1, 0, 0, 1]
-        unflat_image = unflatten_image(flat_image)
-        assert unflat_image == [
-            [1, 0, 1, 0],
-            [0, 1, 0, 1],
-            [0, 0, 0, 1],
-            [1, 0, 0, 1],
-        ], "Image was not unflatten"
-
-    def test_check_adjacent_for_one_no_adjacent_middle(self) -> None:
-        """
-        Verify output of check_adjacent_for_one when there's no adjacent in the middle.
-        """
-        image = [
-            [1, 0, 0, 0, 1],
-            [0, 1, 0, 1, 0],
-            [0, 0, 1, 0, 0],
-            [0, 1, 0, 1, 0],
-            [1, 0, 0, 0, 1],
-        ]
-        flat_image = flatten_image(image)
-        assert (
-            check_adjacent_for_one(flat_image, 2) == False
-        ), "It should be not adjacent"
-
-    def test_check_adjacent_for_one_on_the_left(self) -> None:
-        """
-        Verify output of check_adjacent_for_one when there's an adjacent to the left.
-        """
-        image = [
-            [1, 0, 0],
-            [0, 0, 0],
-            [0, 1, 0],
-        ]
-        flat_image = flatten_image(image)
-        assert check_adjacent_for_one(flat_image, 1) == True, "It should be adjacent"
-
-    def test_check_adjacent_for_one_on_the_right(self) -> None:
-        """
-        Verify output of check_adjacent_for_one when there's an adjacent to the right.
-        """
-        image = [
-            [0, 0, 1],
-            [0, 0, 0],
-            [0, 1, 0],
-        ]
-        flat_image = flatten_image(image)
-        assert check_adjacent_for_one(flat_image, 1) == True, "It should be adjacent"
-
-    def test_check_adjacent_for_one_on_the_up(self) -> None:
-        """
-        Verify output of check_adjacent_for_one when there's an adjacent its up.
-        """
-        image = [
-            [0, 0, 0],
-            [0, 0, 0],
-            [0, 1, 0],
-        ]
-        flat_image = flatten_image(image)
-        assert check_adjacent_for_one(flat_image, 4) == True, "It should be adjacent"
-
-    def test_check_adjacent_for_one_on_the_down(self) -> None:
-        """
-        Verify output of check_adjacent_for_one when there's an adjacent its down.
-        """
-        image = [
-            [1, 1, 1],
-            [0, 0, 0],
-            [0, 0, 0],
-        ]
-        flat_image = flatten_image(image)
-        assert check_adjacent_for_one(flat_image, 3) == True, "It should be adjacent"
-
-    def test_check_adjacent_for_one_when_position_is_one(self) -> None:
-        """
-        Verify output of check_adjacent_for_one when the position lands on a 1.
-        """
-        image = [
-            [0, 0, 1],
-            [0, 0, 0],
-            [0, 1, 0],
-        ]
-        flat_image = flatten_image(image)
-        assert (
-            check_adjacent_for_one(flat_image, 2) == False
-        ), "It should not be adjacent"
-
-    def test_check_adjacent_for_one_when_position_is_on_corner(self) -> None:
-        """
-        Verify output of check_adjacent_for_one when the position lands on a 1.
-        """
-        image = [
-            [1, 0, 1, 0],
-            [0, 1, 0, 1],
-            [0, 0, 0, 1],
-            [0, 0, 0, 1],
-        ]
-        flat_image = flatten_image(image)
-        assert (
-            check_adjacent_for_one(flat_image, 8) == False
-        ), "It should not be adjacent"
-
-    def test_pixel_flip(self) -> None:
-        """
-        Verify output of pixel_flip for a 5x5 image with a budget of 2.
-        """
-
-        image = [
-            [1, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0],
-            [1, 0, 0, 0, 0],
-        ]
-
-        flat_image = flatten_image(image)
-        flipped_possibilities = []
-        pixel_flip(flat_image, flat_image, 2, flipped_possibilities)
-
-        # all the expected flipped possibilities from image
-        expected_flipped_possibilites = [
-            [1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0],
-            [1, 1, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0],
-            [1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0],
-            [1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 0, 0, 0],
-            [1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0],
-            [1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0],
-            [1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 0, 0, 0],
-            [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0],
-            [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 1, 0, 0, 0],
-            [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 0, 0, 0],
-        ]
-
-        # check if flipped_possibilities matches all the expected flipped possibilities
-        for possibility in flipped_possibilities:
-            assert (
-                possibility in expected_flipped_possibilites
-            ), "Possibility was not found in expected_flipped_possibilites"
-
-    def test_generate_new_images_size(self) -> None:
-        """
-        Verify generate_new_images with image.txt and for each image of the generated images verify that image is of size 28x28,
-        """
-        image = read_image("image.txt")
-        new_images = generate_new_images(image, 2)
-
-        # check all images have 28 rows
-        for new_image in new_images:
-            assert len(new_image) == 28, "Not all images have 28 rows"
-
-        # check each row of all images, has 28 columns
-        for new_image in new_images:
-            for row in new_image:
-                assert len(row) == 28, "Not all images have 28 columns"
-
-    def test_generate_new_images_size_check_values(self) -> None:
-        """
-        Verify generate_new_images with image.txt and for each image of the generated images verify that all values in the generated image are either 1s or 0s,
-        """
-        image = read_image("image.txt")
-        new_images = generate_new_images(image, 2)
-
-        # test all values in the generated image are either 1s or 0s
-        for new_image in new_images:
-            flat_image = flatten_image(new_image)
-            assert all(
-                elem in [0, 1] for elem in flat_image
-            ), "Not all numbers are 0 and 1"
-
-    def test_generate_new_images_size_within_budget(self) -> None:
-        """
-        Verify generate_new_images with image.txt and for each image of the generated images verify that the number of pixels flipped from original image are within budget,
-        """
-        image = read_image("image.txt")
-        original_flat = flatten_image(image)
-        new_images = generate_new_images(image, 2)
-
-        # test the number of pixels flipped from original image are within budget
-        num_flipped_zeros = 0
-        for new_image in new_images:
-            flat_image = flatten_image(new_image)
-            for idx in range(len(flat_image)):
-                if original_flat[idx] != flat_image[idx]:
-                    num_flipped_zeros += 1
-            assert num_flipped_zeros <= 2, "Numbers flipped from 0 to 1 is over budget"
-            num_flipped_zeros = 0
-
-    def test_generate_new_images_size_adjacent_to_one(self) -> None:
-        """
-        Verify generate_new_images with image.txt and for each image of the generated images verify that all pixels flipped from the original image had an adjacent value of 1.
-        """
-        image = read_image("image.txt")
-        original_flat = flatten_image(image)
-        new_images = generate_new_images(image, 2)
-        # test all pixels flipped from the original image had an adjacent value of 1
-        for new_image in new_images:
-            flat_image = flatten_image(new_image)
-            for idx in range(len(original_flat)):
-                if original_flat[idx] != flat_image[idx]:
-                    assert (
-                        check_adjacent_for_one(original_flat, idx) == True
-                    ), "Not all pixels flipped are from the original image that had an adjacent value of 1"
-
-
-if __name__ == "__main__":
-    unittest.main()
+from __future__ import annotations
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from generative import (
+    BitImage,
+    flatten_image,
+    unflatten_image,
+    check_adjacent_for_one,
+    pixel_flip,
+    write_image,
+    generate_new_images,
+    flip_pixels,
+    flippable_pixels,
+    count_new_images,
+    iter_flip_combinations,
+    iter_flipped_images,
+    iter_new_images,
+    search_flipped_images,
+    main,
+    render_image,
+    ImageArchive,
+    ImageArchiveWriter,
+    GenerationStats,
+    ResultStore,
+    flip_key,
+    flip_mask,
+    mask_key,
+    iter_new_flips,
+    GenerationSession,
+    sample_new_flips,
+    neighbour_offsets,
+    generation_pool,
+)
+from dataset import Dataset
+import ai
+from ai import Model, QuantizedModel, load_model, predict_flipped, predict_number, read_image
+
+
+class TestGenerative(unittest.TestCase):
+    """Unit tests for the module generative.py"""
+
+    def test_flatten_image_5x5(self) -> None:
+        """
+        Verify flatten_image of a 5x5 table.
+        """
+        image = [
+            [1, 0, 0, 0, 1],
+            [0, 1, 0, 1, 0],
+            [0, 0, 1, 0, 0],
+            [0, 1, 0, 1, 0],
+            [1, 0, 0, 0, 1],
+        ]
+        flat_image = flatten_image(image)
+        assert flat_image == [
+            1,
+            0,
+            0,
+            0,
+            1,
+            0,
+            1,
+            0,
+            1,
+            0,
+            0,
+            0,
+            1,
+            0,
+            0,
+            0,
+            1,
+            0,
+            1,
+            0,
+            1,
+            0,
+            0,
+            0,
+            1,
+        ], "Image was not flatten"
+
+    def test_flatten_image_3x3(self) -> None:
+        """
+        Verify flatten_image of a 3x3 table.
+        """
+        image = [
+            [1, 0, 1],
+            [0, 1, 0],
+            [0, 1, 0],
+        ]
+        flat_image = flatten_image(image)
+        assert flat_image == [1, 0, 1, 0, 1, 0, 0, 1, 0], "Image was not flatten"
+
+    def test_flatten_image_4x4(self) -> None:
+        """
+        Verify flatten_image of a 4x4 table.
+        """
+        image = [
+            [1, 0, 1, 0],
+            [0, 1, 0, 1],
+            [0, 0, 0, 1],
+            [1, 0, 0, 1],
+        ]
+        flat_image = flatten_image(image)
+        assert flat_image == [
+            1,
+            0,
+            1,
+            0,
+            0,
+            1,
+            0,
+            1,
+            0,
+            0,
+            0,
+            1,
+            1,
+            0,
+            0,
+            1,
+        ], "Image was not flatten"
+
+    def test_unflatten_image_5x5(self) -> None:
+        """
+        Verify output of unflatten_image for a 5x5 image.
+        """
+        flat_image = [
+            1,
+            0,
+            0,
+            0,
+            1,
+            0,
+            1,
+            0,
+            1,
+            0,
+            0,
+            0,
+            1,
+            0,
+            0,
+            0,
+            1,
+            0,
+            1,
+            0,
+            1,
+            0,
+            0,
+            0,
+            1,
+        ]
+        unflat_image = unflatten_image(flat_image)
+        assert unflat_image == [
+            [1, 0, 0, 0, 1],
+            [0, 1, 0, 1, 0],
+            [0, 0, 1, 0, 0],
+            [0, 1, 0, 1, 0],
+            [1, 0, 0, 0, 1],
+        ], "Image was not unflatten"
+
+    def test_unflatten_image_3x3(self) -> None:
+        """
+        Verify output of unflatten_image for a 3x3 image.
+        """
+        flat_image = [1, 0, 1, 0, 1, 0, 0, 1, 0]
+        unflat_image = unflatten_image(flat_image)
+        assert unflat_image == [
+            [1, 0, 1],
+            [0, 1, 0],
+            [0, 1, 0],
+        ], "Image was not unflatten"
+
+    def test_unflatten_image_4x4(self) -> None:
+        """
+        Verify output of unflatten_image for a 4x4 image.
+        """
+        flat_image = [1, 0, 1, 0, 0, 1, 0, 1, 0, 0, 0, 1, 1, 0, 0, 1]
+        unflat_image = unflatten_image(flat_image)
+        assert unflat_image == [
+            [1, 0, 1, 0],
+            [0, 1, 0, 1],
+            [0, 0, 0, 1],
+            [1, 0, 0, 1],
+        ], "Image was not unflatten"
+
+    def test_check_adjacent_for_one_no_adjacent_middle(self) -> None:
+        """
+        Verify output of check_adjacent_for_one when there's no adjacent in the middle.
+        """
+        image = [
+            [1, 0, 0, 0, 1],
+            [0, 1, 0, 1, 0],
+            [0, 0, 1, 0, 0],
+            [0, 1, 0, 1, 0],
+            [1, 0, 0, 0, 1],
+        ]
+        flat_image = flatten_image(image)
+        assert (
+            check_adjacent_for_one(flat_image, 2) == False
+        ), "It should be not adjacent"
+
+    def test_check_adjacent_for_one_on_the_left(self) -> None:
+        """
+        Verify output of check_adjacent_for_one when there's an adjacent to the left.
+        """
+        image = [
+            [1, 0, 0],
+            [0, 0, 0],
+            [0, 1, 0],
+        ]
+        flat_image = flatten_image(image)
+        assert check_adjacent_for_one(flat_image, 1) == True, "It should be adjacent"
+
+    def test_check_adjacent_for_one_on_the_right(self) -> None:
+        """
+        Verify output of check_adjacent_for_one when there's an adjacent to the right.
+        """
+        image = [
+            [0, 0, 1],
+            [0, 0, 0],
+            [0, 1, 0],
+        ]
+        flat_image = flatten_image(image)
+        assert check_adjacent_for_one(flat_image, 1) == True, "It should be adjacent"
+
+    def test_check_adjacent_for_one_on_the_up(self) -> None:
+        """
+        Verify output of check_adjacent_for_one when there's an adjacent its up.
+        """
+        image = [
+            [0, 0, 0],
+            [0, 0, 0],
+            [0, 1, 0],
+        ]
+        flat_image = flatten_image(image)
+        assert check_adjacent_for_one(flat_image, 4) == True, "It should be adjacent"
+
+    def test_check_adjacent_for_one_on_the_down(self) -> None:
+        """
+        Verify output of check_adjacent_for_one when there's an adjacent its down.
+        """
+        image = [
+            [1, 1, 1],
+            [0, 0, 0],
+            [0, 0, 0],
+        ]
+        flat_image = flatten_image(image)
+        assert check_adjacent_for_one(flat_image, 3) == True, "It should be adjacent"
+
+    def test_check_adjacent_for_one_when_position_is_one(self) -> None:
+        """
+        Verify output of check_adjacent_for_one when the position lands on a 1.
+        """
+        image = [
+            [0, 0, 1],
+            [0, 0, 0],
+            [0, 1, 0],
+        ]
+        flat_image = flatten_image(image)
+        assert (
+            check_adjacent_for_one(flat_image, 2) == False
+        ), "It should not be adjacent"
+
+    def test_check_adjacent_for_one_when_position_is_on_corner(self) -> None:
+        """
+        Verify output of check_adjacent_for_one when the position lands on a 1.
+        """
+        image = [
+            [1, 0, 1, 0],
+            [0, 1, 0, 1],
+            [0, 0, 0, 1],
+            [0, 0, 0, 1],
+        ]
+        flat_image = flatten_image(image)
+        assert (
+            check_adjacent_for_one(flat_image, 8) == False
+        ), "It should not be adjacent"
+
+    def test_pixel_flip(self) -> None:
+        """
+        Verify output of pixel_flip for a 5x5 image with a budget of 2.
+        """
+
+        image = [
+            [1, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0],
+            [1, 0, 0, 0, 0],
+        ]
+
+        flat_image = flatten_image(image)
+        flipped_possibilities = []
+        pixel_flip(flat_image, flat_image, 2, flipped_possibilities)
+
+        # all the expected flipped possibilities from image
+        expected_flipped_possibilites = [
+            [1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0],
+            [1, 1, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0],
+            [1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0],
+            [1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 0, 0, 0],
+            [1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0],
+            [1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0],
+            [1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 0, 0, 0],
+            [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0],
+            [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 1, 0, 0, 0],
+            [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 0, 0, 0],
+        ]
+
+        # check if flipped_possibilities matches all the expected flipped possibilities
+        for possibility in flipped_possibilities:
+            assert (
+                possibility in expected_flipped_possibilites
+            ), "Possibility was not found in expected_flipped_possibilites"
+
+    def test_generate_new_images_size(self) -> None:
+        """
+        Verify generate_new_images with image.txt and for each image of the generated images verify that image is of size 28x28,
+        """
+        image = read_image("image.txt")
+        new_images = generate_new_images(image, 2)
+
+        # check all images have 28 rows
+        for new_image in new_images:
+            assert len(new_image) == 28, "Not all images have 28 rows"
+
+        # check each row of all images, has 28 columns
+        for new_image in new_images:
+            for row in new_image:
+                assert len(row) == 28, "Not all images have 28 columns"
+
+    def test_generate_new_images_size_check_values(self) -> None:
+        """
+        Verify generate_new_images with image.txt and for each image of the generated images verify that all values in the generated image are either 1s or 0s,
+        """
+        image = read_image("image.txt")
+        new_images = generate_new_images(image, 2)
+
+        # test all values in the generated image are either 1s or 0s
+        for new_image in new_images:
+            flat_image = flatten_image(new_image)
+            assert all(
+                elem in [0, 1] for elem in flat_image
+            ), "Not all numbers are 0 and 1"
+
+    def test_generate_new_images_size_within_budget(self) -> None:
+        """
+        Verify generate_new_images with image.txt and for each image of the generated images verify that the number of pixels flipped from original image are within budget,
+        """
+        image = read_image("image.txt")
+        original_flat = flatten_image(image)
+        new_images = generate_new_images(image, 2)
+
+        # test the number of pixels flipped from original image are within budget
+        num_flipped_zeros = 0
+        for new_image in new_images:
+            flat_image = flatten_image(new_image)
+            for idx in range(len(flat_image)):
+                if original_flat[idx] != flat_image[idx]:
+                    num_flipped_zeros += 1
+            assert num_flipped_zeros <= 2, "Numbers flipped from 0 to 1 is over budget"
+            num_flipped_zeros = 0
+
+    def test_generate_new_images_size_adjacent_to_one(self) -> None:
+        """
+        Verify generate_new_images with image.txt and for each image of the generated images verify that all pixels flipped from the original image had an adjacent value of 1.
+        """
+        image = read_image("image.txt")
+        original_flat = flatten_image(image)
+        new_images = generate_new_images(image, 2)
+        # test all pixels flipped from the original image had an adjacent value of 1
+        for new_image in new_images:
+            flat_image = flatten_image(new_image)
+            for idx in range(len(original_flat)):
+                if original_flat[idx] != flat_image[idx]:
+                    assert (
+                        check_adjacent_for_one(original_flat, idx) == True
+                    ), "Not all pixels flipped are from the original image that had an adjacent value of 1"
+
+    def test_flippable_pixels_matches_check_adjacent_for_one(self) -> None:
+        """
+        Verify flippable_pixels finds exactly the pixels accepted by check_adjacent_for_one.
+        """
+        images = [
+            read_image(file_name)
+            for file_name in ["image.txt", "another_image.txt", "confusing_image.txt"]
+        ]
+        images.append(
+            [
+                [1, 0, 1, 0],
+                [0, 1, 0, 1],
+                [0, 0, 0, 1],
+                [1, 0, 0, 1],
+            ]
+        )
+        for image in images:
+            flat_image = flatten_image(image)
+            assert flippable_pixels(flat_image) == [
+                idx
+                for idx in range(len(flat_image))
+                if check_adjacent_for_one(flat_image, idx)
+            ], "Flippable pixels differ from check_adjacent_for_one"
+
+    def test_iter_flip_combinations_order(self) -> None:
+        """
+        Verify iter_flip_combinations yields every combination within the budget in lexicographic order.
+        """
+        combinations = list(iter_flip_combinations([2, 5, 7, 9], 3))
+        assert combinations == sorted(
+            combinations
+        ), "Combinations are not in lexicographic order"
+        assert len(combinations) == len(
+            set(combinations)
+        ), "Combinations are repeated"
+        assert len(combinations) == 4 + 6 + 4, "Combinations are missing"
+        assert list(iter_flip_combinations([2, 5], 0)) == [], "Budget of 0 flips"
+
+    def test_count_new_images(self) -> None:
+        """
+        Verify count_new_images counts the combinations generated by iter_flipped_images.
+        """
+        image = read_image("confusing_image.txt")
+        for budget in [0, 1, 2]:
+            assert count_new_images(image, budget) == sum(
+                1 for _ in iter_flipped_images(image, budget)
+            ), "Count differs from the generated combinations"
+
+    def test_iter_flipped_images_matches_pixel_flip(self) -> None:
+        """
+        Verify iter_flipped_images yields the combinations of pixel_flip, in the same order.
+        """
+        image = read_image("image.txt")
+        flat_image = flatten_image(image)
+        flipped_possibilities = []
+        pixel_flip(flat_image, flat_image, 2, flipped_possibilities)
+
+        assert [
+            flip_pixels(flat_image, flipped) for flipped in iter_flipped_images(image, 2)
+        ] == flipped_possibilities, "Combinations differ from pixel_flip"
+
+    def test_iter_new_images_matches_predict_number(self) -> None:
+        """
+        Verify iter_new_images yields exactly the flipped images whose prediction matches the original.
+        """
+        image = read_image("another_image.txt")
+        flat_image = flatten_image(image)
+        flipped_possibilities = []
+        pixel_flip(flat_image, flat_image, 1, flipped_possibilities)
+
+        original_number = predict_number(image)
+        expected = [
+            unflatten_image(possibility)
+            for possibility in flipped_possibilities
+            if predict_number(unflatten_image(possibility)) == original_number
+        ]
+        assert list(iter_new_images(image, 1)) == expected, "New images differ"
+
+    def test_generate_new_images_with_workers(self) -> None:
+        """
+        Verify generate_new_images with several worker processes gives the same images, in the same order.
+        """
+        image = read_image("image.txt")
+        assert generate_new_images(image, 2, workers=3) == generate_new_images(
+            image, 2
+        ), "Parallel images differ from serial images"
+
+    def test_generation_pool_is_shared(self) -> None:
+        """
+        Verify one pool of workers generates the images of several inputs, with and without pruning, and stays usable
+        after a run that was stopped early.
+        """
+        model = load_model()
+        images = [read_image(file_name) for file_name in ["image.txt", "another_image.txt", "confusing_image.txt"]]
+        with generation_pool(model, 2) as pool:
+            new_images = iter_new_images(images[0], 2, model, 2, executor=pool)
+            next(new_images)
+            new_images.close()
+            for image in images:
+                expected = generate_new_images(image, 2, model)
+                assert generate_new_images(image, 2, model, 2, executor=pool) == expected, "Pooled images differ"
+                assert generate_new_images(image, 2, model, 2, prune=True, executor=pool) == expected, "Pruned differ"
+
+    def test_search_flipped_images_matches_exhaustive(self) -> None:
+        """
+        Verify search_flipped_images keeps exactly the combinations kept by classifying every combination.
+        """
+        for file_name in ["image.txt", "another_image.txt", "confusing_image.txt"]:
+            image = read_image(file_name)
+            combinations = list(iter_flipped_images(image, 2))
+            new_numbers = predict_flipped(image, combinations)
+            original_number = predict_number(image)
+            expected = [
+                flipped
+                for flipped, new_number in zip(combinations, new_numbers)
+                if new_number == original_number
+            ]
+            kept, num_pruned = search_flipped_images(image, 2)
+            assert kept == expected, "Kept combinations differ from the exhaustive search"
+            assert 0 <= num_pruned <= len(combinations) - len(
+                kept
+            ), "Pruned combinations are miscounted"
+
+    def test_search_flipped_images_prunes(self) -> None:
+        """
+        Verify search_flipped_images skips every combination that flips a pixel which always changes the number.
+        """
+        image = [
+            [0, 0, 0],
+            [0, 1, 0],
+            [0, 0, 0],
+        ]
+        # the second hidden value only grows when pixel 1 is flipped, and then makes the number 1 win
+        weights = [
+            [[0.0] * 9, [0.0, 1.0] + [0.0] * 7],
+            [[1.0, 0.0], [0.0, 3.0]],
+        ]
+        biases = [[1.0, 0.0], [0.0, 0.0]]
+        kept, num_pruned = search_flipped_images(image, 2, Model(weights, biases))
+
+        assert kept == [(3,), (3, 5), (3, 7), (5,), (5, 7), (7,)], "Wrong combinations kept"
+        assert num_pruned == 4, "Combinations with pixel 1 were not pruned"
+
+    def test_generate_new_images_with_prune(self) -> None:
+        """
+        Verify generate_new_images gives the same images with pruning, serially and with workers.
+        """
+        image = read_image("confusing_image.txt")
+        expected = generate_new_images(image, 2)
+        assert generate_new_images(image, 2, prune=True) == expected, "Pruned images differ"
+        assert (
+            generate_new_images(image, 2, workers=2, prune=True) == expected
+        ), "Parallel pruned images differ"
+
+    def test_generation_stats_counts(self) -> None:
+        """
+        Verify GenerationStats counts every enumerated, classified and kept candidate and times every stage.
+        """
+        image = read_image("image.txt")
+        model = load_model()
+        calls = []
+        stats = GenerationStats(callback=calls.append)
+        new_images = generate_new_images(image, 2, model, stats=stats)
+
+        candidates = count_new_images(image, 2)
+        assert stats.enumerated == stats.classified == candidates, "Wrong number of candidates counted"
+        assert stats.kept == len(new_images), "Wrong number of kept candidates"
+        assert stats.pruned == 0 and stats.weight_loads == 0, "Nothing was pruned or loaded"
+        assert all(seconds > 0 for seconds in stats.seconds.values()), "A stage was not timed"
+        assert calls == [stats] and stats.runs == 1, "Callback was not called once"
+
+        weight_loads = ai.weight_loads
+        search_stats = GenerationStats()
+        assert generate_new_images(image, 2, model, prune=True, stats=search_stats) == new_images, "Images differ"
+        assert search_stats.classified + search_stats.pruned == candidates, "Pruned candidates are miscounted"
+        assert ai.weight_loads == weight_loads, "Weights were loaded again"
+
+    def test_generation_stats_early_stop(self) -> None:
+        """
+        Verify the stats of a run stopped early count only the candidates that were produced.
+        """
+        stats = GenerationStats()
+        new_images = iter_new_images(read_image("image.txt"), 2, load_model(), stats=stats)
+        assert len([next(new_images) for _ in range(3)]) == 3, "Not enough images"
+        new_images.close()
+
+        assert stats.kept == 3 and stats.runs == 1, "Run did not end when closed"
+        assert stats.enumerated < count_new_images(read_image("image.txt"), 2), "Every candidate was enumerated"
+
+    def test_iter_new_flips_stop(self) -> None:
+        """
+        Verify a stop function ends a run after the candidates classified before it returned True, with and without
+        pruning.
+        """
+        image = read_image("image.txt")
+        expected = list(iter_new_flips(image, 2))
+        for prune in [False, True]:
+            calls = []
+
+            def stop() -> bool:
+                calls.append(None)
+                return len(calls) > 50
+
+            stats = GenerationStats()
+            flips = list(iter_new_flips(image, 2, prune=prune, stats=stats, stop=stop))
+            assert flips == expected[: len(flips)], "Stopped run gives other flips"
+            assert stats.classified == 50, "Candidates were classified after the stop"
+
+    def test_flip_key_and_mask(self) -> None:
+        """
+        Verify flip_key and flip_mask identify the same flipped pixels whatever their order, and convert into each other.
+        """
+        assert flip_key([30, 2, 17, 2]) == (2, 17, 30), "Wrong key"
+        assert flip_mask([30, 2, 17]) == flip_mask((17, 30, 2)) == (1 << 2) | (1 << 17) | (1 << 30), "Wrong mask"
+        assert mask_key(flip_mask([30, 2, 17])) == (2, 17, 30), "Mask does not convert back"
+
+        combinations = list(iter_flipped_images(read_image("image.txt"), 2))
+        assert sorted(reversed(combinations)) == combinations, "Canonical order differs from the generated order"
+
+    def test_result_store_merges_runs(self) -> None:
+        """
+        Verify a ResultStore deduplicates the results of several budgets and iterates them in canonical order.
+        """
+        image = read_image("image.txt")
+        model = load_model()
+        store = ResultStore(image)
+        assert store.update(iter_new_flips(image, 1, model)) == len(generate_new_images(image, 1, model)), "Wrong count"
+
+        other = ResultStore(BitImage.from_image(image))
+        other.update(iter_new_flips(image, 2, model))
+        num_new = store.merge(other)
+        assert list(store) == list(iter_new_flips(image, 2, model)), "Merged results differ from budget 2"
+        assert num_new == len(other) - len(generate_new_images(image, 1, model)), "Duplicates were added"
+        assert list(store.images()) == generate_new_images(image, 2, model), "Images differ"
+
+        new_image = generate_new_images(image, 2, model)[5]
+        assert not store.add_image(new_image), "An image already held was added"
+        assert list(store)[5] in store and store.difference(other) == [], "Wrong membership"
+        with self.assertRaises(ValueError):
+            store.merge(ResultStore(read_image("another_image.txt")))
+
+    def test_generation_session_extends(self) -> None:
+        """
+        Verify extending a GenerationSession budget by budget finds the same images as generating the last budget.
+        """
+        model = load_model()
+        for file_name in ["image.txt", "confusing_image.txt"]:
+            image = read_image(file_name)
+            session = GenerationSession(image, model)
+            assert session.extend() == list(iter_new_flips(image, 1, model)), "Wrong budget 1 images"
+
+            new_flips = session.extend(2)
+            assert all(len(flipped) == 2 for flipped in new_flips), "Budget 1 images found again"
+            assert list(session.images()) == generate_new_images(image, 2, model), "Images differ"
+            assert session.extend(1) == [] and session.budget == 2, "Extending to a smaller budget"
+
+    def test_sample_new_flips(self) -> None:
+        """
+        Verify both sampling strategies find at most limit images that keep the number, and the whole space when allowed.
+        """
+        image = read_image("another_image.txt")
+        model = load_model()
+        expected = list(iter_new_flips(image, 2, model))
+        for strategy in ["random", "margin"]:
+            flips, explored = sample_new_flips(image, 5, 20, model, strategy, seed=7, max_candidates=1000)
+            assert len(flips) == 20 and 0 < explored < 0.001, "Wrong number of images or explored fraction"
+            new_numbers = predict_flipped(image, flips)
+            assert new_numbers == [predict_number(image)] * 20, "Images do not keep the number"
+            assert len({flip_key(flipped) for flipped in flips}) == 20, "Duplicate images"
+
+            flips, explored = sample_new_flips(image, 2, 10**6, model, strategy, seed=7)
+            assert sorted(flips) == expected and explored == 1.0, "Whole space not found"
+
+        assert sample_new_flips(image, 5, 20, model, seed=3) == sample_new_flips(
+            image, 5, 20, model, seed=3
+        ), "Seeded runs differ"
+        with self.assertRaises(ValueError):
+            sample_new_flips(image, 2, 20, model, "exhaustive")
+
+    def test_flippable_pixels_of_non_square_images(self) -> None:
+        """
+        Verify flippable_pixels finds the pixels next to a 1 of a non-square image for 4, 8 and custom neighbourhoods.
+        """
+        image = [
+            [0, 0, 0, 0, 0],
+            [0, 1, 0, 0, 0],
+            [0, 0, 0, 0, 1],
+        ]
+        flat_image = flatten_image(image)
+        assert unflatten_image(flat_image, 5) == image, "Wrong rows"
+        for neighbourhood in [4, 8, [(0, 2)], [(-1, -1), (2, 0)]]:
+            expected = [
+                row * 5 + col
+                for row in range(3)
+                for col in range(5)
+                if image[row][col] == 0
+                and any(
+                    0 <= row + row_offset < 3 and 0 <= col + col_offset < 5 and image[row + row_offset][col + col_offset]
+                    for row_offset, col_offset in neighbour_offsets(neighbourhood)
+                )
+            ]
+            assert flippable_pixels(flat_image, 5, neighbourhood) == expected, f"Wrong pixels for {neighbourhood}"
+        assert flippable_pixels(flat_image, 5) == [
+            idx for idx in range(15) if check_adjacent_for_one(flat_image, idx, 5)
+        ], "flippable_pixels differs from check_adjacent_for_one"
+        with self.assertRaises(ValueError):
+            flippable_pixels(flat_image, 5, 6)
+
+    def test_generate_new_images_of_non_square_images(self) -> None:
+        """
+        Verify generate_new_images keeps the shape of a non-square image and classifies every candidate by its pixels.
+        """
+        image = [
+            [0, 0, 0, 0, 0],
+            [0, 1, 1, 0, 0],
+            [0, 0, 0, 0, 1],
+        ]
+        # number 1 wins once more than one of the pixels in the top row is set
+        weights = [[[1.0] * 5 + [0.0] * 10], [[0.0], [1.0]]]
+        biases = [[0.0], [1.5, 0.0]]
+        model = Model(weights, biases)
+        flat_image = flatten_image(image)
+        expected = [
+            unflatten_image(flip_pixels(flat_image, flipped), 5)
+            for flipped in iter_flip_combinations(flippable_pixels(flat_image, 5, 8), 3)
+            if model.predict(unflatten_image(flip_pixels(flat_image, flipped), 5)) == 0
+        ]
+        new_images = generate_new_images(image, 3, model, neighbourhood=8)
+        assert new_images == expected and len(new_images) < count_new_images(image, 3, 8), "Wrong images"
+        assert all(len(new_image) == 3 and len(new_image[0]) == 5 for new_image in new_images), "Wrong shape"
+        assert generate_new_images(image, 3, model, prune=True, neighbourhood=8) == expected, "Pruned images differ"
+
+    def test_generate_new_images_with_quantized_model(self) -> None:
+        """
+        Verify generate_new_images gives the same images with a QuantizedModel, also with workers, and refuses to prune.
+        """
+        image = read_image("another_image.txt")
+        model = load_model()
+        quantized = QuantizedModel(model)
+        expected = generate_new_images(image, 2, model)
+        assert generate_new_images(image, 2, quantized) == expected, "Quantized images differ"
+        assert generate_new_images(image, 2, quantized, workers=2) == expected, "Parallel quantized images differ"
+        with self.assertRaises(ValueError):
+            generate_new_images(image, 2, quantized, prune=True)
+
+    def test_bit_image_round_trip(self) -> None:
+        """
+        Verify a BitImage converts back to the same nested and flat lists, and reads and writes single pixels.
+        """
+        image = read_image("image.txt")
+        bit_image = BitImage.from_image(image)
+        assert bit_image.to_image() == image, "Image changed when packed"
+        assert unflatten_image(bit_image) == image, "unflatten_image of a BitImage"
+        assert flatten_image(bit_image) == flatten_image(image), "flatten_image of a BitImage"
+        assert bit_image[5] == image[5], "Row of a BitImage"
+        assert len(bit_image.bits) == 98, "784 pixels should take 98 bytes"
+
+        bit_image.set(0, 1)
+        assert bit_image.get(0) == 1, "Pixel was not set"
+        bit_image.set(0, 0)
+        assert bit_image.get(0) == 0, "Pixel was not cleared"
+        assert bit_image == BitImage.from_image(image), "Image changed after set"
+
+    def test_bit_image_diff(self) -> None:
+        """
+        Verify diff finds the pixels flipped in a BitImage.
+        """
+        bit_image = BitImage.from_image(read_image("image.txt"))
+        assert bit_image.flipped((3, 200, 783)).diff(bit_image) == [3, 200, 783], "Wrong flipped pixels"
+        assert bit_image.diff(bit_image) == [], "An image differs from itself"
+
+    def test_bit_image_accepted_by_helpers(self) -> None:
+        """
+        Verify the adjacency checks and write_image give the same results for a BitImage as for a 2D list.
+        """
+        image = read_image("confusing_image.txt")
+        flat_image = flatten_image(image)
+        bit_image = BitImage.from_image(image)
+        assert flippable_pixels(bit_image) == flippable_pixels(flat_image), "flippable_pixels of a BitImage"
+        for idx in [0, 100, 200, 300, 400, 500]:
+            assert check_adjacent_for_one(bit_image, idx) == check_adjacent_for_one(
+                flat_image, idx
+            ), "check_adjacent_for_one of a BitImage"
+
+        new_image = unflatten_image(flip_pixels(flat_image, (100, 200)))
+        with tempfile.TemporaryDirectory() as directory:
+            list_file = os.path.join(directory, "list.txt")
+            bit_file = os.path.join(directory, "bit.txt")
+            write_image(image, new_image, list_file)
+            write_image(bit_image, BitImage.from_image(new_image), bit_file)
+            with open(list_file) as f_list, open(bit_file) as f_bit:
+                assert f_list.read() == f_bit.read(), "write_image of a BitImage"
+
+    def test_main_writes_limited_images(self) -> None:
+        """
+        Verify main generates images for every input of a glob and writes at most the limit for each of them.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            output = io.StringIO()
+            with redirect_stdout(output):
+                status = main(["*image.txt", "--budget", "1", "--limit", "3", "--output-dir", directory])
+
+            assert status == 0, "main failed"
+            assert sorted(os.listdir(directory)) == [
+                f"{stem}_new_image_{k}.txt"
+                for stem in ["another_image", "confusing_image", "image"]
+                for k in [1, 2, 3]
+            ], "Wrong files written"
+            assert "Number of new images generated: 9 from 3 inputs" in output.getvalue(), "Wrong summary"
+
+            output = io.StringIO()
+            with redirect_stdout(output):
+                main(["image.txt", "--budget", "1", "--limit", "2", "--output-dir", directory, "--stats"])
+            assert "kept 2, pruned 0, weight loads 0;" in output.getvalue(), "Wrong stats printed"
+
+    def test_write_image_format(self) -> None:
+        """
+        Verify write_image writes every row on its own line with the flipped pixels marked as X.
+        """
+        image = [
+            [1, 0, 0],
+            [0, 0, 0],
+            [0, 1, 0],
+        ]
+        new_image = [
+            [1, 1, 0],
+            [0, 0, 0],
+            [0, 1, 1],
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "new_image.txt")
+            write_image(image, new_image, file_name)
+            with open(file_name) as f:
+                assert f.read() == "1X0\n000\n01X\n", "Wrong image written"
+
+    def test_image_archive_random_access(self) -> None:
+        """
+        Verify every image of an archive reads back as render_image renders it, also after appending to the archive.
+        """
+        image = read_image("image.txt")
+        new_images = generate_new_images(image, 1)
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "archive.txt")
+            with ImageArchiveWriter(file_name, image) as archive:
+                for new_image in new_images[:10]:
+                    archive.add(new_image)
+            with ImageArchiveWriter(file_name, BitImage.from_image(image)) as archive:
+                for new_image in new_images[10:]:
+                    archive.add_flipped(BitImage.from_image(new_image).diff(BitImage.from_image(image)))
+
+            archive = ImageArchive(file_name)
+            assert len(archive) == len(new_images), "Wrong number of images in the archive"
+            for k in [0, 9, 10, len(new_images) - 1]:
+                assert archive[k] == render_image(image, new_images[k]), "Wrong image read back"
+
+    def test_main_reads_dataset(self) -> None:
+        """
+        Verify main generates the same images from a packed dataset as from the image files, and nothing from an empty
+        dataset.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            dataset_file = os.path.join(directory, "digits.gaid")
+            Dataset.from_files(["image.txt"]).save(dataset_file)
+            with redirect_stdout(io.StringIO()):
+                main(["image.txt", "--budget", "1", "--output-dir", os.path.join(directory, "files")])
+                main(["--dataset", dataset_file, "--budget", "1", "--output-dir", os.path.join(directory, "dataset")])
+
+            with open(os.path.join(directory, "files", "image_new_image_1.txt")) as f_files, open(
+                os.path.join(directory, "dataset", "image_new_image_1.txt")
+            ) as f_dataset:
+                assert f_files.read() == f_dataset.read(), "Images differ"
+
+            # an empty dataset has no inputs, rather than falling back to image.txt
+            empty_file = os.path.join(directory, "empty.gaid")
+            Dataset([], 0, 0, b"").save(empty_file)
+            output = io.StringIO()
+            with redirect_stdout(output):
+                status = main(["--dataset", empty_file, "--output-dir", os.path.join(directory, "empty")])
+            assert status == 0 and "0 from 0 inputs" in output.getvalue(), "Empty dataset was not handled"
+            assert os.listdir(os.path.join(directory, "empty")) == [], "Images written for an empty dataset"
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+from __future__ import annotations
+import asyncio
+import json
+import unittest
+from service import GenerationService, load_test, serve
+from generative import generate_new_images
+from ai import Model, load_model, predict_number, read_image
+
+IMAGE_FILES = ["image.txt", "another_image.txt", "confusing_image.txt"]
+
+
+class TestService(unittest.IsolatedAsyncioTestCase):
+    """Unit tests for the module service.py"""
+
+    async def test_predict_is_batched(self) -> None:
+        """
+        Verify concurrent predict calls give the numbers of predict_number and are classified in fewer batches.
+        """
+        images = [read_image(file_name) for file_name in IMAGE_FILES] * 20
+        async with GenerationService(load_model(), max_pending=16, batch_size=8) as service:
+            numbers = await asyncio.gather(*(service.predict(image) for image in images))
+
+            assert numbers == [predict_number(image) for image in images], "Wrong numbers"
+            assert service.batches < len(images), "Calls were not batched"
+            assert service.peak_in_flight <= 16 and service.in_flight == 0, "More requests than max_pending at once"
+
+    async def test_bad_image_fails_alone(self) -> None:
+        """
+        Verify an image of the wrong size or with other pixels than 0 and 1 fails its own predict or generate call alone.
+        """
+        image = read_image("image.txt")
+        async with GenerationService(load_model()) as service:
+            for bad_image in [[[1, 0]], [row[:] for row in image[:-1]] + [[2] * 28], [["1"] * 28] * 28]:
+                results = await asyncio.gather(
+                    service.predict(image), service.predict(bad_image), service.predict(image), return_exceptions=True
+                )
+                assert results[0] == results[2] == predict_number(image), "Good images failed with a bad one"
+                assert isinstance(results[1], ValueError), "Bad image was classified"
+                results = await asyncio.gather(
+                    service.generate(image, 1), service.generate(bad_image, 1), return_exceptions=True
+                )
+                assert results[0] == generate_new_images(image, 1), "Good image failed with a bad one"
+                assert isinstance(results[1], ValueError), "Bad image was generated from"
+                assert service.in_flight == 0, "Bad image took a slot"
+
+            # an input failing inside the batch only fails its caller
+            loop = asyncio.get_running_loop()
+            futures = [loop.create_future() for _ in range(3)]
+            x = [pixel for row in image for pixel in row]
+            service._batch = [(x, futures[0]), (None, futures[1]), (x, futures[2])]
+            service._flush()
+            results = await asyncio.gather(*futures, return_exceptions=True)
+            assert results[0] == results[2] == predict_number(image), "Good images failed with a bad one"
+            assert isinstance(results[1], TypeError), "Bad input was classified"
+
+    async def test_generate_and_cancel(self) -> None:
+        """
+        Verify generate gives the images of generate_new_images, and a cancelled generation stops.
+        """
+        image = read_image("image.txt")
+        async with GenerationService(load_model()) as service:
+            assert await service.generate(image, 1) == generate_new_images(image, 1), "Images differ"
+            assert await service.generate(image, 2, limit=5) == generate_new_images(image, 2)[:5], "Limit ignored"
+
+            task = asyncio.create_task(service.generate(image, 3))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            # the thread notices the cancellation, so the next request does not wait for a whole budget 3 run
+            number = await asyncio.wait_for(service.predict(image), 5)
+            assert number == predict_number(image), "Wrong number after a cancellation"
+            assert service.in_flight == 0, "Cancelled request still counted"
+
+    async def test_cancel_stops_between_candidates(self) -> None:
+        """
+        Verify a cancelled generation stops even when no candidate keeps the number, and holds its slot until then.
+        """
+        image = read_image("image.txt")
+        x = [pixel for row in image for pixel in row]
+        # every flipped pixel raises the score of number 1 by one, past the score of number 0
+        model = Model([[[0.0] * len(x), [-1.0 if pixel else 1.0 for pixel in x]]], [[0.0, sum(x) - 0.5]])
+        async with GenerationService(model, max_workers=1) as service:
+            task = asyncio.create_task(service.generate(image, 4))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            assert await asyncio.wait_for(service.predict(image), 2) == 0, "Wrong number after a cancellation"
+            assert service.in_flight == 0, "Slot was not freed"
+
+    async def test_server_round_trip(self) -> None:
+        """
+        Verify the server answers predict, generate and malformed requests, and the load test gets every answer.
+        """
+        images = [read_image(file_name) for file_name in IMAGE_FILES]
+        async with GenerationService(load_model()) as service:
+            server = await serve(service)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=2**24)
+                for request in [
+                    {"id": 1, "op": "predict", "image": images[0]},
+                    {"id": 2, "op": "generate", "image": images[0], "budget": 1, "limit": 3},
+                    {"id": 3, "op": "explain"},
+                ]:
+                    writer.write(json.dumps(request).encode() + b"\n")
+                await writer.drain()
+                responses = {}
+                for _ in range(3):
+                    response = json.loads(await reader.readline())
+                    responses[response["id"]] = response
+                writer.close()
+                await writer.wait_closed()
+
+                assert responses[1]["number"] == predict_number(images[0]), "Wrong number"
+                assert responses[2]["images"] == generate_new_images(images[0], 1)[:3], "Wrong images"
+                assert "error" in responses[3], "Unknown op was not reported"
+
+                result = await load_test("127.0.0.1", port, images, requests=60, concurrency=10)
+                assert result["answers"] == [predict_number(images[k % 3]) for k in range(60)], "Wrong answers"
+
+
+if __name__ == "__main__":
+    unittest.main()